@@ -1,22 +1,19 @@
+import os
+import signal
 import subprocess
 import shlex
 from .utils_cp import *
 from .dat_to_dzn import *
+from Heuristic.Heuristic_handler import timed_initial_solution
 import time
 
 
-def run_minizinc(model_name, instance_number, solver_name, time_limit=300):
-    if instance_number == 0:
-        #Solve all instances from inst01 to inst21
-        for i in range(1, 22):
-            run_minizinc(model_name, i, solver_name, time_limit)
-        return
-    
+def prepare_command(model_name, instance_number, solver_name, time_limit, initial=None):
     project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
     in_file_path = os.path.join(project_root, 'Instances')
     out_file_path = os.path.join(os.path.dirname(__file__), 'data')
     start_time = time.perf_counter()
-    data_to_dzn(in_file_path, out_file_path, instance_number)
+    data_to_dzn(in_file_path, out_file_path, instance_number, initial)
     end_time = time.perf_counter()
     execution_time_ms = (end_time - start_time) * 1000
     
@@ -24,7 +21,35 @@ def run_minizinc(model_name, instance_number, solver_name, time_limit=300):
     model_file = os.path.join("CP", f"{model_name}.mzn")
     data_file = os.path.join("CP", "data", f"inst{instance_number:02d}.dzn")
     time_limit_ms = (time_limit * 1000) - execution_time_ms
-    command = f"minizinc --solver {solver_name} --time-limit {time_limit_ms} {model_file} {data_file} -s -a"
+    command = minizinc_command(solver_name, time_limit_ms, model_file, data_file)
+    return model_file, data_file, command
+
+
+def minizinc_command(solver_name, time_limit_ms, model_file, data_file):
+    return f"minizinc --solver {solver_name} --time-limit {time_limit_ms} {model_file} {data_file} -s -a"
+
+
+def bounded_data_file(data_file, upper_bound):
+    #copy of the instance data with a tighter upper_bound, used to restart MiniZinc
+    with open(data_file, 'r') as f:
+        data = f.read()
+    data = re.sub(r"upper_bound = \d+;", f"upper_bound = {upper_bound};", data)
+    bounded_file = data_file.replace(".dzn", f"_bound_{os.getpid()}.dzn")
+    with open(bounded_file, 'w') as f:
+        f.write(data)
+    return bounded_file
+
+
+def run_minizinc(model_name, instance_number, solver_name, time_limit=300, save=True, warm_start=False):
+    if instance_number == 0:
+        #Solve all instances from inst01 to inst21
+        for i in range(1, 22):
+            run_minizinc(model_name, i, solver_name, time_limit, warm_start=warm_start)
+        return
+    
+    #start the search from the heuristic solution, the heuristic counts in the time of the instance
+    initial, past_time = timed_initial_solution(instance_number) if warm_start else (None, 0)
+    model_file, data_file, command = prepare_command(model_name, instance_number, solver_name, time_limit - past_time, initial)
 
     all_output = []  
 
@@ -67,7 +92,87 @@ def run_minizinc(model_name, instance_number, solver_name, time_limit=300):
     #print(all_output)
     desired_output = extract_latest_decision(full_output)
     print(desired_output)
-    print(save_solution(desired_output, instance_number, model_name, solver_name))
+    new_result = build_result(desired_output, model_name, solver_name)
+    if warm_start:
+        #the warm started results are kept apart from the ones started from scratch
+        new_result = {f"{key}_ws": dict(result, time=int(result["time"] + past_time) if result["optimal"] else 300)
+                      for key, result in new_result.items()}
+    if not save:
+        return new_result
+    save_result(new_result, instance_number)
+    print(new_result)
+
+    return
+
+
+def kill_group(process):
+    #minizinc runs the solver as a child process: the whole session is killed, not only the driver
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.kill()
+
+
+def cp_member(shared_list, model_name, instance_number, solver_name, time_limit=300, bound=None):
+    #run MiniZinc as a portfolio member: every intermediate solution is reported as soon as it is printed
+    start_time = time.perf_counter()
+    model_file, data_file, command = prepare_command(model_name, instance_number, solver_name, time_limit)
+    last = None
+    optimal = False
+    bounded_file = None
+
+    while True:
+        process = subprocess.Popen(
+            shlex.split(command),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            start_new_session=hasattr(os, "setsid")
+        )
+        watcher = None
+        if bound is not None:
+            #MiniZinc cannot take a new bound while searching: stop it and restart from the shared bound
+            watcher = bound.watch(lambda: kill_group(process))
+
+        block = []
+        unsat = False
+        for line in iter(process.stdout.readline, ''):
+            line = line.strip()
+            if line == "----------":
+                desired_output = "\n".join(block)
+                sol_list = routes_from_output(desired_output)
+                obj_match = re.search(r"obj\s*=\s*(\d+);", desired_output)
+                if sol_list != None and obj_match:
+                    last = (int(time.perf_counter() - start_time), False, int(obj_match.group(1)), sol_list)
+                    shared_list.append(last)
+                    if bound is not None:
+                        bound.offer(last[2])
+                block = []
+            elif line == "==========":
+                optimal = True
+            elif line == "=====UNSATISFIABLE=====":
+                unsat = True
+            else:
+                block.append(line)
+        process.wait()
+        if watcher is not None:
+            watcher.set()
 
-    return 
+        if bound is not None and (optimal or unsat):
+            bound.prove()
+        remaining = time_limit - (time.perf_counter() - start_time)
+        if bound is None or process.returncode >= 0 or remaining < 1:
+            break
+        #killed by the watcher: restart looking only for solutions better than the shared incumbent
+        bounded_file = bounded_data_file(data_file, bound.consume() - 1)
+        command = minizinc_command(solver_name, remaining * 1000, model_file, bounded_file)
 
+    if bounded_file is not None:
+        os.remove(bounded_file)
+    if last is None:
+        shared_list.append((int(time.perf_counter() - start_time), False, "N/A", []))
+    else:
+        shared_list.append((int(time.perf_counter() - start_time), optimal, last[2], last[3]))
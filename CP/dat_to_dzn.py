@@ -1,6 +1,7 @@
 import os
 import argparse
 from utils import calculate_upper_bound, calculate_lower_bound
+from symmetry import Symmetry
 
 def read_dat_file(file_path):
     with open(file_path, 'r') as f:
@@ -12,8 +13,20 @@ def read_dat_file(file_path):
         D = [[int(p) for p in line.split()] for line in lines[4:]]
     return m, n, L, S, D
 
-def write_dzn_file(file_path, m, n, l, s, D, upper_bound, lower_bound):
-    with open(file_path, 'w') as f:
+def warm_start_successor(m, n, sol):
+    #successor array of the giant tour (items, then start nodes, then end nodes) of a route set
+    successor = [0] * (n + 2 * m)
+    for k, route in enumerate(sol):
+        nodes = [n + k + 1] + list(route) + [n + m + k + 1]
+        for i, j in zip(nodes, nodes[1:]):
+            successor[i - 1] = j
+        successor[n + m + k] = n + k + 2 if k < m - 1 else n + 1
+    return successor
+
+def write_dzn_file(file_path, m, n, l, s, D, upper_bound, lower_bound, initial=None):
+    #write to a temporary file first so that concurrent runs never read a half-written .dzn
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
         f.write(f'm = {m};\n')
         f.write(f'n = {n};\n')
         f.write(f'L = {l};\n')
@@ -25,8 +38,17 @@ def write_dzn_file(file_path, m, n, l, s, D, upper_bound, lower_bound):
         f.write(f'|];\n')
         f.write(f'upper_bound = {upper_bound};\n')
         f.write(f'lower_bound = {lower_bound};\n')
+        #starting solution for the warm_start annotation, empty when there is none
+        ws_successor = warm_start_successor(m, n, initial["sol"]) if initial is not None else []
+        f.write(f'ws_successor = {ws_successor};\n')
+        #symmetry-breaking directives, couriers numbered from 1
+        symmetry = Symmetry(m, n, l, s, D)
+        for name, pairs in [("sym_interchangeable", symmetry.interchangeable), ("sym_dominated", symmetry.dominated)]:
+            couriers = [i + 1 for pair in symmetry.couriers(pairs) for i in pair]
+            f.write(f'{name} = array2d(1..{len(pairs)}, 1..2, {couriers});\n')
+    os.replace(tmp_path, file_path)
 
-def data_to_dzn(in_file_path, out_file_path, selected_num=0):
+def data_to_dzn(in_file_path, out_file_path, selected_num=0, initial=None):
     
     os.makedirs(out_file_path, exist_ok=True)
 
@@ -45,7 +67,10 @@ def data_to_dzn(in_file_path, out_file_path, selected_num=0):
         m, n, L, S, D = read_dat_file(dat_file)
         upper_bound = calculate_upper_bound(m, n, L, S, D)
         lower_bound = calculate_lower_bound(n, D)
-        write_dzn_file(dzn_file, m, n, L, S, D, upper_bound, lower_bound)
+        if initial is not None:
+            #the warm start is already a solution: nothing worse is needed
+            upper_bound = min(upper_bound, initial["obj"])
+        write_dzn_file(dzn_file, m, n, L, S, D, upper_bound, lower_bound, initial)
     else:
         #Process all 
         files = os.listdir(in_file_path)
@@ -95,24 +95,35 @@ def process_route_ms(successor, predecessor, route_m):
         return None
 
 def save_solution(desired_output, instance_number, model_name, solver_name):
+    new_result = build_result(desired_output, model_name, solver_name)
+    save_result(new_result, instance_number)
+    return new_result
+
+def routes_from_output(desired_output):
+    #parse the solution
+    successor, predecessor, route_m = parse_solution(desired_output)
+    sorted_paths = process_route_ms(successor, predecessor, route_m)
+
+    if sorted_paths == None:
+        return None
+
+    #remove the first and last items from each courier's path
+    processed_sol = {}
+    for courier, path in sorted_paths.items():
+        if len(path) > 2:
+            processed_sol[courier] = path[1:-1]
+        else:
+            #if path has 2 or fewer nodes, removing first and last results in empty list
+            processed_sol[courier] = []
+
+    #prepare the solution in the required format
+    return [processed_sol[courier] for courier in sorted(processed_sol.keys())]
+
+def build_result(desired_output, model_name, solver_name):
     try:
-        #parse the solution
-        successor, predecessor, route_m = parse_solution(desired_output)
-        sorted_paths = process_route_ms(successor, predecessor, route_m)
+        sol_list = routes_from_output(desired_output)
         
-        if  sorted_paths != None:
-            
-            #remove the first and last items from each courier's path
-            processed_sol = {}
-            for courier, path in sorted_paths.items():
-                if len(path) > 2:
-                    processed_sol[courier] = path[1:-1]
-                else:
-                    #if path has 2 or fewer nodes, removing first and last results in empty list
-                    processed_sol[courier] = []
-
-            #prepare the solution in the required format
-            sol_list = [processed_sol[courier] for courier in sorted(processed_sol.keys())]
+        if  sol_list != None:
 
             # Try to match initTime, solveTime, obj, and optimal
             init_time_match = re.search(r"%%%mzn-stat:\s*initTime=([\d.]+)", desired_output)
@@ -177,7 +188,9 @@ def save_solution(desired_output, instance_number, model_name, solver_name):
                 "sol": []
             }
         }
+    return new_result
 
+def save_result(new_result, instance_number):
    #get the parent directory of the script's location
     parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -204,6 +217,3 @@ def save_solution(desired_output, instance_number, model_name, solver_name):
     #save the updated data back to JSON file
     with open(json_file, "w") as f:
         json.dump(data, f, indent=4)
-
-
-    return new_result
@@ -0,0 +1,71 @@
+import os
+import json
+import numpy as np
+from time import time
+
+from utils import calculate_lower_bound
+from CP.dat_to_dzn import read_dat_file
+from Heuristic.Heuristic_model import solve_heuristic, route_length
+
+
+def read_instance(num_instance):
+    return read_dat_file(os.path.join(".", "Instances", f"inst{num_instance:02d}.dat"))
+
+
+def heuristic_solution(num_instance, time_limit=5):
+    m, n, L, S, D = read_instance(num_instance)
+    lower_bound = calculate_lower_bound(n, D)
+
+    start_time = time()
+    routes = solve_heuristic(m, n, L, S, D, time_limit=time_limit, lower_bound=lower_bound)
+    elapsed = time() - start_time
+
+    if routes is None:
+        return {"time": 300, "optimal": False, "obj": "N/A", "sol": []}
+
+    obj = max(route_length(route, np.array(D)) for route in routes)
+    # the heuristic can only prove optimality when it reaches the lower bound
+    optimal = obj <= lower_bound
+    return {
+        "time": int(elapsed) if optimal else 300,
+        "optimal": optimal,
+        "obj": obj,
+        "sol": [[int(j) + 1 for j in route] for route in routes]
+    }
+
+
+def initial_solution(num_instance, time_limit=1):
+    # route set of a short heuristic run, used to warm start the exact approaches, None if there is none;
+    # the results of previous runs are not used, so that a run does not depend on what res/ holds
+    m, n, L, S, D = read_instance(num_instance)
+    routes = solve_heuristic(m, n, L, S, D, time_limit=time_limit, lower_bound=calculate_lower_bound(n, D))
+    if routes is None:
+        return None
+    obj = max(route_length(route, np.array(D)) for route in routes)
+    print(f"Warm start from the heuristic solution with objective {obj}")
+    return {"obj": obj, "sol": [[int(j) + 1 for j in route] for route in routes]}
+
+
+def timed_initial_solution(num_instance, time_limit=1):
+    # the warm start and the seconds it took, which the exact approaches count in their own time
+    start_time = time()
+    initial = initial_solution(num_instance, time_limit)
+    return initial, time() - start_time
+
+
+def run_heuristic(num_instance, time_limit=5):
+    if num_instance == 0:
+        instances = range(1, 22)
+    elif num_instance == -1:
+        instances = range(1, 11)
+    else:
+        instances = range(num_instance, num_instance + 1)
+
+    output_dir = os.path.join("res", "Heuristic")
+    os.makedirs(output_dir, exist_ok=True)
+    for i in instances:
+        print(f"=============================== INSTANCE : {i}  ===============================")
+        result = heuristic_solution(i, time_limit)
+        print(f"obj: {result['obj']}")
+        with open(os.path.join(output_dir, f"{i}.json"), "w") as f:
+            json.dump({"heuristic": result}, f, indent=4)
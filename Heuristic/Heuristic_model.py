@@ -0,0 +1,333 @@
+import numpy as np
+from time import time
+
+INF = np.iinfo(np.int64).max // 4
+
+
+def full_route(route, depot):
+    # route with the depot at both ends
+    return np.array([depot] + list(route) + [depot], dtype=np.int64)
+
+
+def route_length(route, D):
+    r = full_route(route, len(D) - 1)
+    return int(D[r[:-1], r[1:]].sum())
+
+
+def insertion_costs(route, D, n):
+    # cheapest insertion cost of every item in route, and the position where it is reached
+    r = full_route(route, n)
+    prev, nxt = r[:-1], r[1:]
+    delta = D[prev][:, :n] + D[:n, nxt].T - D[prev, nxt][:, None]
+    best = delta.argmin(axis=0)
+    return delta[best, np.arange(n)], best
+
+
+def regret_insertion(routes, unassigned, L, S, D):
+    # insert the unassigned items one at a time, always taking the item with the largest regret
+    # between its best and second best courier, where a courier is scored by its length after insertion
+    m = len(routes)
+    n = len(S)
+    lengths = np.array([route_length(r, D) for r in routes], dtype=np.int64)
+    loads = np.array([S[r].sum() if r else 0 for r in routes], dtype=np.int64)
+    cost = np.zeros((m, n), dtype=np.int64)
+    pos = np.zeros((m, n), dtype=np.int64)
+    for k in range(m):
+        cost[k], pos[k] = insertion_costs(routes[k], D, n)
+
+    unassigned = unassigned.copy()
+    while unassigned.any():
+        J = np.flatnonzero(unassigned)
+        new_len = lengths[:, None] + cost[:, J]
+        feasible = loads[:, None] + S[J][None, :] <= L[:, None]
+        new_len = np.where(feasible, new_len, INF)
+        if (new_len == INF).all(axis=0).any():
+            return None
+
+        if m > 1:
+            two = np.partition(new_len, 1, axis=0)
+            regret = two[1] - two[0]
+        else:
+            regret = -new_len[0]
+        jj = int(np.argmax(regret))
+        j = int(J[jj])
+        k = int(np.argmin(new_len[:, jj]))
+
+        routes[k].insert(int(pos[k, j]), j)
+        lengths[k] += cost[k, j]
+        loads[k] += S[j]
+        unassigned[j] = False
+        cost[k], pos[k] = insertion_costs(routes[k], D, n)
+    return routes
+
+
+def pack_items(L, S, time_limit=1.0):
+    # assignment of the items to the couriers respecting the capacities: best fit decreasing,
+    # then a depth first search for the tight instances
+    m = len(L)
+    order = np.argsort(-S, kind="stable")
+    free = L.copy()
+    assignment = np.full(len(S), -1)
+    for j in order:
+        fits = np.flatnonzero(free >= S[j])
+        if len(fits) == 0:
+            break
+        k = fits[np.argmin(free[fits])]
+        assignment[j] = k
+        free[k] -= S[j]
+    else:
+        return assignment
+
+    deadline = time() + time_limit
+    free = L.copy()
+    assignment = np.full(len(S), -1)
+
+    def place(t):
+        if t == len(order):
+            return True
+        if time() > deadline:
+            return False
+        j = order[t]
+        tried = set()
+        for k in range(m):
+            if free[k] >= S[j] and free[k] not in tried:
+                tried.add(free[k])
+                free[k] -= S[j]
+                assignment[j] = k
+                if place(t + 1):
+                    return True
+                free[k] += S[j]
+        return False
+
+    return assignment if place(0) else None
+
+
+def construct(m, n, L, S, D):
+    routes = [[] for _ in range(m)]
+    unassigned = np.ones(n, dtype=bool)
+
+    # seed every courier, biggest capacity first, with the farthest item from the depot that fits
+    far = np.argsort(-(D[n, :n] + D[:n, n]), kind="stable")
+    for k in np.argsort(-L, kind="stable"):
+        for j in far:
+            if unassigned[j] and S[j] <= L[k]:
+                routes[k].append(int(j))
+                unassigned[j] = False
+                break
+
+    result = regret_insertion(routes, unassigned, L, S, D)
+    if result is not None:
+        return result
+
+    # capacities too tight for the greedy insertion: fix the assignment first, then build each route
+    assignment = pack_items(L, S)
+    if assignment is None:
+        return None
+    routes = []
+    for k in range(m):
+        items = np.flatnonzero(assignment == k)
+        route = []
+        for j in items:
+            cost, pos = insertion_costs(route, D, n)
+            route.insert(int(pos[j]), int(j))
+        routes.append(route)
+    return routes
+
+
+class Solution:
+    # routes with their lengths and loads, kept up to date by the moves
+
+    def __init__(self, routes, L, S, D):
+        self.routes = [list(r) for r in routes]
+        self.L = L
+        self.S = S
+        self.D = D
+        self.n = len(S)
+        self.lengths = np.array([route_length(r, D) for r in self.routes], dtype=np.int64)
+        self.loads = np.array([S[r].sum() if r else 0 for r in self.routes], dtype=np.int64)
+
+    def key(self):
+        # min-max objective, total length to break ties
+        return int(self.lengths.max()), int(self.lengths.sum())
+
+    def others_max(self, excluded):
+        mask = np.ones(len(self.routes), dtype=bool)
+        mask[list(excluded)] = False
+        return int(self.lengths[mask].max()) if mask.any() else 0
+
+    def set_route(self, k, route):
+        self.routes[k] = list(route)
+        self.lengths[k] = route_length(route, self.D)
+        self.loads[k] = self.S[route].sum() if route else 0
+
+    def copy(self):
+        return Solution(self.routes, self.L, self.S, self.D)
+
+
+def two_opt(sol):
+    # best segment reversal of every route, with prefix sums for the asymmetric distances
+    improved = False
+    D = sol.D
+    for k, route in enumerate(sol.routes):
+        if len(route) < 2:
+            continue
+        r = full_route(route, sol.n)
+        fwd = np.concatenate(([0], np.cumsum(D[r[:-1], r[1:]])))
+        bwd = np.concatenate(([0], np.cumsum(D[r[1:], r[:-1]])))
+        i, j = np.triu_indices(len(r) - 1, k=1)
+        valid = (i >= 1) & (j <= len(r) - 2)
+        i, j = i[valid], j[valid]
+        # reverse r[i..j]
+        delta = (D[r[i - 1], r[j]] + D[r[i], r[j + 1]] - D[r[i - 1], r[i]] - D[r[j], r[j + 1]]
+                 + (bwd[j] - bwd[i]) - (fwd[j] - fwd[i]))
+        if len(delta) and delta.min() < 0:
+            b = int(np.argmin(delta))
+            new = list(r[1:-1])
+            a, c = i[b] - 1, j[b] - 1
+            new[a:c + 1] = new[a:c + 1][::-1]
+            sol.set_route(k, [int(v) for v in new])
+            improved = True
+    return improved
+
+
+def relocate(sol, max_segment=3):
+    # move a segment of 1..max_segment items (or-opt, plain relocate for 1) out of the longest route
+    # into the position of another route that gives the best (max, sum) objective
+    D, S = sol.D, sol.S
+    current = sol.key()
+    k = int(np.argmax(sol.lengths))
+    r = full_route(sol.routes[k], sol.n)
+    best = None
+    for seg in range(1, max_segment + 1):
+        starts = np.arange(1, len(r) - seg)
+        if len(starts) == 0:
+            break
+        ends = starts + seg - 1
+        internal = np.array([D[r[s:e], r[s + 1:e + 1]].sum() for s, e in zip(starts, ends)], dtype=np.int64)
+        removal = D[r[starts - 1], r[starts]] + internal + D[r[ends], r[ends + 1]] - D[r[starts - 1], r[ends + 1]]
+        seg_load = np.array([S[r[s:e + 1]].sum() for s, e in zip(starts, ends)], dtype=np.int64)
+        new_k = sol.lengths[k] - removal
+        for l in range(len(sol.routes)):
+            if l == k:
+                continue
+            q = full_route(sol.routes[l], sol.n)
+            c, d = q[:-1], q[1:]
+            insert = D[c][:, r[starts]].T + internal[:, None] + D[r[ends]][:, d] - D[c, d][None, :]
+            new_l = sol.lengths[l] + insert
+            feasible = (sol.loads[l] + seg_load <= sol.L[l])[:, None]
+            rest = sol.others_max((k, l))
+            new_max = np.maximum(np.maximum(new_k[:, None], new_l), rest)
+            new_sum = current[1] - removal[:, None] + insert
+            score = np.where(feasible, new_max * (current[1] + 1) + new_sum, INF)
+            b = np.unravel_index(int(np.argmin(score)), score.shape)
+            if best is None or score[b] < best[0]:
+                best = (score[b], seg, int(starts[b[0]]), l, int(b[1]))
+    if best is None or best[0] >= current[0] * (current[1] + 1) + current[1]:
+        return False
+    _, seg, s, l, p = best
+    segment = [int(v) for v in r[s:s + seg]]
+    route_k = [int(v) for v in np.concatenate((r[1:s], r[s + seg:-1]))]
+    route_l = list(sol.routes[l])
+    route_l[p:p] = segment
+    sol.set_route(k, route_k)
+    sol.set_route(l, route_l)
+    return True
+
+
+def swap(sol):
+    # exchange an item of the longest route with an item of another route
+    D, S = sol.D, sol.S
+    current = sol.key()
+    k = int(np.argmax(sol.lengths))
+    r = full_route(sol.routes[k], sol.n)
+    i = np.arange(1, len(r) - 1)
+    if len(i) == 0:
+        return False
+    a, x, b = r[i - 1], r[i], r[i + 1]
+    best = None
+    for l in range(len(sol.routes)):
+        if l == k or not sol.routes[l]:
+            continue
+        q = full_route(sol.routes[l], sol.n)
+        j = np.arange(1, len(q) - 1)
+        c, y, d = q[j - 1], q[j], q[j + 1]
+        new_k = sol.lengths[k] + (D[a][:, y] + D[y][:, b].T - (D[a, x] + D[x, b])[:, None])
+        new_l = sol.lengths[l] + (D[c][:, x].T + D[x][:, d] - (D[c, y] + D[y, d])[None, :])
+        feasible = ((sol.loads[k] - S[x][:, None] + S[y][None, :] <= sol.L[k])
+                    & (sol.loads[l] - S[y][None, :] + S[x][:, None] <= sol.L[l]))
+        rest = sol.others_max((k, l))
+        new_max = np.maximum(np.maximum(new_k, new_l), rest)
+        new_sum = current[1] - sol.lengths[k] - sol.lengths[l] + new_k + new_l
+        score = np.where(feasible, new_max * (current[1] + 1) + new_sum, INF)
+        bi = np.unravel_index(int(np.argmin(score)), score.shape)
+        if best is None or score[bi] < best[0]:
+            best = (score[bi], l, int(bi[0]), int(bi[1]))
+    if best is None or best[0] >= current[0] * (current[1] + 1) + current[1]:
+        return False
+    _, l, p, q = best
+    route_k, route_l = list(sol.routes[k]), list(sol.routes[l])
+    route_k[p], route_l[q] = route_l[q], route_k[p]
+    sol.set_route(k, route_k)
+    sol.set_route(l, route_l)
+    return True
+
+
+def local_search(sol, deadline):
+    while time() < deadline:
+        if two_opt(sol):
+            continue
+        if relocate(sol):
+            continue
+        if swap(sol):
+            continue
+        break
+    return sol
+
+
+def perturb(sol, rng, size):
+    # ruin and recreate: remove a few items of the longest route and of another random route
+    # and insert them back with the regret insertion
+    m = len(sol.routes)
+    k = int(np.argmax(sol.lengths))
+    picked = [k] if m == 1 else [k, int(rng.choice([l for l in range(m) if l != k]))]
+    routes = [list(r) for r in sol.routes]
+    unassigned = np.zeros(sol.n, dtype=bool)
+    for l in picked:
+        if not routes[l]:
+            continue
+        removed = rng.choice(routes[l], size=min(size, len(routes[l])), replace=False)
+        unassigned[removed] = True
+        routes[l] = [v for v in routes[l] if not unassigned[v]]
+    routes = regret_insertion(routes, unassigned, sol.L, sol.S, sol.D)
+    if routes is None:
+        return None
+    return Solution(routes, sol.L, sol.S, sol.D)
+
+
+def solve_heuristic(m, n, L, S, D, time_limit=5, lower_bound=0, seed=42):
+    # construction followed by an iterated local search on the min-max objective,
+    # returns the routes (0-based items) of the best solution found
+    deadline = time() + time_limit
+    L = np.array(L, dtype=np.int64)
+    S = np.array(S, dtype=np.int64)
+    D = np.array(D, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    routes = construct(m, n, L, S, D)
+    if routes is None:
+        return None
+    best = local_search(Solution(routes, L, S, D), deadline)
+    current = best.copy()
+    while time() < deadline and best.key()[0] > lower_bound:
+        candidate = perturb(current, rng, size=int(rng.integers(1, 4)))
+        if candidate is None:
+            continue
+        candidate = local_search(candidate, deadline)
+        # accept sideways and, once in a while, worse moves to escape the local optima of the min-max objective
+        if candidate.key() <= current.key() or rng.random() < 0.1:
+            current = candidate
+            if current.key() < best.key():
+                best = current.copy()
+        elif rng.random() < 0.05:
+            current = best.copy()
+    return best.routes
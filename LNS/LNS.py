@@ -0,0 +1,187 @@
+import os
+import json
+import shlex
+import shutil
+import subprocess
+import numpy as np
+from time import time
+from pulp import LpSolutionOptimal, LpSolutionIntegerFeasible
+
+from utils import calculate_lower_bound
+from Heuristic.Heuristic_handler import read_instance
+from Heuristic.Heuristic_model import solve_heuristic, route_length
+from MIP.MIP import make_solver, extract_routes
+from MIP.MIP_model import solve_mip
+from CP.cp_solver import minizinc_command
+from CP.dat_to_dzn import write_dzn_file
+from CP.utils_cp import extract_latest_decision, build_result
+
+# (engine, solver) pairs run by "solver.py -a LNS"
+lns_configurations = [
+    ("MIP", "HiGHS"),
+    ("CP", "gecode"),
+]
+
+
+def neighbourhood(routes, lengths, D, rng, size, kind, max_items):
+    # couriers whose routes are re-optimized: always one of the longest routes, plus either random
+    # couriers ("routes") or the couriers serving the items closest to one of its items ("cluster"),
+    # as long as the sub-instance stays within max_items items
+    m = len(routes)
+    n = len(D) - 1
+    longest = int(rng.choice(np.flatnonzero(lengths == lengths.max())))
+    couriers = [longest]
+    if kind == "cluster" and routes[longest]:
+        owner = np.empty(n, dtype=int)
+        for k, route in enumerate(routes):
+            owner[np.array(route, dtype=int) - 1] = k
+        seed = int(rng.choice(routes[longest])) - 1
+        candidates = list(dict.fromkeys(int(owner[j]) for j in np.argsort(D[seed, :n] + D[:n, seed], kind="stable")))
+    else:
+        candidates = [int(k) for k in rng.permutation(m)]
+    items = len(routes[longest])
+    for k in candidates:
+        if len(couriers) == size:
+            break
+        if k not in couriers and items + len(routes[k]) <= max_items:
+            couriers.append(k)
+            items += len(routes[k])
+    return couriers
+
+
+def sub_instance(routes, couriers, L, S, D):
+    # instance made of the given couriers and the items they serve, with the map to the original items
+    items = [j - 1 for k in couriers for j in routes[k]]
+    nodes = items + [len(D) - 1]
+    sub_D = D[np.ix_(nodes, nodes)]
+    sub_routes = []
+    position = {j: i for i, j in enumerate(items)}
+    for k in couriers:
+        sub_routes.append([position[j - 1] + 1 for j in routes[k]])
+    return (len(couriers), len(items), [int(L[k]) for k in couriers], [int(S[j]) for j in items],
+            sub_D.tolist()), items, sub_routes
+
+
+def solve_mip_slice(sub, sub_routes, obj, time_limit, solver_name):
+    m, n, L, S, D = sub
+    model, x, max_distance = solve_mip(m, n, L, S, D, {"obj": obj, "sol": sub_routes})
+    model.solve(make_solver(solver_name, time_limit, warm_start=True))
+    if model.sol_status not in (LpSolutionOptimal, LpSolutionIntegerFeasible):
+        return None, False
+    return extract_routes(m, n, x), model.sol_status == LpSolutionOptimal
+
+
+def solve_cp_slice(sub, sub_routes, obj, time_limit, solver_name):
+    m, n, L, S, D = sub
+    data_file = os.path.join("CP", "data", f"lns_{os.getpid()}.dzn")
+    write_dzn_file(data_file, m, n, L, S, D, obj, calculate_lower_bound(n, D), {"obj": obj, "sol": sub_routes})
+    model_file = os.path.join("CP", "CPF_sym.mzn")
+    command = minizinc_command(solver_name, time_limit * 1000, model_file, data_file)
+    try:
+        output = subprocess.run(shlex.split(command), capture_output=True, text=True, timeout=time_limit + 10).stdout
+    except subprocess.TimeoutExpired:
+        return None, False
+    finally:
+        os.remove(data_file)
+    result = next(iter(build_result(extract_latest_decision(output), "CPF_sym", solver_name).values()))
+    if not isinstance(result["obj"], int) or len(result["sol"]) != m:
+        return None, False
+    return result["sol"], result["optimal"]
+
+
+def lns(num_instance, engine="MIP", solver_name="HiGHS", time_limit=300, slice_time=10, max_items=25, seed=42,
+        heuristic_time=1):
+    start_time = time()
+    m, n, L, S, D = read_instance(num_instance)
+    L, S, D = np.array(L), np.array(S), np.array(D)
+    lower_bound = int(calculate_lower_bound(n, D))
+    rng = np.random.default_rng(seed)
+
+    # the starting routes come from the heuristic, within the time of the run
+    initial = solve_heuristic(m, n, L, S, D, time_limit=min(heuristic_time, time_limit), lower_bound=lower_bound, seed=seed)
+    if initial is None:
+        return {"time": time_limit, "optimal": False, "obj": "N/A", "sol": []}
+    routes = [[int(j) + 1 for j in route] for route in initial]
+    lengths = np.array([route_length([j - 1 for j in route], D) for route in routes])
+    print(f"LNS starts from objective {lengths.max()}")
+
+    # neighbourhoods (as their routes) already solved to optimality, nothing to gain there
+    solved = set()
+    iteration = 0
+    skipped = 0
+    while lengths.max() > lower_bound and skipped < 100:
+        remaining = time_limit - (time() - start_time)
+        if remaining < 1:
+            break
+        # from a single route (a TSP on its items) up to three routes at a time
+        size = 1 + iteration % 3
+        kind = "cluster" if iteration % 2 else "routes"
+        iteration += 1
+        couriers = neighbourhood(routes, lengths, D, rng, min(size, m), kind, max_items)
+        if engine == "CP":
+            # CPF_sym needs at least one item on every route
+            couriers = [k for k in couriers if routes[k]]
+        key = frozenset((int(L[k]), tuple(routes[k])) for k in couriers)
+        if key in solved:
+            skipped += 1
+            continue
+        skipped = 0
+        sub, items, sub_routes = sub_instance(routes, couriers, L, S, D)
+        old = (int(lengths[couriers].max()), int(lengths[couriers].sum()))
+
+        slice_limit = int(min(slice_time, remaining))
+        if engine == "MIP":
+            new_routes, proved = solve_mip_slice(sub, sub_routes, old[0], slice_limit, solver_name)
+        else:
+            new_routes, proved = solve_cp_slice(sub, sub_routes, old[0], slice_limit, solver_name)
+        if new_routes is None:
+            continue
+
+        # back to the original items, the fixed routes are untouched
+        new_routes = [[items[j - 1] + 1 for j in route] for route in new_routes]
+        new_lengths = np.array([route_length([j - 1 for j in route], D) for route in new_routes])
+        loads_ok = all(S[np.array(route, dtype=int) - 1].sum() <= L[k] for k, route in zip(couriers, new_routes))
+        if not loads_ok or (int(new_lengths.max()), int(new_lengths.sum())) >= old:
+            if proved:
+                solved.add(key)
+            continue
+        for k, route, length in zip(couriers, new_routes, new_lengths):
+            routes[k] = route
+            lengths[k] = length
+        if proved:
+            solved.add(frozenset((int(L[k]), tuple(routes[k])) for k in couriers))
+        print(f"{time() - start_time:.1f}s: {kind} neighbourhood {couriers} improved the objective to {lengths.max()}")
+
+    obj = int(lengths.max())
+    # like the heuristic, optimality is only known when the lower bound is reached
+    optimal = obj <= lower_bound
+    return {
+        "time": int(time() - start_time) if optimal else time_limit,
+        "optimal": optimal,
+        "obj": obj,
+        "sol": routes
+    }
+
+
+def run_lns(num_instance, time_limit=300):
+    if num_instance == 0:
+        instances = range(1, 22)
+    elif num_instance == -1:
+        instances = range(1, 11)
+    else:
+        instances = range(num_instance, num_instance + 1)
+
+    output_dir = os.path.join("res", "LNS")
+    os.makedirs(output_dir, exist_ok=True)
+    for i in instances:
+        print(f"=============================== INSTANCE : {i}  ===============================")
+        json_dict = {}
+        for engine, solver_name in lns_configurations:
+            if engine == "CP" and shutil.which("minizinc") is None:
+                print("MiniZinc not found, skipping the CP neighbourhoods")
+                continue
+            key = f"{engine}_{solver_name}"
+            json_dict[key] = lns(i, engine, solver_name, time_limit)
+            print(f"{key} obj: {json_dict[key]['obj']}")
+        with open(os.path.join(output_dir, f"{i}.json"), "w") as f:
+            json.dump(json_dict, f, indent=4)
@@ -4,7 +4,14 @@ import os
 import json
 import numpy as np
 import multiprocessing as mp
-from MIP.MIP_model import solve_mip
+from MIP.MIP_model import solve_mip, add_subtour_cuts
+from MIP.MIP_subtours import solution_subtours
+from MIP.MIP_colgen import solve_colgen_and_save
+from MIP.MIP_aggregated import solve_aggregated_and_save
+from MIP.MIP_cache import CACHED_SOLVERS, cached_model, routes_from_values, solve_cached_and_save
+from MIP.MIP_matrix import MATRIX_SOLVERS, matrix_available, solve_matrix_and_save
+from Heuristic.Heuristic_handler import timed_initial_solution
+from utils import calculate_lower_bound
 
 
 def read_mcp_instance(filename):
@@ -24,26 +31,34 @@ def read_mcp_instance(filename):
 def solve_model(model, m, n, x, max_distance, solver):
 
     model.solve(solver)
-    if model.status == 1:
-        routes = {}
-        for k in range(m):
-            route = []
-            current = n
-            while True:
-                next_point = None
-                for j in range(n+1):
-                    if value(x[k][current][j]) > 0.9:
-                        
-                        next_point = j
-                        break
-                if next_point is None or next_point == n:
+    return extract_solution(model, m, n, x, max_distance)
+
+
+def extract_routes(m, n, x):
+    # route of every courier (possibly empty), following the arcs from the depot
+    routes = []
+    for k in range(m):
+        route = []
+        current = n
+        while True:
+            next_point = None
+            for j in range(n+1):
+                if value(x[k][current][j]) > 0.9:
+                    
+                    next_point = j
                     break
-                else:
-                    route.append(next_point + 1)
-                    current = next_point
+            if next_point is None or next_point == n:
+                break
+            else:
+                route.append(next_point + 1)
+                current = next_point
+        routes.append(route)
+    return routes
+
 
-            if route:
-                routes[k] = route
+def extract_solution(model, m, n, x, max_distance):
+    if model.status == 1:
+        routes = {k: route for k, route in enumerate(extract_routes(m, n, x)) if route}
         return {
             'time': int(model.solutionTime),
             'optimal': True,
@@ -81,13 +96,126 @@ def save_solution_to_json(instance_name, solver_name, solution, output_folder="r
     print(f"Solution for {solver_name} saved to {output_file}")
 
 
-def solve_and_save(shared_list, m, n, L, S, D, solver):
-    model, x, max_distance = solve_mip(m, n, L, S, D)
-    solution = solve_model(model, m, n, x, max_distance, solver)
+def solve_and_save(shared_list, m, n, L, S, D, solver, bound=None, initial=None, sym_breaking=False, subtours="mtz"):
+    start_time = time.time()
+    if bound is not None:
+        # the shared bound is given to the solver on the cached MTZ model
+        solve_with_shared_bound(shared_list, m, n, L, S, D, solver.name, solver.timeLimit, bound, sym_breaking)
+        return
+    model, x, max_distance = solve_mip(m, n, L, S, D, initial, sym_breaking, subtours)
+    print(f"PuLP model built in {time.time() - start_time:.2f}s")
+    if subtours == "lazy":
+        solution = solve_lazy(model, m, n, x, max_distance, solver)
+    else:
+        solution = solve_model(model, m, n, x, max_distance, solver)
     shared_list.append((solution['time'], solution['optimal'], solution['obj'], solution['sol']))
-    
 
-def run_model(num_instance):
+
+def solve_with_shared_bound(shared_list, m, n, L, S, D, solver_name, time_limit, bound, sym_breaking=False):
+    # a single solve only looking for solutions better than the best objective shared by the other
+    # engines of the portfolio; it is stopped and restarted under the new bound only when another
+    # engine improves it
+    start_time = time.time()
+    model_file = cached_model(m, n, L, S, D, sym_breaking)
+    lower_bound = calculate_lower_bound(n, D)
+    while True:
+        remaining = time_limit - (time.time() - start_time)
+        if remaining < 1:
+            break
+        upper_bound = bound.consume() - 1
+        if upper_bound < lower_bound:
+            # the shared incumbent already reaches the lower bound
+            bound.prove()
+            break
+        status, values = CACHED_SOLVERS[solver_name](model_file, remaining, None, upper_bound,
+                                                     stop=lambda: bound.get() - 1 < upper_bound)
+        if status == "infeasible":
+            # nothing is better than the shared incumbent
+            bound.prove()
+            break
+        if values is not None:
+            obj = round(values["max_distance"])
+            bound.offer(obj)
+            shared_list.append((int(time.time() - start_time), status == "optimal", obj,
+                                [route for route in routes_from_values(m, n, values) if route]))
+        if status == "optimal":
+            bound.prove()
+            break
+        if status != "stopped":
+            # out of time
+            break
+        print(f"{solver_name} restarted under the shared bound {bound.get()}")
+
+
+def solve_lazy(model, m, n, x, max_distance, solver):
+    # solve without subtour constraints and re-solve with the DFJ cuts of the subtours found in
+    # the solution, until a solution has none
+    start_time = time.time()
+    time_limit = solver.timeLimit
+    start = {var.name: var.varValue for var in model.variables()}
+    solution = {'time': 300, 'optimal': False, 'obj': "N/A", 'sol': []}
+    while True:
+        remaining = time_limit - (time.time() - start_time)
+        if remaining < 1:
+            break
+        if None not in start.values():
+            # the solve overwrites the values, the warm start is valid for every cut
+            for var in model.variables():
+                var.setInitialValue(start[var.name])
+        solver.timeLimit = remaining
+        model.solve(solver)
+        if model.sol_status not in (LpSolutionOptimal, LpSolutionIntegerFeasible):
+            break
+        cycles = solution_subtours(m, n, lambda k, i, j: value(x[k][i][j]) > 0.5)
+        if not cycles:
+            optimal = model.sol_status == LpSolutionOptimal
+            solution = {
+                'time': int(time.time() - start_time) if optimal else 300,
+                'optimal': optimal,
+                'obj': round(value(max_distance)),
+                'sol': [route for route in extract_routes(m, n, x) if route]
+            }
+            break
+        print(f"{len(cycles)} subtours cut")
+        for items in cycles:
+            add_subtour_cuts(model, m, x, items)
+    solver.timeLimit = time_limit
+    return solution
+
+
+solver_names = ["PULP_CBC_CMD", "GUROBI", "HiGHS"]
+
+
+class HiGHS_warm_start(HiGHS):
+    # pulp does not give the start values to highspy, set them on the model right before the run
+
+    def callSolver(self, lp):
+        import highspy
+        start = [var.varValue for var in lp.variables()]
+        if None not in start:
+            solution = highspy.HighsSolution()
+            solution.col_value = start
+            lp.solverModel.setSolution(solution)
+        super().callSolver(lp)
+
+
+def make_solver(solver_name, time_limit=300, warm_start=False):
+    if solver_name == "PULP_CBC_CMD":
+        return PULP_CBC_CMD(msg=False, timeLimit=time_limit, warmStart=warm_start)
+    elif solver_name == "GUROBI":
+        return GUROBI(timeLimit=time_limit, msg=False, warmStart=warm_start)
+    elif solver_name == "HiGHS":
+        if warm_start:
+            return HiGHS_warm_start(timeLimit=time_limit, msg=False)
+        return getSolver('HiGHS', timeLimit=time_limit, msg=False)
+    raise ValueError(f"Unknown MIP solver {solver_name}")
+
+
+def instance_path(num_instance):
+    return os.path.join(".", "Instances", f"inst0{num_instance}.dat") if num_instance < 10 else os.path.join(".", "Instances", f"inst{num_instance}.dat")
+
+
+def run_model(num_instance, warm_start=False, sym_breaking=False, builder="matrix", subtours="mtz", formulation="three_index"):
     if num_instance == 0:
         start = 0
         end = 21
@@ -97,47 +225,88 @@ def run_model(num_instance):
     else:
         start = num_instance - 1
         end = num_instance
-    
-    solvers = {
-        "PULP_CBC_CMD": PULP_CBC_CMD(msg=False, timeLimit=300),
-        "GUROBI": GUROBI(timeLimit=300, msg=False),
-        "HiGHS": getSolver('HiGHS', timeLimit=300, msg=False)
-    }
 
     for instance_num in range(start, end):
         print(f"instance : {instance_num + 1}")
-        instance_file = os.path.join(".", "Instances", f"inst0{instance_num+1}.dat") if instance_num < 9 else os.path.join(".", "Instances", f"inst{instance_num+1}.dat")
         instance_name = instance_num + 1
         output_file = os.path.join(".", "res", "MIP")
-    
-        m, n, L, S, D = read_mcp_instance(instance_file)
-
-        for solver_name, solver in solvers.items():
-            with mp.Manager() as manager:
-                shared_list = manager.list()
-                process = mp.Process(
-                    target=solve_and_save,
-                    args=(shared_list, m, n, L, S, D, solver)
-                )
-                process.start()
-                process.join(timeout=300)
-                if process.is_alive():
-                    process.kill()
-                    process.join()
-                    process.close()
-                if len(shared_list) == 0:
-                    solution = {
-                        'time': 300,
-                        'optimal': False,
-                        'obj': "N/A",
-                        'sol': []
-                    }
-                else:
-                    time, optimal, obj, sol = shared_list[-1]
-                    solution = {
-                        'time': time,
-                        'optimal': optimal,
-                        'obj': obj,
-                        'sol': sol
-                    }
-                save_solution_to_json(instance_name, solver_name, solution, output_file)
\ No newline at end of file
+        # the heuristic of the warm start counts in the time of every solver, whose results are kept apart
+        initial, past_time = timed_initial_solution(instance_name) if warm_start else (None, 0)
+        suffix = "_ws" if warm_start else ""
+
+        if formulation == "colgen":
+            # the set partitioning master and its pricing are solved with highspy only
+            solution = run_solver(instance_name, "HiGHS", initial, formulation=formulation, past_time=past_time)
+            save_solution_to_json(instance_name, "HiGHS_colgen" + suffix, solution, output_file)
+            continue
+
+        if formulation == "aggregated":
+            for solver_name in solver_names:
+                solution = run_solver(instance_name, solver_name, initial, formulation=formulation, past_time=past_time)
+                save_solution_to_json(instance_name, solver_name + "_aggregated" + suffix, solution, output_file)
+            continue
+
+        for solver_name in solver_names:
+            solution = run_solver(instance_name, solver_name, initial, sym_breaking, builder, subtours, past_time=past_time)
+            name = solver_name + ("_sym" if sym_breaking else "") + ("_lazy" if subtours == "lazy" else "") + suffix
+            save_solution_to_json(instance_name, name, solution, output_file)
+
+
+def run_solver(num_instance, solver_name, initial=None, sym_breaking=False, builder="matrix", subtours="mtz",
+               formulation="three_index", past_time=0):
+    # past_time: seconds already spent on the instance (the warm start), out of the 300
+    m, n, L, S, D = read_mcp_instance(instance_path(num_instance))
+    time_limit = 300 - past_time
+    with mp.Manager() as manager:
+        shared_list = manager.list()
+        if formulation == "colgen":
+            process = mp.Process(
+                target=solve_colgen_and_save,
+                args=(shared_list, m, n, L, S, D, time_limit, initial)
+            )
+        elif formulation == "aggregated":
+            # one flow network for all the couriers, built through PuLP for every solver
+            process = mp.Process(
+                target=solve_aggregated_and_save,
+                args=(shared_list, m, n, L, S, D, make_solver(solver_name, time_limit, warm_start=initial is not None), initial)
+            )
+        elif builder == "matrix" and solver_name in MATRIX_SOLVERS and matrix_available(solver_name):
+            # the constraint matrix goes straight to the solver, without PuLP
+            process = mp.Process(
+                target=solve_matrix_and_save,
+                args=(shared_list, m, n, L, S, D, solver_name, time_limit, initial, sym_breaking, subtours)
+            )
+        elif subtours == "mtz":
+            # the PuLP model is built once per instance and read back by every solver from MIP/cache
+            process = mp.Process(
+                target=solve_cached_and_save,
+                args=(shared_list, m, n, L, S, D, solver_name, time_limit, initial, sym_breaking)
+            )
+        else:
+            solver = make_solver(solver_name, time_limit, warm_start=initial is not None)
+            process = mp.Process(
+                target=solve_and_save,
+                args=(shared_list, m, n, L, S, D, solver, None, initial, sym_breaking, subtours)
+            )
+        process.start()
+        process.join(timeout=time_limit)
+        if process.is_alive():
+            process.kill()
+            process.join()
+            process.close()
+        if len(shared_list) == 0:
+            solution = {
+                'time': 300,
+                'optimal': False,
+                'obj': "N/A",
+                'sol': []
+            }
+        else:
+            time, optimal, obj, sol = shared_list[-1]
+            solution = {
+                'time': int(time + past_time) if optimal else 300,
+                'optimal': optimal,
+                'obj': obj,
+                'sol': sol
+            }
+    return solution
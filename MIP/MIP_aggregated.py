@@ -0,0 +1,140 @@
+from utils import *
+from pulp import *
+import time
+import numpy as np
+
+def triangle_inequality(D):
+    # D[i][j] <= D[i][k] + D[k][j] for every i, k, j: no detour is shorter than the direct arc
+    D = np.asarray(D)
+    return bool((D[:, None, :] <= D[:, :, None] + D[None, :, :]).all())
+
+
+def solve_aggregated_mip(m, n, L, S, D, initial=None):
+    # couriers of the same capacity are one class: the arcs x[i][j] are shared by all the routes, the arc
+    # leaving the depot gives the class of its route, and two flows along the routes carry the capacity
+    # left and the distance travelled, which also rule out the subtours
+    model = LpProblem("Multiple_Couriers_Planning_Aggregated", LpMinimize)
+    capacities = sorted(set(L))
+    count = [L.count(capacity) for capacity in capacities]
+    classes = range(len(capacities))
+    nodes = range(n+1)
+    arcs = [(i, j) for i in nodes for j in nodes if i != j]
+
+    upper_bound = calculate_upper_bound(m, n, L, S, D)
+    lower_bound = calculate_lower_bound(n, D)
+    if initial is not None and initial["obj"] > upper_bound:
+        initial = None
+    elif initial is not None:
+        # nothing worse than the starting solution is needed
+        upper_bound = initial["obj"]
+
+    # Decision Variables
+    x = {(i, j): LpVariable(f"x_{i}_{j}", cat="Binary") for i, j in arcs}
+    y = LpVariable.dicts("y", (classes, range(n)), cat="Binary")
+    load = {(i, j): LpVariable(f"load_{i}_{j}", lowBound=0) for i, j in arcs}
+    dist = {(i, j): LpVariable(f"dist_{i}_{j}", lowBound=0) for i, j in arcs}
+    max_distance = LpVariable("max_distance", lowBound=lower_bound, upBound=upper_bound, cat="Integer")
+
+    # Objective Function
+    model += max_distance
+
+    # Constraints
+
+    # every item is entered and left exactly once
+    for j in range(n):
+        model += lpSum(x[i, j] for i in nodes if i != j) == 1
+        model += lpSum(x[j, i] for i in nodes if i != j) == 1
+
+    # every route leaving the depot belongs to one class, with no more routes than couriers in the class
+    for j in range(n):
+        model += lpSum(y[c][j] for c in classes) == x[n, j]
+    for c in classes:
+        model += lpSum(y[c][j] for j in range(n)) <= count[c]
+
+    # capacity left: the capacity of the class when leaving the depot, less the size of every item
+    for j in range(n):
+        model += load[n, j] <= lpSum(capacities[c] * y[c][j] for c in classes)
+        model += lpSum(load[i, j] for i in nodes if i != j) - lpSum(load[j, i] for i in nodes if i != j) == S[j]
+    for i, j in arcs:
+        model += load[i, j] <= max(L) * x[i, j]
+        if j < n:
+            model += load[i, j] >= S[j] * x[i, j]
+
+    # distance travelled when reaching the end of the arc, at most max_distance back at the depot
+    for j in range(n):
+        model += dist[n, j] == D[n][j] * x[n, j]
+        model += lpSum(dist[j, i] for i in nodes if i != j) - lpSum(dist[i, j] for i in nodes if i != j) == \
+            lpSum(D[j][i] * x[j, i] for i in nodes if i != j)
+        model += dist[j, n] <= max_distance
+    # the cuts on the distance at the end of an arc take D[n][i] and D[j][n] as the shortest ways from the
+    # depot to i and from j back to it, which only holds under the triangle inequality; the instances
+    # don't guarantee it, without it only the arc itself is counted
+    metric = triangle_inequality(D)
+    if not metric:
+        print("The distances break the triangle inequality, the depot cuts of the aggregated model are left out")
+    for i, j in arcs:
+        # the courier still has to come back from j
+        model += dist[i, j] <= (upper_bound - (D[j][n] if j < n and metric else 0)) * x[i, j]
+        if i < n:
+            model += dist[i, j] >= ((D[n][i] if metric else 0) + D[i][j]) * x[i, j]
+
+    if initial is not None:
+        set_initial_values(initial, n, L, S, D, capacities, x, y, load, dist, max_distance)
+
+    return model, x, y, max_distance
+
+
+def set_initial_values(initial, n, L, S, D, capacities, x, y, load, dist, max_distance):
+    # MIP start from a feasible route set, every variable gets a value
+    for variables in (x, load, dist):
+        for variable in variables.values():
+            variable.setInitialValue(0)
+    for c in y:
+        for j in y[c]:
+            y[c][j].setInitialValue(0)
+    for k, route in enumerate(initial["sol"]):
+        if not route:
+            continue
+        route = [j - 1 for j in route]
+        y[capacities.index(L[k])][route[0]].setInitialValue(1)
+        left = L[k]
+        travelled = 0
+        for i, j in zip([n] + route, route + [n]):
+            travelled += D[i][j]
+            x[i, j].setInitialValue(1)
+            load[i, j].setInitialValue(left)
+            dist[i, j].setInitialValue(travelled)
+            if j < n:
+                left -= S[j]
+    max_distance.setInitialValue(initial["obj"])
+
+
+def extract_aggregated_routes(m, n, L, x, y):
+    # the routes leaving the depot, each given to a courier of its class, in courier order
+    capacities = sorted(set(L))
+    couriers = {c: [k for k in range(m) if L[k] == capacities[c]] for c in y}
+    routes = [[] for _ in range(m)]
+    for first in range(n):
+        if value(x[n, first]) < 0.5:
+            continue
+        route = [first]
+        while len(route) <= n:
+            route.append(next(j for j in range(n+1) if j != route[-1] and value(x[route[-1], j]) > 0.5))
+            if route[-1] == n:
+                break
+        c = next(c for c in y if value(y[c][first]) > 0.5)
+        routes[couriers[c].pop(0)] = [j + 1 for j in route[:-1]]
+    return routes
+
+
+def solve_aggregated_and_save(shared_list, m, n, L, S, D, solver, initial=None):
+    start_time = time.time()
+    model, x, y, max_distance = solve_aggregated_mip(m, n, L, S, D, initial)
+    print(f"Aggregated model: {len(set(L))} capacity classes, {len(model.variables())} variables, "
+          f"built in {time.time() - start_time:.2f}s")
+    model.solve(solver)
+    if model.sol_status not in (LpSolutionOptimal, LpSolutionIntegerFeasible):
+        return
+    optimal = model.sol_status == LpSolutionOptimal
+    shared_list.append((int(time.time() - start_time) if optimal else 300, optimal, round(value(max_distance)),
+                        extract_aggregated_routes(m, n, L, x, y)))
@@ -0,0 +1,241 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import signal
+import hashlib
+import subprocess
+import tempfile
+from pulp import LpVariable, PULP_CBC_CMD
+from utils import calculate_upper_bound
+from symmetry import Symmetry
+from MIP.MIP_model import solve_mip, set_initial_values
+
+# models of solve_mip saved as compressed MPS by cached_model, bump the version when the model changes
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+MODEL_VERSION = 1
+# the least recently used models are removed beyond this size
+CACHE_LIMIT = 2 * 1024 ** 3
+
+
+def model_cache_file(m, n, L, S, D, sym_breaking):
+    # the cache is keyed by the content of the instance, not by its file name
+    key = json.dumps([MODEL_VERSION, m, n, list(L), list(S), [list(row) for row in D], sym_breaking])
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + ".mps.gz")
+
+
+def cached_model(m, n, L, S, D, sym_breaking=False):
+    # the model of an instance is built once, without warm start, and saved; later runs and the other
+    # solvers read the file themselves, the warm start is given to the solver afterwards
+    cache_file = model_cache_file(m, n, L, S, D, sym_breaking)
+    if os.path.exists(cache_file):
+        # a hit makes the entry the most recently used one
+        os.utime(cache_file)
+        return cache_file
+
+    model, _, _ = solve_mip(m, n, L, S, D, None, sym_breaking)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # concurrent runs may write the same entry: write aside and rename
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    model.writeMPS(tmp_file + ".mps")
+    with open(tmp_file + ".mps", "rb") as source, gzip.open(tmp_file, "wb", compresslevel=3) as target:
+        shutil.copyfileobj(source, target)
+    os.remove(tmp_file + ".mps")
+    os.replace(tmp_file, cache_file)
+    evict_cache(cache_file)
+    return cache_file
+
+
+def evict_cache(keep, limit=CACHE_LIMIT):
+    # removes the least recently used models until the cache fits in limit bytes
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if name.endswith(".mps.gz") and path != keep:
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except FileNotFoundError:
+                continue
+    total = os.path.getsize(keep) + sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def start_values(initial, m, n, L, S, D, sym_breaking=False):
+    # values given by set_initial_values to the variables of solve_mip, by their names in the file
+    if initial["obj"] > calculate_upper_bound(m, n, L, S, D):
+        return None
+    if sym_breaking:
+        initial = dict(initial, sol=Symmetry(m, n, L, S, D).canonical_solution(initial["sol"], S))
+    x = LpVariable.dicts("x", (range(m), range(n+1), range(n+1)), cat='Binary')
+    a = LpVariable.dicts("a", (range(m), range(n)), cat="Binary")
+    t = LpVariable.dicts("t", (range(m), range(n)), cat="Integer")
+    courier_weights = [LpVariable(name=f'weight_{i}') for i in range(m)]
+    courier_distance = [LpVariable(name=f'obj_dist{i}') for i in range(m)]
+    max_distance = LpVariable("max_distance")
+    set_initial_values(initial, m, n, S, D, x, a, t, courier_weights, courier_distance, max_distance)
+    variables = [x[k][i][j] for k in range(m) for i in range(n+1) for j in range(n+1)]
+    variables += [v for k in range(m) for v in list(a[k].values()) + list(t[k].values())]
+    variables += courier_weights + courier_distance + [max_distance]
+    return {var.name: var.varValue for var in variables}
+
+
+# the cached solvers return the status of the solve and the values of the best solution (None when
+# there is none): "optimal", "feasible", "infeasible" when nothing is within upper_bound, "stopped" when
+# stop() turned true, or "unknown"; stop is polled during the solve
+
+
+def solve_cached_highs(model_file, time_limit, start, upper_bound, stop=None):
+    import highspy
+    highs = highspy.Highs()
+    highs.setOptionValue("output_flag", False)
+    highs.setOptionValue("time_limit", float(time_limit))
+    highs.readModel(model_file)
+    names = highs.getLp().col_names_
+    if upper_bound is not None:
+        # nothing worse than upper_bound is needed
+        _, col = highs.getColByName("max_distance")
+        highs.changeColBounds(col, highs.getLp().col_lower_[col], upper_bound)
+    if start is not None:
+        solution = highspy.HighsSolution()
+        solution.col_value = [start[name] for name in names]
+        highs.setSolution(solution)
+    if stop is not None:
+        def interrupt(callback_type, message, data_out, data_in, user_data):
+            data_in.user_interrupt = stop()
+        highs.setCallback(interrupt, None)
+        highs.startCallback(highspy.cb.HighsCallbackType.kCallbackMipInterrupt)
+    highs.run()
+    model_status = highs.getModelStatus()
+    values = None
+    if highs.getInfo().primal_solution_status == 2:
+        values = dict(zip(names, highs.getSolution().col_value))
+    if model_status == highspy.HighsModelStatus.kOptimal:
+        return "optimal", values
+    if model_status == highspy.HighsModelStatus.kInfeasible:
+        return "infeasible", None
+    if model_status == highspy.HighsModelStatus.kInterrupt:
+        return "stopped", values
+    return ("feasible" if values is not None else "unknown"), values
+
+
+def solve_cached_gurobi(model_file, time_limit, start, upper_bound, stop=None):
+    import gurobipy as gp
+    env = gp.Env(params={"OutputFlag": 0})
+    grb = gp.read(model_file, env)
+    grb.Params.TimeLimit = time_limit
+    if upper_bound is not None:
+        grb.getVarByName("max_distance").UB = upper_bound
+    if start is not None:
+        for var in grb.getVars():
+            var.Start = start[var.VarName]
+
+    def interrupt(model, where):
+        if where == gp.GRB.Callback.MIP and stop():
+            model.terminate()
+    grb.optimize(interrupt if stop is not None else None)
+    values = {var.VarName: var.X for var in grb.getVars()} if grb.SolCount > 0 else None
+    if grb.Status == gp.GRB.OPTIMAL:
+        status = "optimal"
+    elif grb.Status == gp.GRB.INFEASIBLE:
+        status = "infeasible"
+    elif grb.Status == gp.GRB.INTERRUPTED:
+        status = "stopped"
+    else:
+        status = "feasible" if values is not None else "unknown"
+    grb.dispose()
+    env.dispose()
+    return status, values
+
+
+def solve_cached_cbc(model_file, time_limit, start, upper_bound, stop=None):
+    # the cbc binary of PuLP cannot read compressed files, it gets a decompressed copy; the start
+    # and the solution files have the format PuLP uses with it. cbc is stopped with SIGINT, after
+    # which it still writes its best solution
+    with tempfile.TemporaryDirectory() as folder:
+        mps_file = os.path.join(folder, "model.mps")
+        with gzip.open(model_file, "rb") as source, open(mps_file, "wb") as target:
+            shutil.copyfileobj(source, target)
+        solution_file = os.path.join(folder, "model.sol")
+        command = [PULP_CBC_CMD().path, mps_file, "-sec", str(int(time_limit)), "-timeMode", "elapsed"]
+        if upper_bound is not None:
+            # the objective is integer: the nodes above upper_bound are cut off
+            command += ["-cutoff", str(upper_bound + 0.5)]
+        if start is not None:
+            start_file = os.path.join(folder, "start.sol")
+            with open(start_file, "w") as f:
+                f.write("Stopped on time - objective value 0\n")
+                f.writelines(f"{i:>7} {name} {value:>15} {0:>23}\n" for i, (name, value) in enumerate(start.items()))
+            command += ["-mips", start_file]
+        command += ["-solve", "-solution", solution_file]
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        stopped = False
+        while process.poll() is None:
+            if stop is not None and not stopped and stop():
+                process.send_signal(signal.SIGINT)
+                stopped = True
+            try:
+                process.wait(timeout=0.5)
+            except subprocess.TimeoutExpired:
+                pass
+        if not os.path.exists(solution_file):
+            return ("stopped" if stopped else "unknown"), None
+        with open(solution_file) as f:
+            status = f.readline()
+            values = {}
+            for line in f:
+                words = line.split()
+                if len(words) >= 4:
+                    values[words[-3]] = float(words[-2])
+    if status.startswith("Optimal"):
+        return "optimal", values
+    if status.startswith("Infeasible") or status.startswith("Integer infeasible"):
+        return "infeasible", None
+    if not status.startswith("Stopped") or "no integer solution" in status:
+        values = None
+    if stopped:
+        return "stopped", values
+    return ("feasible" if values is not None else "unknown"), values
+
+
+CACHED_SOLVERS = {"PULP_CBC_CMD": solve_cached_cbc, "GUROBI": solve_cached_gurobi, "HiGHS": solve_cached_highs}
+
+
+def routes_from_values(m, n, values):
+    # route of every courier, following the arcs x_k_i_j from the depot
+    routes = []
+    for k in range(m):
+        route = []
+        current = n
+        while len(route) < n:
+            current = next((j for j in range(n+1) if values.get(f"x_{k}_{current}_{j}", 0) > 0.9), n)
+            if current == n:
+                break
+            route.append(current + 1)
+        routes.append(route)
+    return routes
+
+
+def solve_cached_and_save(shared_list, m, n, L, S, D, solver_name, time_limit=300, initial=None, sym_breaking=False):
+    # loading (or building) the model and solving it are reported apart, the result time counts both
+    start_time = time.time()
+    model_file = cached_model(m, n, L, S, D, sym_breaking)
+    start = start_values(initial, m, n, L, S, D, sym_breaking) if initial is not None else None
+    load_time = time.time() - start_time
+    print(f"{solver_name} model {os.path.basename(model_file)} ready in {load_time:.2f}s")
+    upper_bound = initial["obj"] if start is not None else None
+    status, values = CACHED_SOLVERS[solver_name](model_file, time_limit - load_time, start, upper_bound)
+    print(f"{solver_name} solved in {time.time() - start_time - load_time:.2f}s")
+    if values is None:
+        return
+    optimal = status == "optimal"
+    routes = [route for route in routes_from_values(m, n, values) if route]
+    shared_list.append((int(time.time() - start_time) if optimal else time_limit, optimal,
+                        round(values["max_distance"]), routes))
@@ -0,0 +1,271 @@
+import math
+import time
+import numpy as np
+from utils import calculate_lower_bound
+from Heuristic.Heuristic_model import solve_heuristic, route_length
+
+# set partitioning over routes: every column is the route of one courier, the master picks at most one
+# route per courier so that every item is served once and minimizes the longest chosen route
+
+
+class ColumnPool:
+    # routes of the master, every one for a given courier: item list (0-based, in visiting order), length
+
+    def __init__(self, m, n, L, S, D):
+        self.m = m
+        self.n = n
+        self.L = L
+        self.S = S
+        self.D = D
+        self.courier = []
+        self.items = []
+        self.cost = []
+        self.index = {}
+
+    def add(self, k, route):
+        # the route is kept once per courier, and only when it fits in the courier
+        key = (k, tuple(route))
+        if not route or key in self.index or self.S[route].sum() > self.L[k]:
+            return False
+        self.index[key] = len(self.items)
+        self.courier.append(k)
+        self.items.append(list(route))
+        self.cost.append(route_length(route, self.D))
+        return True
+
+    def add_everywhere(self, route):
+        # the same route for every courier it fits in
+        return sum(self.add(k, route) for k in range(self.m))
+
+    def columns(self, start):
+        # column-wise arrays of the routes from start on: item rows, convexity row of the courier and
+        # its distance row with the negated length
+        n, m = self.n, self.m
+        starts, indices, values = [], [], []
+        for c in range(start, len(self.items)):
+            starts.append(len(indices))
+            k = self.courier[c]
+            indices.extend(self.items[c] + [n + k, n + m + k])
+            values.extend([1.0] * len(self.items[c]) + [1.0, -float(self.cost[c])])
+        return np.array(starts, dtype=np.int32), np.array(indices, dtype=np.int32), np.array(values)
+
+
+def master(pool, lower_bound, penalty, integer=False):
+    # rows: items covered once, at most one route per courier, z at least the length of every route.
+    # columns: one slack per item (penalized, fixed to zero in the integer master), z, then the routes
+    import highspy
+    n, m = pool.n, pool.m
+    route_starts, route_indices, route_values = pool.columns(0)
+    num_routes = len(route_starts)
+    lp = highspy.HighsLp()
+    lp.num_col_ = n + 1 + num_routes
+    lp.num_row_ = n + 2 * m
+    lp.col_cost_ = np.concatenate([np.full(n, penalty), [1.0], np.zeros(num_routes)])
+    lp.col_lower_ = np.concatenate([np.zeros(n), [float(lower_bound)], np.zeros(num_routes)])
+    lp.col_upper_ = np.concatenate([np.full(n, 0.0 if integer else highspy.kHighsInf), [highspy.kHighsInf], np.ones(num_routes)])
+    lp.row_lower_ = np.concatenate([np.ones(n), np.full(m, -highspy.kHighsInf), np.zeros(m)])
+    lp.row_upper_ = np.concatenate([np.ones(n), np.ones(m), np.full(m, highspy.kHighsInf)])
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = np.concatenate([np.arange(n + 1), route_starts + n + m, [len(route_indices) + n + m]]).astype(np.int32)
+    lp.a_matrix_.index_ = np.concatenate([np.arange(n), np.arange(n + m, n + 2 * m), route_indices]).astype(np.int32)
+    lp.a_matrix_.value_ = np.concatenate([np.ones(n + m), route_values])
+    if integer:
+        lp.integrality_ = [highspy.HighsVarType.kContinuous] * (n + 1) + [highspy.HighsVarType.kInteger] * num_routes
+    highs = highspy.Highs()
+    highs.setOptionValue("output_flag", False)
+    highs.passModel(lp)
+    return highs
+
+
+def add_columns(highs, pool, start):
+    # the new routes go into the master LP, which restarts from its last basis
+    starts, indices, values = pool.columns(start)
+    count = len(starts)
+    highs.addCols(count, np.zeros(count), np.zeros(count), np.ones(count), len(indices), starts, indices, values)
+
+
+def price(arc, gain, S, capacity, beam, deadline, max_routes=10):
+    # elementary shortest path with a capacity from the depot back to the depot, by labels extended one
+    # item at a time: arc[i][j] is the scaled distance, gain[j] the dual of item j. A label keeps its
+    # node, reduced cost, load, visited items and path; at every node only the beam cheapest extensions
+    # are kept, then the labels dominated by a cheaper, lighter one visiting a subset of its items.
+    # Returns the routes of negative reduced cost (without the convexity dual) and whether the search
+    # was exhaustive, i.e. no label was left out by the beam
+    n = len(S)
+    depot = n
+    first = np.flatnonzero(S <= capacity)
+    node = first
+    cost = arc[depot, first] - gain[first]
+    load = S[first]
+    visited = np.zeros((len(first), n), dtype=bool)
+    visited[np.arange(len(first)), first] = True
+    path = first[:, None]
+    exact = True
+    found_cost, found_path = [], []
+    while len(node) > 0:
+        closed = cost + arc[node, depot]
+        negative = np.flatnonzero(closed < -1e-6)
+        found_cost.extend(closed[negative])
+        found_path.extend(path[negative].tolist())
+        if time.time() > deadline:
+            return found_paths(found_cost, found_path, max_routes), False
+
+        # every label extended to every item it can still take
+        free = ~visited & (load[:, None] + S[None, :] <= capacity)
+        label, item = np.nonzero(free)
+        if len(label) == 0:
+            break
+        extended = cost[label] + arc[node[label], item] - gain[item]
+        order = np.lexsort((extended, item))
+        label, item, extended = label[order], item[order], extended[order]
+        group_start = np.searchsorted(item, item, side="left")
+        rank = np.arange(len(item)) - group_start
+        if (rank >= beam).any():
+            exact = False
+            keep = rank < beam
+            label, item, extended = label[keep], item[keep], extended[keep]
+
+        node = item
+        cost = extended
+        load = load[label] + S[item]
+        visited = visited[label]
+        visited[np.arange(len(item)), item] = True
+        path = np.column_stack([path[label], item])
+
+        keep = ~dominated(node, cost, load, visited)
+        node, cost, load, visited, path = node[keep], cost[keep], load[keep], visited[keep], path[keep]
+    return found_paths(found_cost, found_path, max_routes), exact
+
+
+def dominated(node, cost, load, visited):
+    # labels at the same node with a cheaper (or equal), lighter (or equal) label visiting a subset of
+    # their items, of two identical labels the first one is kept
+    result = np.zeros(len(node), dtype=bool)
+    bounds = np.flatnonzero(np.diff(node)) + 1
+    for group in np.split(np.arange(len(node)), bounds):
+        if len(group) < 2:
+            continue
+        c, w, v = cost[group], load[group], visited[group]
+        subset = ~(v[:, None, :] & ~v[None, :, :]).any(axis=2)
+        dominates = (c[:, None] <= c[None, :] + 1e-9) & (w[:, None] <= w[None, :]) & subset
+        equal = dominates & dominates.T
+        dominates &= ~equal | np.triu(np.ones_like(equal), 1)
+        result[group] = dominates.any(axis=0)
+    return result
+
+
+def found_paths(found_cost, found_path, max_routes):
+    # the most negative routes, at most max_routes
+    order = np.argsort(found_cost, kind="stable")[:max_routes]
+    return [(float(found_cost[i]), found_path[i]) for i in order]
+
+
+def column_generation(pool, highs, deadline, beam):
+    # solves the master LP and adds the routes priced out for every courier until none has a negative
+    # reduced cost; returns the best lower bound it proved (0 when the pricing was never exhaustive)
+    import highspy
+    n, m = pool.n, pool.m
+    D = pool.D.astype(float)
+    S = pool.S
+    bound = 0
+    rounds = 0
+    while time.time() < deadline:
+        highs.setOptionValue("time_limit", max(deadline - time.time(), 0.1))
+        highs.run()
+        if highs.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+            break
+        value = highs.getInfo().objective_function_value
+        dual = np.array(highs.getSolution().row_dual)
+        gain, convexity, scale = dual[:n], dual[n:n + m], dual[n + m:]
+        # HiGHS gives the reduced cost c - A^T dual: the route of k costs its length times the dual of
+        # the distance row, less the duals of its items and of the convexity row
+        start = len(pool.items)
+        exact = True
+        lagrangian = value
+        for k in range(m):
+            arc = scale[k] * D
+            routes, complete = price(arc, gain, S, pool.L[k], beam, deadline)
+            exact &= complete
+            reduced = [reduced_cost - convexity[k] for reduced_cost, _ in routes]
+            lagrangian += min([0.0] + reduced)
+            for reduced_cost, route in zip(reduced, [route for _, route in routes]):
+                if reduced_cost < -1e-6:
+                    pool.add(k, route)
+        if exact:
+            # at most one route per courier: the LP value plus every negative reduced cost bounds any solution
+            bound = max(bound, math.ceil(lagrangian - 1e-6))
+        rounds += 1
+        if len(pool.items) == start:
+            if exact:
+                bound = max(bound, math.ceil(value - 1e-6))
+            print(f"Column generation: {rounds} rounds, {len(pool.items)} routes, LP bound {value:.2f}")
+            return bound
+        add_columns(highs, pool, start)
+    print(f"Column generation stopped after {rounds} rounds, {len(pool.items)} routes")
+    return bound
+
+
+def price_and_branch(pool, lower_bound, penalty, initial, deadline):
+    # integer master over the generated routes, started from the initial routes when there are some
+    import highspy
+    highs = master(pool, lower_bound, penalty, integer=True)
+    highs.setOptionValue("time_limit", max(deadline - time.time(), 1.0))
+    if initial is not None:
+        start = np.zeros(pool.n + 1 + len(pool.items))
+        start[pool.n] = initial["obj"]
+        for k, route in enumerate(initial["sol"]):
+            if route:
+                start[pool.n + 1 + pool.index[(k, tuple(j - 1 for j in route))]] = 1
+        solution = highspy.HighsSolution()
+        solution.col_value = start
+        highs.setSolution(solution)
+    highs.run()
+    if highs.getInfo().primal_solution_status != 2:
+        return None
+    values = np.array(highs.getSolution().col_value)[pool.n + 1:]
+    routes = [[] for _ in range(pool.m)]
+    for c in np.flatnonzero(values > 0.5):
+        routes[pool.courier[c]] = [j + 1 for j in pool.items[c]]
+    return routes
+
+
+def solve_colgen_and_save(shared_list, m, n, L, S, D, time_limit=300, initial=None, beam=None):
+    start_time = time.time()
+    deadline = start_time + time_limit
+    L, S, D = np.asarray(L), np.asarray(S), np.asarray(D)
+    lower_bound = calculate_lower_bound(n, D.tolist())
+    # an item left out costs more than any route
+    penalty = float(D.sum()) + 1
+    # the beam of the pricing keeps the labels of a round within a few thousands
+    beam = beam or max(4, 4000 // n)
+
+    if initial is None:
+        routes = solve_heuristic(m, n, L.tolist(), S.tolist(), D.tolist(), time_limit=1, lower_bound=lower_bound)
+        if routes is not None:
+            sol = [[int(j) + 1 for j in route] for route in routes]
+            initial = {"obj": max(route_length(route, D) for route in routes), "sol": sol}
+    pool = ColumnPool(m, n, L, S, D)
+    if initial is not None:
+        shared_list.append((time_limit, False, initial["obj"], [route for route in initial["sol"] if route]))
+        for k, route in enumerate(initial["sol"]):
+            pool.add(k, [j - 1 for j in route])
+        for route in initial["sol"]:
+            pool.add_everywhere([j - 1 for j in route])
+    for j in range(n):
+        pool.add_everywhere([j])
+
+    # most of the time goes to the LP bound and the routes, the rest to the integer master
+    highs = master(pool, lower_bound, penalty)
+    bound = max(lower_bound, column_generation(pool, highs, start_time + 0.7 * time_limit, beam))
+    build_time = time.time() - start_time
+    print(f"Set partitioning: {len(pool.items)} routes, lower bound {bound}, in {build_time:.2f}s")
+
+    routes = price_and_branch(pool, bound, penalty, initial, deadline)
+    if routes is None:
+        return
+    obj = max(route_length([j - 1 for j in route], D) for route in routes)
+    if initial is not None and obj > initial["obj"]:
+        return
+    optimal = obj <= bound
+    shared_list.append((int(time.time() - start_time) if optimal else time_limit, optimal, int(obj),
+                        [route for route in routes if route]))
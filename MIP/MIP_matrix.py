@@ -0,0 +1,297 @@
+import time
+import importlib.util
+import numpy as np
+from utils import calculate_upper_bound, calculate_lower_bound
+from symmetry import Symmetry
+from MIP.MIP_subtours import solution_subtours
+
+# solvers fed with the constraint matrix through their array API, the others go through PuLP
+MATRIX_SOLVERS = ["HiGHS", "GUROBI"]
+
+
+def matrix_available(solver_name):
+    # the array API of the solver is installed, PuLP is the fallback otherwise
+    modules = {"HiGHS": ["highspy"], "GUROBI": ["gurobipy", "scipy"]}.get(solver_name)
+    return modules is not None and all(importlib.util.find_spec(module) is not None for module in modules)
+
+
+class MatrixModel:
+    # the model of solve_mip as arrays: columns x[k][i][j], a[k][j], t[k][j], weight[k], dist[k] and
+    # max_distance, rows in CSR form between row_lower and row_upper
+
+    def __init__(self, m, n):
+        self.m = m
+        self.n = n
+        self.x = np.arange(m * (n + 1) * (n + 1)).reshape(m, n + 1, n + 1)
+        self.a = self.x.size + np.arange(m * n).reshape(m, n)
+        self.t = self.x.size + m * n + np.arange(m * n).reshape(m, n)
+        self.weight = self.x.size + 2 * m * n + np.arange(m)
+        self.dist = self.weight + m
+        self.max_distance = self.x.size + 2 * m * n + 2 * m
+        self.num_col = self.max_distance + 1
+        self.col_lower = np.zeros(self.num_col)
+        self.col_upper = np.ones(self.num_col)
+        self.cost = np.zeros(self.num_col)
+        self.cost[self.max_distance] = 1
+        self.start = None
+        self.groups = []
+
+    def add_rows(self, cols, vals, lower, upper):
+        # rows of the same number of terms, zero coefficients are dropped when the matrix is built
+        cols = np.asarray(cols, dtype=np.int64)
+        vals = np.broadcast_to(np.asarray(vals, dtype=float), cols.shape)
+        rows = cols.shape[0]
+        self.groups.append((cols, vals, np.broadcast_to(np.asarray(lower, dtype=float), rows),
+                            np.broadcast_to(np.asarray(upper, dtype=float), rows)))
+
+    def csr(self):
+        # row starts, column indices and values of the whole matrix, with the row bounds
+        starts, indices, values = [np.zeros(1, dtype=np.int64)], [], []
+        offset = 0
+        for cols, vals, _, _ in self.groups:
+            keep = vals != 0
+            counts = np.cumsum(keep.sum(axis=1)) + offset
+            starts.append(counts)
+            offset = counts[-1] if counts.size else offset
+            indices.append(cols[keep])
+            values.append(vals[keep])
+        lower = np.concatenate([group[2] for group in self.groups])
+        upper = np.concatenate([group[3] for group in self.groups])
+        return np.concatenate(starts), np.concatenate(indices), np.concatenate(values), lower, upper
+
+
+def build_matrix_mip(m, n, L, S, D, initial=None, sym_breaking=False, subtours="mtz"):
+    # same formulation as solve_mip, every family of constraints built at once with NumPy
+    model = MatrixModel(m, n)
+    x, a, t = model.x, model.a, model.t
+    S = np.asarray(S)
+    D = np.asarray(D)
+    ITEMS = np.arange(n)
+
+    upper_bound = calculate_upper_bound(m, n, L, S.tolist(), D.tolist())
+    lower_bound = calculate_lower_bound(n, D.tolist())
+    if initial is not None and initial["obj"] > upper_bound:
+        initial = None
+    elif initial is not None:
+        # nothing worse than the starting solution is needed
+        upper_bound = initial["obj"]
+
+    # bounds of the integer columns, no self-loops on the items
+    model.col_upper[t] = n
+    model.col_upper[model.weight] = L
+    model.col_upper[model.dist] = upper_bound
+    model.col_lower[model.max_distance] = lower_bound
+    model.col_upper[model.max_distance] = upper_bound
+    model.col_upper[x[:, ITEMS, ITEMS]] = 0
+
+    # load of every courier within its capacity
+    model.add_rows(np.column_stack([a, model.weight]), np.append(S, -1), 0, 0)
+
+    # every item delivered by exactly one courier and entered once
+    model.add_rows(a.T, 1, 1, 1)
+    model.add_rows(x[:, :, :n].transpose(2, 0, 1).reshape(n, -1), 1, 1, 1)
+
+    # every courier leaves the depot and comes back exactly once
+    model.add_rows(x[:, n, :], 1, 1, 1)
+    model.add_rows(x[:, :, n], 1, 1, 1)
+
+    # courier k leaves item j when it delivers it
+    model.add_rows(np.concatenate([x[:, :n, :], a[:, :, None]], axis=2).reshape(m * n, -1),
+                   np.append(np.ones(n + 1), -1), 0, 0)
+
+    # as many arcs enter item j as leave it, the self-loop being on both sides
+    others = np.array([[i for i in range(n + 1) if i != j] for j in range(n)]).reshape(n, n)
+    inflow = x[:, others, ITEMS[:, None]]
+    outflow = x[:, ITEMS[:, None], others]
+    model.add_rows(np.concatenate([inflow, outflow], axis=2).reshape(m * n, -1), np.repeat([1, -1], n), 0, 0)
+
+    # no loop between two items
+    I, J = np.triu_indices(n, 1)
+    model.add_rows(np.stack([x[:, I, J], x[:, J, I]], axis=2).reshape(-1, 2), 1, -np.inf, 1)
+
+    # MTZ subtour elimination: t[k][i] - t[k][j] + n x[k][i][j] <= n - 1, left to the DFJ cuts with lazy subtours
+    if subtours == "mtz":
+        I, J = np.nonzero(~np.eye(n, dtype=bool))
+        model.add_rows(np.stack([t[:, I], t[:, J], x[:, I, J]], axis=2).reshape(-1, 3), [1, -1, n], -np.inf, n - 1)
+
+    # distance of every courier, and the longest one
+    model.add_rows(np.column_stack([x.reshape(m, -1), model.dist]), np.append(D.ravel(), -1), 0, 0)
+    model.add_rows(np.column_stack([np.full(m, model.max_distance), model.dist]), [1, -1], 0, np.inf)
+
+    if sym_breaking:
+        symmetry = Symmetry(m, n, L, S.tolist(), D.tolist())
+        add_sb_rows(model, symmetry)
+        if initial is not None:
+            # the same routes, moved to the couriers allowed by the symmetry breaking
+            initial = dict(initial, sol=symmetry.canonical_solution(initial["sol"], S.tolist()))
+
+    if initial is not None:
+        model.start = initial_columns(model, initial, S, D)
+    return model
+
+
+def add_sb_rows(model, symmetry):
+    # the directives of add_sb_constraints of MIP_model
+    n = symmetry.n
+    a, t = model.a, model.t
+    # couriers with the same capacity are ordered by their smallest item
+    earlier = np.tril(np.ones((n, n)), -1)
+    for i, k in symmetry.couriers(symmetry.interchangeable):
+        cols = np.column_stack([a[k], np.tile(a[i], (n, 1))])
+        model.add_rows(cols, np.column_stack([np.ones(n), -earlier]), -np.inf, 0)
+
+    # a courier with a larger capacity carries at least the load of the next one
+    for i, k in symmetry.couriers(symmetry.dominated):
+        model.add_rows([[model.weight[i], model.weight[k]]], [1, -1], 0, np.inf)
+
+    # identical items are delivered in index order when they share the route
+    for j, h in symmetry.identical_items:
+        model.add_rows(np.column_stack([t[:, j], t[:, h], a[:, j], a[:, h]]), [1, -1, n, n], -np.inf, 2 * n - 1)
+
+
+def initial_columns(model, initial, S, D):
+    # MIP start from a feasible route set, every column gets a value
+    n = model.n
+    start = np.zeros(model.num_col)
+    for k, route in enumerate(initial["sol"]):
+        route = [j - 1 for j in route]
+        arcs = np.array(list(zip([n] + route, route + [n])))
+        start[model.x[k, arcs[:, 0], arcs[:, 1]]] = 1
+        start[model.a[k, route]] = 1
+        start[model.t[k, route]] = np.arange(len(route))
+        start[model.weight[k]] = S[route].sum()
+        start[model.dist[k]] = D[arcs[:, 0], arcs[:, 1]].sum()
+    start[model.max_distance] = initial["obj"]
+    return start
+
+
+def subtour_cuts(model, values):
+    # DFJ cuts of the subtours of a solution, one row per courier and subtour: columns and right-hand side
+    arcs = values[model.x] > 0.5
+    cuts = []
+    for items in solution_subtours(model.m, model.n, lambda k, i, j: arcs[k, i, j]):
+        cols = model.x[:, items][:, :, items].reshape(model.m, -1)
+        # the self-loops are fixed to zero, so they can stay in the rows
+        cuts.append((cols, len(items) - 1))
+    return cuts
+
+
+def routes_from_columns(model, values):
+    # route of every courier, following the arcs from the depot
+    n = model.n
+    arcs = values[model.x] > 0.5
+    routes = []
+    for k in range(model.m):
+        route = []
+        current = int(np.argmax(arcs[k, n]))
+        while current != n and len(route) < n:
+            route.append(current + 1)
+            current = int(np.argmax(arcs[k, current]))
+        routes.append(route)
+    return routes
+
+
+def solve_highs(model, time_limit, subtours="mtz"):
+    # the arrays are passed to HiGHS as they are, no PuLP object nor file in between
+    import highspy
+    start_time = time.time()
+    starts, indices, values, row_lower, row_upper = model.csr()
+    lp = highspy.HighsLp()
+    lp.num_col_ = int(model.num_col)
+    lp.num_row_ = len(row_lower)
+    lp.col_cost_ = model.cost
+    lp.col_lower_ = model.col_lower
+    lp.col_upper_ = model.col_upper
+    lp.row_lower_ = np.where(np.isinf(row_lower), -highspy.kHighsInf, row_lower)
+    lp.row_upper_ = np.where(np.isinf(row_upper), highspy.kHighsInf, row_upper)
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.start_ = starts
+    lp.a_matrix_.index_ = indices
+    lp.a_matrix_.value_ = values
+    lp.integrality_ = [highspy.HighsVarType.kInteger] * lp.num_col_
+    highs = highspy.Highs()
+    highs.setOptionValue("output_flag", False)
+    highs.setOptionValue("time_limit", float(time_limit))
+    highs.passModel(lp)
+    while True:
+        if model.start is not None:
+            solution = highspy.HighsSolution()
+            solution.col_value = model.start
+            highs.setSolution(solution)
+        highs.run()
+        optimal = highs.getModelStatus() == highspy.HighsModelStatus.kOptimal
+        if highs.getInfo().primal_solution_status != 2:
+            return optimal, None
+        values = np.array(highs.getSolution().col_value)
+        cuts = subtour_cuts(model, values) if subtours == "lazy" else []
+        if not cuts:
+            return optimal, values
+        # HiGHS has no lazy constraints: the cuts are added as rows and the model solved again
+        remaining = time_limit - (time.time() - start_time)
+        if remaining < 1:
+            return False, None
+        print(f"HiGHS: {len(cuts)} subtours cut")
+        # the rows of a subtour all have its number of terms, subtours of different sizes are flattened apart
+        indices = np.concatenate([cols.ravel() for cols, _ in cuts])
+        lengths = np.concatenate([np.full(len(cols), cols.shape[1]) for cols, _ in cuts])
+        upper = np.concatenate([np.full(len(cols), rhs, dtype=float) for cols, rhs in cuts])
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        highs.addRows(len(upper), np.full(len(upper), -highspy.kHighsInf), upper, indices.size,
+                      starts, indices, np.ones(indices.size))
+        highs.setOptionValue("time_limit", float(remaining))
+
+
+def solve_gurobi(model, time_limit, subtours="mtz"):
+    # matrix API of gurobipy, which reads the CSR arrays through scipy
+    import gurobipy as gp
+    import scipy.sparse as sp
+    starts, indices, values, row_lower, row_upper = model.csr()
+    A = sp.csr_matrix((values, indices, starts), shape=(len(row_lower), int(model.num_col)))
+    env = gp.Env(params={"OutputFlag": 0})
+    grb = gp.Model(env=env)
+    grb.Params.TimeLimit = time_limit
+    x = grb.addMVar(int(model.num_col), lb=model.col_lower, ub=model.col_upper, obj=model.cost, vtype=gp.GRB.INTEGER)
+    equal = row_lower == row_upper
+    below = ~equal & np.isinf(row_lower)
+    above = ~equal & ~below
+    grb.addMConstr(A[equal], x, "=", row_lower[equal])
+    grb.addMConstr(A[below], x, "<", row_upper[below])
+    grb.addMConstr(A[above], x, ">", row_lower[above])
+    if model.start is not None:
+        x.Start = model.start
+    if subtours == "lazy":
+        # the DFJ cuts of every new incumbent go in as lazy constraints, within the same search
+        columns = x.tolist()
+
+        def cut_subtours(grb, where):
+            if where == gp.GRB.Callback.MIPSOL:
+                for cols, rhs in subtour_cuts(model, np.array(grb.cbGetSolution(columns))):
+                    for row in cols:
+                        grb.cbLazy(gp.quicksum(columns[c] for c in row) <= rhs)
+
+        grb.Params.LazyConstraints = 1
+        grb.optimize(cut_subtours)
+    else:
+        grb.optimize()
+    optimal = grb.Status == gp.GRB.OPTIMAL
+    values = x.X if grb.SolCount > 0 else None
+    grb.dispose()
+    env.dispose()
+    return optimal, values
+
+
+def solve_matrix_and_save(shared_list, m, n, L, S, D, solver_name, time_limit=300, initial=None, sym_breaking=False, subtours="mtz"):
+    # build and solve times are reported apart, the result time counts both
+    start_time = time.time()
+    model = build_matrix_mip(m, n, L, S, D, initial, sym_breaking, subtours)
+    build_time = time.time() - start_time
+    print(f"{solver_name} matrix model: {model.num_col} columns, {sum(len(group[0]) for group in model.groups)} rows, built in {build_time:.2f}s")
+    solve = solve_highs if solver_name == "HiGHS" else solve_gurobi
+    optimal, values = solve(model, time_limit - build_time, subtours)
+    solve_time = time.time() - start_time - build_time
+    print(f"{solver_name} solved in {solve_time:.2f}s")
+    if values is None:
+        shared_list.append((time_limit, False, "N/A", []))
+        return
+    routes = [route for route in routes_from_columns(model, values) if route]
+    shared_list.append((int(time.time() - start_time) if optimal else time_limit, optimal, int(round(values[model.max_distance])), routes))
@@ -1,7 +1,8 @@
 from utils import *
+from symmetry import Symmetry
 from pulp import *
 
-def solve_mip(m, n, L, S, D):
+def solve_mip(m, n, L, S, D, initial=None, sym_breaking=False, subtours="mtz"):
     
     model = LpProblem("Multiple_Couriers_Planning", LpMinimize)
     
@@ -13,6 +14,11 @@ def solve_mip(m, n, L, S, D):
 
     upper_bound = calculate_upper_bound(m, n, L, S, D)
     lower_bound = calculate_lower_bound(n, D)
+    if initial is not None and initial["obj"] > upper_bound:
+        initial = None
+    elif initial is not None:
+        # nothing worse than the starting solution is needed
+        upper_bound = initial["obj"]
 
     max_distance = LpVariable("max_distance", lowBound=lower_bound, upBound=upper_bound, cat="Integer")
     
@@ -67,12 +73,13 @@ def solve_mip(m, n, L, S, D):
                 model += (x[k][i][j]   + x[k][j][i])  <= 1
     
     
-    # MTZ subtour elimination
-    for k in range(m):
-        for i in range(n):
-            for j in range(n):
-                if i != j:
-                    model += (t[k][i] - t[k][j])  <= (n) * (1 - x[k][i][j]) - 1
+    # MTZ subtour elimination, with lazy subtours the DFJ cuts are added by the solve loop instead
+    if subtours == "mtz":
+        for k in range(m):
+            for i in range(n):
+                for j in range(n):
+                    if i != j:
+                        model += (t[k][i] - t[k][j])  <= (n) * (1 - x[k][i][j]) - 1
 
     for k in range(m):
         model += lpSum([D[i][j] * x[k][i][j] for i in range(n+1) for j in range(n+1)]) == courier_distance[k]
@@ -80,5 +87,55 @@ def solve_mip(m, n, L, S, D):
     # Ensure max_distance is at least as large as the longest courier distance
     for k in range(m):
         model += max_distance >= courier_distance[k]
+
+    if sym_breaking:
+        symmetry = Symmetry(m, n, L, S, D)
+        add_sb_constraints(model, symmetry, a, t, courier_weights)
+        if initial is not None:
+            # the same routes, moved to the couriers allowed by the symmetry breaking
+            initial = dict(initial, sol=symmetry.canonical_solution(initial["sol"], S))
+
+    if initial is not None:
+        set_initial_values(initial, m, n, S, D, x, a, t, courier_weights, courier_distance, max_distance)
         
-    return model, x, max_distance
\ No newline at end of file
+    return model, x, max_distance
+
+
+def add_sb_constraints(model, symmetry, a, t, courier_weights):
+    n = symmetry.n
+    # couriers with the same capacity are ordered by their smallest item: k takes item j only
+    # when i has an item before j, so the empty couriers come last
+    for i, k in symmetry.couriers(symmetry.interchangeable):
+        for j in range(n):
+            model += a[k][j] <= lpSum(a[i][h] for h in range(j))
+
+    # a courier with a larger capacity carries at least the load of the next one
+    for i, k in symmetry.couriers(symmetry.dominated):
+        model += courier_weights[i] >= courier_weights[k]
+
+    # identical items are delivered in index order when they share the route
+    for j, h in symmetry.identical_items:
+        for k in range(symmetry.m):
+            model += t[k][j] - t[k][h] <= -1 + n * (2 - a[k][j] - a[k][h])
+
+
+def add_subtour_cuts(model, m, x, items):
+    # DFJ cut on the items of a subtour, for every courier: fewer arcs among them than items
+    for k in range(m):
+        model += lpSum(x[k][i][j] for i in items for j in items if i != j) <= len(items) - 1
+
+
+def set_initial_values(initial, m, n, S, D, x, a, t, courier_weights, courier_distance, max_distance):
+    # MIP start from a feasible route set, every variable gets a value
+    for k in range(m):
+        route = [j - 1 for j in initial["sol"][k]]
+        arcs = set(zip([n] + route, route + [n]))
+        for i in range(n+1):
+            for j in range(n+1):
+                x[k][i][j].setInitialValue(1 if (i, j) in arcs else 0)
+        for j in range(n):
+            a[k][j].setInitialValue(1 if j in route else 0)
+            t[k][j].setInitialValue(route.index(j) if j in route else 0)
+        courier_weights[k].setInitialValue(sum(S[j] for j in route))
+        courier_distance[k].setInitialValue(sum(D[i][j] for i, j in arcs))
+    max_distance.setInitialValue(initial["obj"])
\ No newline at end of file
@@ -0,0 +1,28 @@
+def find_subtours(arcs, n):
+    # item sets joined by the arcs (i, j) of one courier that are not connected to the depot n
+    parent = list(range(n + 1))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in arcs:
+        parent[find(i)] = find(j)
+    components = {}
+    for i, _ in arcs:
+        components.setdefault(find(i), set()).add(i)
+    depot = find(n)
+    return [sorted(items) for root, items in components.items() if root != depot]
+
+
+def solution_subtours(m, n, is_arc):
+    # subtours of every courier in an integer solution, each set once even when several couriers close it
+    subtours = []
+    for k in range(m):
+        arcs = [(i, j) for i in range(n + 1) for j in range(n + 1) if i != j and is_arc(k, i, j)]
+        for items in find_subtours(arcs, n):
+            if items not in subtours:
+                subtours.append(items)
+    return subtours
@@ -0,0 +1,336 @@
+import os
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+from z3.z3 import Solver, Bool, Not, Z3Exception, set_param, is_true, main_ctx, sat, unsat, unknown
+from utils import z3_checks
+from SAT.utils_CNF import *
+from SAT.utils_SAT import int_to_binary, num_bits, flatten_matrix
+from SAT.SAT_model import display, initial_routes, shared_upper_bound
+import time as T
+
+# external solvers tried by "auto", in order of preference
+SAT_BACKENDS = ["kissat", "cadical", "minisat"]
+
+
+def find_backend(name="auto"):
+    # first installed solver among the requested ones, z3 otherwise
+    candidates = SAT_BACKENDS if name == "auto" else [name]
+    for candidate in candidates:
+        if candidate != "z3" and shutil.which(candidate) is not None:
+            return candidate
+    if name not in ("auto", "z3"):
+        print(f"{name} not found, solving the CNF with z3")
+    return "z3"
+
+
+class DimacsBackend:
+    # runs an installed solver binary on the DIMACS file, the assumptions are added as unit clauses
+
+    def __init__(self, name, cnf):
+        self.name = name
+        self.executable = shutil.which(name)
+        self.cnf = cnf
+        # the clauses never change between the probes, only the units of the assumptions do
+        self.body = cnf.dimacs_body()
+        self.values = None
+        fd, self.path = tempfile.mkstemp(prefix="mcp_", suffix=".cnf")
+        os.close(fd)
+        self.output_path = self.path + ".out"
+
+    def command(self, timeout):
+        if self.name == "kissat":
+            return [self.executable, "-q", f"--time={timeout}", self.path]
+        if self.name == "cadical":
+            return [self.executable, "-q", "-t", str(timeout), self.path]
+        return [self.executable, "-verb=0", f"-cpu-lim={timeout}", self.path, self.output_path]
+
+    def check(self, assumptions, timeout):
+        timeout = max(1, int(timeout))
+        with open(self.path, "wb") as f:
+            f.write(f"p cnf {self.cnf.num_vars} {self.cnf.num_clauses + len(assumptions)}\n".encode())
+            f.write(self.body)
+            f.write("".join(f"{lit} 0\n" for lit in assumptions).encode())
+        try:
+            process = subprocess.run(self.command(timeout), capture_output=True, text=True, timeout=timeout + 5)
+        except subprocess.TimeoutExpired:
+            return unknown
+        # SAT competition exit codes
+        if process.returncode == 20:
+            return unsat
+        if process.returncode != 10:
+            return unknown
+        if self.name == "minisat":
+            with open(self.output_path) as f:
+                lines = f.read().split("\n")[1:]
+        else:
+            lines = [line[1:] for line in process.stdout.split("\n") if line.startswith("v")]
+        lits = np.array(" ".join(lines).split(), dtype=np.int64)
+        self.values = np.zeros(self.cnf.num_vars + 1, dtype=bool)
+        self.values[lits[lits > 0]] = True
+        return sat
+
+    def value(self, lit):
+        return bool(self.values[abs(lit)]) == (lit > 0)
+
+    def close(self):
+        for path in (self.path, self.output_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class Z3Backend:
+    # fallback: the clauses are parsed by z3 once and every probe checks them under assumptions
+
+    def __init__(self, cnf):
+        self.solver = Solver()
+        set_param("sat.random_seed", 42)
+        self.solver.from_string(smtlib_clauses(cnf))
+        self.model = None
+
+    def check(self, assumptions, timeout):
+        self.solver.set('timeout', max(1, int(timeout * 1000)))
+        status = z3_checks.check(self.solver, *[Bool(f"x{lit}") if lit > 0 else Not(Bool(f"x{-lit}")) for lit in assumptions])
+        if status == sat:
+            self.model = self.solver.model()
+        return status
+
+    def value(self, lit):
+        return is_true(self.model.evaluate(Bool(f"x{abs(lit)}"), model_completion=True)) == (lit > 0)
+
+    def close(self):
+        pass
+
+
+def smtlib_clauses(cnf):
+    # the variables are named x<index>, so that they can be referred to by name after parsing
+    text = [f"(declare-const x{v} Bool)" for v in range(1, cnf.num_vars + 1)]
+    clause = []
+    for lit in cnf.clauses.tolist():
+        if lit != 0:
+            clause.append(f"x{lit}" if lit > 0 else f"(not x{-lit})")
+        elif len(clause) == 1:
+            text.append(f"(assert {clause[0]})")
+            clause = []
+        else:
+            text.append(f"(assert (or {' '.join(clause)}))")
+            clause = []
+    return "\n".join(text)
+
+
+def make_backend(name, cnf):
+    return Z3Backend(cnf) if name == "z3" else DimacsBackend(name, cnf)
+
+
+def cnf_constraints(instance, sym_breaking, implied_constraints, load_encoding="adder", distance_encoding="adder"):
+    # the same model as SAT_model.constraints, lowered directly to clauses over integer literals,
+    # with the loads and the distances encoded by any of PB_ENCODINGS
+    if distance_encoding == "bdd":
+        raise ValueError("The BDD encoding needs a constant bound, it can only be used for the loads")
+    cnf = CNF()
+    m = instance.m
+    n = instance.n
+    s = instance.s
+    D = instance.D
+    max_weight_Binary = num_bits(max(instance.l))
+    max_Distance_Binary = num_bits(instance.upper_bound)
+
+    # a_ij = True indicates that courier i delivers object j
+    a = [cnf.new_vars(n) for i in range(m)]
+    # t_jk == 1 iff object j is delivered as k-th in its courier's route
+    t = [cnf.new_vars(n // m + 1 if implied_constraints else n) for j in range(n)]
+    # x_ijk = 1 indicates that courier i moves from delivery point j to delivery point k in his route
+    x = [[cnf.new_vars(n + 1) for j in range(n + 1)] for i in range(m)]
+
+    if sym_breaking:
+        instance.sort_weight()
+    l = instance.l
+
+    # every courier can't exceed its load capacity
+    w = None
+    if load_encoding in ("adder", "sorter"):
+        # w_i = binary representation of actual load carried by each courier
+        w = [adder_sum(cnf, a[i], s, max_weight_Binary) if load_encoding == "adder" else sorter_sum(cnf, a[i], s, max_weight_Binary)
+             for i in range(m)]
+        for i in range(m):
+            less(cnf, w[i], binary_constant(cnf, l[i]))
+    else:
+        for i in range(m):
+            pb_atmost(cnf, a[i], s, l[i], load_encoding)
+
+    if sym_breaking:
+        # lexicographic ordering between the paths of two couriers with same load capacity, the
+        # heavier loads on the bigger couriers only when the loads are encoded in binary
+        for i, k in instance.symmetry.interchangeable:
+            less(cnf, a[i], a[k])
+        if w is not None:
+            for i, k in instance.symmetry.dominated:
+                less(cnf, w[k], w[i])
+        # identical items are delivered in index order when they share the route
+        for j, h in instance.symmetry.identical_items:
+            for i in range(m):
+                for p in range(len(t[h])):
+                    cnf.add([-a[i][j], -a[i][h], -t[h][p]] + t[j][:p])
+
+    # every item is assigned to one and only one courier
+    for j in range(n):
+        exactly_one(cnf, [a[i][j] for i in range(m)])
+
+    # every item is delivered at some time in its courier's route, and only once
+    for j in range(n):
+        exactly_one(cnf, t[j])
+
+    for i in range(m):
+        # can't leave from j to go to j
+        for j in range(n + 1):
+            cnf.add([-x[i][j][j]])
+            x[i][j][j] = -cnf.true
+        # row j has a 1 iff courier i delivers item j
+        for j in range(n):
+            exactly_one(cnf, x[i][j], a[i][j])
+            all_false(cnf, x[i][j], -a[i][j])
+        exactly_one(cnf, x[i][n])
+        # column k has a 1 iff courier i delivers item k
+        for k in range(n):
+            column = [x[i][j][k] for j in range(n + 1)]
+            exactly_one(cnf, column, a[i][k])
+            all_false(cnf, column, -a[i][k])
+        exactly_one(cnf, [x[i][j][n] for j in range(n + 1)])
+
+        # ordering between t_j and t_k in every edge travelled, no loops without the origin
+        for j in range(n):
+            for k in range(n):
+                if j != k:
+                    consecutive(cnf, t[j], t[k], x[i][j][k])
+            cnf.add([t[j][0]], x[i][n][j])
+
+    # distances, bounded by the assumptions of each probe
+    flat_D = flatten_matrix(D)
+    if distance_encoding in ("totalizer", "swc") and not counter_fits(flat_D, instance.upper_bound, distance_encoding):
+        print(f"The {distance_encoding} of the distances is too large for the upper bound {instance.upper_bound}, using the adder")
+        distance_encoding = "adder"
+    if distance_encoding in ("adder", "sorter"):
+        # distances[i] := binary representation of the distance travelled by courier i
+        if distance_encoding == "adder":
+            distances = [adder_sum(cnf, flatten_matrix(x[i]), flat_D, max_Distance_Binary) for i in range(m)]
+        else:
+            distances = [sorter_sum(cnf, flatten_matrix(x[i]), flat_D, max_Distance_Binary) for i in range(m)]
+        ub_bits = cnf.new_vars(max_Distance_Binary)
+        all_less_bin(cnf, distances, ub_bits)
+        at_least_one_greater_bin(cnf, distances, binary_constant(cnf, instance.lower_bound))
+        bound = lambda value: bound_literals(ub_bits, value)
+    else:
+        # ge[i][v] is implied by a distance of at least v, the lower bound would need the converse
+        ge = [counter_outputs(cnf, flatten_matrix(x[i]), flat_D, instance.upper_bound, distance_encoding) for i in range(m)]
+        for i in range(m):
+            cnf.add([-ge[i][instance.upper_bound + 1]])
+        bound = lambda value: [-ge[i][value + 1] for i in range(m) if ge[i][value + 1] != -cnf.true]
+    return cnf, (a, t, bound)
+
+
+def bound_literals(ub_bits, value):
+    # assumptions fixing the bound on the distances to value
+    return [b if bit else -b for b, bit in zip(ub_bits, int_to_binary(value, len(ub_bits)))]
+
+
+def read_solution(backend, instance, variables):
+    # the distances are those of the decoded routes, whatever their encoding
+    a, t, _ = variables
+    a_eval = [[backend.value(v) for v in row] for row in a]
+    t_eval = [[backend.value(v) for v in row] for row in t]
+    _, tot_s = display(t_eval, [[0] for _ in a], None, a_eval, False)
+    _, tot_s = instance.invert_sort_weight([0] * len(a), tot_s)
+    tot_s, travel = initial_routes(instance, {"sol": tot_s})
+    return max(travel), tot_s, travel
+
+
+def cnf_solver(shared_list, instance, timeout, pre_time, strategy="linear", sym_breaking=False, implied_constraints=False, bound=None, initial=None, backend="z3", encodings=("adder", "adder")):
+    start_time = T.time()
+    cnf, variables = cnf_constraints(instance, sym_breaking, implied_constraints, *encodings)
+    sat_backend = make_backend(backend, cnf)
+    encode_time = int(T.time() - start_time)
+    print(f"Encoding of {cnf.num_vars} variables and {cnf.num_clauses} clauses finished at time {encode_time}s, now start solving with {backend}")
+    timeout = timeout - encode_time
+    if initial is not None and initial["obj"] <= instance.upper_bound:
+        sol, travel = initial_routes(instance, initial)
+        shared_list.append((encode_time + pre_time, False, initial["obj"], sol, travel))
+    else:
+        initial = None
+    watcher = None
+    if bound is not None and backend == "z3":
+        # a better incumbent found by another engine interrupts the running check
+        watcher = bound.watch(main_ctx().interrupt, guard=z3_checks)
+    try:
+        time_search, optimal, obj, sol, travel = cnf_search(sat_backend, instance, variables, timeout, shared_list, bound, initial, strategy)
+    finally:
+        sat_backend.close()
+    if watcher is not None:
+        watcher.set()
+    time = time_search + encode_time + pre_time
+    print(f"time search:{time_search}, encode time:{encode_time}, pre_time: {pre_time}")
+    shared_list.append((time, optimal, obj, sol, travel))
+
+
+def cnf_search(sat_backend, instance, variables, timeout, shared_list, bound=None, initial=None, strategy="linear"):
+    # linear or binary search on the bound, every probe only changes the assumptions
+    start_time = T.time()
+    bound_assumptions = variables[2]
+    lower_bound = instance.lower_bound
+    upper_bound = instance.upper_bound
+    if initial is not None:
+        # only solutions better than the starting one are searched
+        upper_bound = initial["obj"] - 1
+
+    found = None
+    timed_out = False
+    while lower_bound <= upper_bound:
+        if shared_upper_bound(bound, upper_bound) < upper_bound:
+            upper_bound = shared_upper_bound(bound, upper_bound)
+            print(f"Bound tightened by another engine: obj_val <= {upper_bound}")
+            continue
+        past_time = T.time() - start_time
+        if past_time >= timeout:
+            timed_out = True
+            break
+        probe = upper_bound if strategy == "linear" else (lower_bound + upper_bound) // 2
+        print(f"Trying with bounds: [{lower_bound}, {upper_bound}] and try obj_val <= {probe}")
+        status = sat_backend.check(bound_assumptions(probe), timeout - past_time)
+        if status == sat:
+            try:
+                read = read_solution(sat_backend, instance, variables)
+            except Z3Exception:
+                # an interrupt landed right after the check of z3: the probe is checked again
+                print("Model evaluation canceled by an interrupt, checking again")
+                continue
+            found = read
+            objective_value = found[0]
+            print(f"This model obtained objective value: {objective_value}")
+            if bound is not None:
+                bound.offer(objective_value)
+            upper_bound = objective_value - 1
+            shared_list.append((int(T.time() - start_time), False, objective_value, found[1], found[2]))
+        elif status == unsat:
+            lower_bound = probe + 1
+        else:
+            if timeout - (T.time() - start_time) >= 1:
+                # interrupted (by a better incumbent of another engine) while time remains: checked again
+                continue
+            timed_out = True
+            break
+
+    # the search interval is closed unless the time ran out
+    optimal = not timed_out
+    if bound is not None and optimal:
+        bound.prove()
+    past_time = timeout if timed_out else int(T.time() - start_time)
+    if found is None and initial is not None:
+        sol, travel = initial_routes(instance, initial)
+        return past_time, optimal, initial["obj"], sol, travel
+    if found is None:
+        return past_time, False, "N/A", [], []
+    objective_value, tot_s, travel = found
+    if bound is not None and bound.get() < objective_value:
+        # the proof (if any) is about the incumbent of another engine
+        optimal = False
+    return past_time, optimal, objective_value, tot_s, travel
@@ -1,5 +1,6 @@
 import numpy as np
 from utils import *
+from symmetry import Symmetry
 
 class Instance:
     def __init__(self, m, n, l, s, D):
@@ -11,6 +12,7 @@ class Instance:
         self.lower_bound = self.set_lower_bound()
         self.upper_bound = self.set_upper_bound()
         self.courier_sort_weight_dict = None
+        self.symmetry = None
         
     
     def set_lower_bound(self):
@@ -33,24 +35,15 @@ class Instance:
         return upper_bound
 
     def sort_weight(self):
+        # couriers in the canonical order of the shared symmetry analysis
+        self.symmetry = Symmetry(self.m, self.n, self.l, self.s, self.D)
+        self.l = self.symmetry.canonical(self.l)
 
-        sort_index = np.argsort(self.l)[::-1]
-        sorted_l = np.array(self.l)[sort_index]
-        self.l = list(sorted_l)
-
-        self.courier_sort_weight_dict = {i: sort_index[i] for i in range(self.m)}
+        self.courier_sort_weight_dict = {i: self.symmetry.order[i] for i in range(self.m)}
 
     def invert_sort_weight(self, distances=[], solution=[[]]):
         if self.courier_sort_weight_dict:
-            true_order_distances = list(distances)
-            true_order_solution = list(solution)
-            for start, end in self.courier_sort_weight_dict.items():
-                true_order_solution[end] = solution[start]
-                true_order_distances[end] = distances[start]
-
-            return true_order_distances, true_order_solution
+            return self.symmetry.invert(distances), self.symmetry.invert(solution)
 
         else:
             return distances, solution
-
-
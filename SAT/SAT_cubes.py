@@ -0,0 +1,124 @@
+import os
+import copy
+import queue
+import multiprocessing
+import time as T
+from SAT.SAT_model import *
+
+def assignment_cubes(instance, sym_breaking, target):
+    # partial assignments of the items furthest from the origin to the couriers, within their capacities,
+    # with the fewest items giving at least target cubes
+    n = instance.n
+    s = instance.s
+    D = instance.D
+    # the cubes are on the courier order of the encoding
+    sorted_instance = copy.deepcopy(instance)
+    if sym_breaking:
+        sorted_instance.sort_weight()
+    l = sorted_instance.l
+    furthest = sorted(range(n), key=lambda j: D[n][j] + D[j][n], reverse=True)
+    cubes = [[]]
+    for j in furthest:
+        if len(cubes) >= target:
+            break
+        cubes = [cube + [(j, i)] for cube in cubes for i in range(instance.m)
+                 if s[j] + sum(s[h] for h, k in cube if k == i) <= l[i]]
+    return cubes
+
+def cube_worker(shared_list, cubes, open_cubes, closed, instance, start_time, deadline, pre_time, sym_breaking, implied_constraints,
+                bound, formulation, threads):
+    # takes the next open cube until none is left, and solves it under the best bound found by any worker
+    set_z3_threads(threads)
+    set_param("sat.random_seed", 42)
+    solver = Solver()
+    variables = cached_constraints(instance, solver, sym_breaking, implied_constraints, None, formulation)
+    a, t, distances, w, _ = variables
+    extract_incumbent = incumbent_extractor(variables, instance)
+    lower_bound = instance.lower_bound
+    solver.add(At_LeastOne_Greater_bin(distances, int_to_binary(lower_bound, num_bits(lower_bound), BoolVal)))
+    # a better incumbent of another worker interrupts the running check, and only the check
+    watcher = bound.watch(main_ctx().interrupt, guard=z3_checks)
+    while T.time() < deadline:
+        try:
+            k = open_cubes.get(timeout=1)
+        except queue.Empty:
+            break
+        # the cube is given as assumptions, so that the learned clauses are kept for the next cubes
+        assumptions = [a[i][j] for j, i in cubes[k]]
+        while T.time() < deadline:
+            upper_bound = bound.consume() - 1
+            if upper_bound < lower_bound:
+                status = unsat
+            else:
+                solver.push()
+                solver.add(All_Less_bin(distances, int_to_binary(upper_bound, num_bits(upper_bound), BoolVal)))
+                solver.set("timeout", max(1, int((deadline - T.time()) * 1000)))
+                status = z3_checks.check(solver, *assumptions)
+                if status == sat:
+                    try:
+                        obj, tot_s, travel = extract_incumbent(solver.model())
+                    except Z3Exception:
+                        # an interrupt landed right after the check: the cube goes back to the open ones
+                        solver.pop()
+                        open_cubes.put(k)
+                        break
+                    if bound.offer(obj):
+                        print(f"Cube {k} obtained objective value: {obj}")
+                        shared_list.append((int(T.time() - start_time) + pre_time, False, obj, tot_s, travel))
+                solver.pop()
+            if status == unsat:
+                with closed.get_lock():
+                    closed.value += 1
+                break
+            # unknown: interrupted (by a new bound, or by an interrupt meant for an earlier check) or out
+            # of time; the cube is checked again while time remains, the deadline ends the loop otherwise
+    watcher.set()
+
+def cube_solver(shared_list, instance, timeout, pre_time, strategy="cubes", sym_breaking=False, implied_constraints=False, bound=None,
+                initial=None, workers=None, formulation="three_index", threads=None):
+    # cube-and-conquer: the search is split on the couriers of the furthest items and the cubes are
+    # solved by a pool of processes sharing the best bound
+    start_time = T.time()
+    deadline = start_time + timeout
+    workers = workers or os.cpu_count() or 1
+    own_bound = bound if bound is not None else SharedBound(instance.upper_bound + 1)
+    if initial is not None and initial["obj"] <= instance.upper_bound:
+        own_bound.offer(initial["obj"])
+        sol, travel = initial_routes(instance, initial)
+        shared_list.append((pre_time, False, initial["obj"], sol, travel))
+
+    # the encoding is built once here, the workers parse it back from the cache
+    encode_start = T.time()
+    cached_constraints(copy.deepcopy(instance), Solver(), sym_breaking, implied_constraints, None, formulation)
+    cubes = assignment_cubes(instance, sym_breaking, 4 * workers)
+    print(f"Encoding ready in {int(T.time() - encode_start)}s, {len(cubes)} cubes for {workers} workers")
+
+    open_cubes = multiprocessing.Queue()
+    for k in range(len(cubes)):
+        open_cubes.put(k)
+    closed = multiprocessing.Value('i', 0)
+    processes = [multiprocessing.Process(target=cube_worker, args=(shared_list, cubes, open_cubes, closed, copy.deepcopy(instance), start_time,
+                                                                   deadline, pre_time, sym_breaking, implied_constraints, own_bound,
+                                                                   formulation, threads))
+                 for _ in range(min(workers, len(cubes)))]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=max(0, deadline - T.time()) + 5)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+    # every cube closed: nothing is better than the tightest bound, whoever found it
+    proved = closed.value == len(cubes)
+    if proved and bound is not None:
+        bound.prove()
+    time = int(T.time() - start_time) + pre_time if proved else timeout + pre_time
+    found = [entry for entry in shared_list if entry[2] != "N/A"]
+    if not found:
+        print("UNSAT" if proved else "UNKNOWN RESULT for insufficient time")
+        shared_list.append((time, False, "N/A", [], []))
+        return
+    _, _, obj, sol, travel = min(found, key=lambda entry: entry[2])
+    print(f"Best objective over {closed.value}/{len(cubes)} closed cubes: {obj}")
+    shared_list.append((time, proved and obj <= own_bound.get(), obj, sol, travel))
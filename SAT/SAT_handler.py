@@ -2,11 +2,15 @@ import os
 from SAT.Instance import Instance
 import json
 from SAT.SAT_model import *
+from SAT.CNF_model import cnf_solver, find_backend
+from SAT.SAT_cubes import cube_solver
+from Heuristic.Heuristic_handler import timed_initial_solution
 from z3.z3 import *
 import time as t
 import multiprocessing
 
-def SAT_function(num_instance):
+def SAT_function(num_instance, warm_start=False, incremental=False, backend=None, encodings=("adder", "adder"), sparse_k=None, formulation="three_index",
+                 strategies=None, trace=False, workers=None, threads=None):
 
     if num_instance == 0:
         start = 1
@@ -17,94 +21,151 @@ def SAT_function(num_instance):
     else:
         start = num_instance
         end = num_instance + 1
-    search = ["linear","binary"]
-    symb = [False, True]
-    imp_const = [False, True]
+    if backend is not None:
+        backend = find_backend(backend)
     for i in range(start, end):
-        index = i
-
-        if index < 10:
-            index = "0" + str(index)
-        else:
-            index = str(index)
-
-        path = os.path.join(f"./Instances",f"inst{index}.dat")
-        start_time = t.time()
-        file = open(path, 'r')
-        m = int(file.readline())
-        n = int(file.readline())
-        l = [int(x) for x in file.readline().split(" ") if x != ""]
-        s = [int(x) for x in file.readline().split(" ") if x != ""]
-        D = []
-        for i in range(n + 1):
-            D.append([int(x) for x in file.readline().split(" ") if x != "\n" if x != ""])
-
-        instance = Instance(m, n, l, s, D)
-        pre_process_time = t.time()
-        past_time = int((pre_process_time - start_time))
-        timeout = 300 - past_time
+        index, instance, past_time = load_instance(i)
+        initial = None
+        if warm_start:
+            # the heuristic is part of the time of every configuration, whose results are kept apart
+            initial, heuristic_time = timed_initial_solution(i)
+            past_time = int(past_time + heuristic_time)
         json_dict = {}
-        for strategy in search:
-            for imp in imp_const:
-                for sb in symb:
-
-                    optimal_flag = False
-                    print(f"=================INSTANCE {index}=================")
-                    print(f"Max distance found using {strategy} search", end="")
-                    name = ""
-                    if sb:
-                        print(' with sb / ', end= "")
-                        name += "_sb"
-                    
-                    if imp:
-                        print(' with imp / ', end= "")
-                        name +="_imp"
-
-                    print("\n")
-                    key_dict = strategy + name
-                    with multiprocessing.Manager() as manager:
-                        shared_list = manager.list()
-                        process = multiprocessing.Process(target=sat_solver, args=(shared_list, instance, timeout, past_time, strategy, sb, imp))
-                        process.start()
-
-                        process.join(timeout=timeout)
-
-                        if process.is_alive():
-                            print("Process exceeded 300 seconds, terminating...")
-                            process.terminate()
-                            process.join()
-                            optimal_flag = True
-                        if len(shared_list) == 0:
-                            time, optimal, obj, sol = 300, False, "N/A", []
-                        else:
-                            time, optimal, obj, sol, distances = shared_list[-1]
-                            show = False
-                            if optimal_flag:
-                                time = 300
-                                optimal = False
-                                if show:
-                                    print(f"-----------Objective value: {obj}-----------")
-                                    print(f"------------------Routes-----------------")
-                                    for courier in range(m):
-                                        print("Origin --> " +
-                                            ' --> '.join([str(node) for node in sol[courier]]) +
-                                            f' --> Origin: travelled {distances[courier]}')
-
-                    json_dict[key_dict] = {"time": time, "optimal": optimal, "obj": obj, "sol": sol}
-                    print(f"best answer: {obj}")
+        # the CNF searches always change the bound through assumptions
+        # the adaptive searches are only written for the z3 model
+        for strategy, imp, sb in configurations(incremental and backend is None, strategies if backend is None else None):
+            key_dict, result = run_configuration(index, instance, past_time, strategy, sb, imp, initial, backend, encodings, sparse_k, formulation, trace,
+                                                 workers, threads)
+            json_dict[key_dict + ("_ws" if warm_start else "")] = result
 
         path = "res/SAT"
         save_file(path, index + ".json", json_dict)
 
 
+def configurations(incremental=False, strategies=None):
+    # every (strategy, implied constraints, symmetry breaking) combination, in the order they are reported
+    search = strategies or ["linear","binary"]
+    if incremental:
+        search = [strategy + "_inc" if strategy in ("linear", "binary") else strategy for strategy in search]
+    symb = [False, True]
+    imp_const = [False, True]
+    return [(strategy, imp, sb) for strategy in search for imp in imp_const for sb in symb]
+
+
+def load_instance(num_instance):
+    index = num_instance
+
+    if index < 10:
+        index = "0" + str(index)
+    else:
+        index = str(index)
+
+    path = os.path.join(f"./Instances",f"inst{index}.dat")
+    start_time = t.time()
+    file = open(path, 'r')
+    m = int(file.readline())
+    n = int(file.readline())
+    l = [int(x) for x in file.readline().split(" ") if x != ""]
+    s = [int(x) for x in file.readline().split(" ") if x != ""]
+    D = []
+    for i in range(n + 1):
+        D.append([int(x) for x in file.readline().split(" ") if x != "\n" if x != ""])
+
+    instance = Instance(m, n, l, s, D)
+    pre_process_time = t.time()
+    past_time = int((pre_process_time - start_time))
+    return index, instance, past_time
+
+
+def run_configuration(index, instance, past_time, strategy, sb, imp, initial=None, backend=None, encodings=("adder", "adder"), sparse_k=None, formulation="three_index", trace=False,
+                      workers=None, threads=None):
+    m = instance.m
+    timeout = 300 - past_time
+    optimal_flag = False
+    print(f"=================INSTANCE {index}=================")
+    print(f"Max distance found using {strategy} search", end="")
+    name = ""
+    if sb:
+        print(' with sb / ', end= "")
+        name += "_sb"
+    
+    if imp:
+        print(' with imp / ', end= "")
+        name +="_imp"
+
+    if formulation == "two_index" and backend is None:
+        print(' with the shared arcs of the two index model', end="")
+        name += "_two_index"
+
+    if sparse_k is not None and backend is None and strategy != "cubes":
+        print(' on the nearest neighbour arcs first', end="")
+        name += "_sparse"
+
+    if backend is not None:
+        print(f' on DIMACS CNF with {backend}', end="")
+        name += "_" + backend
+        if encodings != ("adder", "adder"):
+            # loads and distances encoded with other pseudo-Boolean encodings than the adders
+            print(f' / loads: {encodings[0]}, distances: {encodings[1]}', end="")
+            name += f"_{encodings[0]}_{encodings[1]}"
+
+    print("\n")
+    key_dict = strategy + name
+    # probes of the bound search, kept out of res/ since they are not part of the results
+    trace_file = os.path.join("SAT", "traces", f"{index}_{key_dict}.json") if trace and backend is None else None
+    with multiprocessing.Manager() as manager:
+        shared_list = manager.list()
+        if strategy == "cubes" and backend is None:
+            process = multiprocessing.Process(target=cube_solver, args=(shared_list, instance, timeout, past_time, strategy, sb, imp, None, initial, workers, formulation, threads))
+        elif backend is None:
+            process = multiprocessing.Process(target=sat_solver, args=(shared_list, instance, timeout, past_time, strategy, sb, imp, None, initial, sparse_k, formulation, trace_file, threads))
+        else:
+            process = multiprocessing.Process(target=cnf_solver, args=(shared_list, instance, timeout, past_time, strategy, sb, imp, None, initial, backend, encodings))
+        process.start()
+
+        process.join(timeout=timeout)
+
+        if process.is_alive():
+            print("Process exceeded 300 seconds, terminating...")
+            process.terminate()
+            process.join()
+            optimal_flag = True
+        if len(shared_list) == 0:
+            time, optimal, obj, sol = 300, False, "N/A", []
+        else:
+            time, optimal, obj, sol, distances = shared_list[-1]
+            show = False
+            if optimal_flag:
+                time = 300
+                optimal = False
+                if show:
+                    print(f"-----------Objective value: {obj}-----------")
+                    print(f"------------------Routes-----------------")
+                    for courier in range(m):
+                        print("Origin --> " +
+                            ' --> '.join([str(node) for node in sol[courier]]) +
+                            f' --> Origin: travelled {distances[courier]}')
+
+    print(f"best answer: {obj}")
+    return key_dict, {"time": time, "optimal": optimal, "obj": obj, "sol": sol}
+
+
 def save_file(path, filename, json_dict):
     if not os.path.exists(path):
         os.makedirs(path)
 
     full_path = os.path.join(path, filename)
 
+    # the keys of the other variants already saved for the instance are kept
+    if os.path.exists(full_path):
+        with open(full_path, 'r') as file:
+            json_data = json.load(file)
+    else:
+        json_data = {}
+    json_data.update(json_dict)
+
     with open(full_path, 'w') as file:
-        json.dump(json_dict, file)
+        json.dump(json_data, file)
 
 
 
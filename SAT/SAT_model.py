@@ -1,29 +1,91 @@
+import os
+import json
 import math
+import copy
+import hashlib
 from SAT.Instance import *
 from z3.z3 import *
 from SAT.utils_SAT import *
 import time as T
 
-def sat_solver(shared_list, instance, timeout, pre_time, strategy="", sym_breaking=False, implied_constraints = False):
+# encodings saved by cached_constraints, bump the version when the encoding changes
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+ENCODING_VERSION = 3
+
+def sat_solver(shared_list, instance, timeout, pre_time, strategy="", sym_breaking=False, implied_constraints = False, bound=None, initial=None, sparse_k=None, formulation="three_index", trace_file=None, threads=None):
+    start_time = T.time()
+    set_z3_threads(threads)
+    # probes of all the phases, saved to trace_file when given
+    trace = [] if trace_file is not None else None
+    if sparse_k is not None:
+        # first half of the time on the k-nearest-neighbour arcs, doubling k while there is no solution
+        k = sparse_k or adaptive_k(instance.n)
+        while k < instance.n and T.time() - start_time < timeout / 2:
+            print(f"Sparse model with the arcs to the {k} nearest neighbours")
+            # another engine's bound can't be proved on the restricted arcs
+            elapsed = int(T.time() - start_time)
+            result = solve_encoding(copy.deepcopy(instance), int(timeout / 2) - elapsed, pre_time + elapsed, strategy, sym_breaking,
+                                    implied_constraints, shared_list, None, initial, k, formulation, trace)
+            time, _, obj, sol, travel = result
+            if obj != "N/A":
+                if bound is not None:
+                    bound.offer(obj)
+                if obj <= instance.lower_bound:
+                    shared_list.append((time, True, obj, sol, travel))
+                    if trace is not None:
+                        save_trace(trace, trace_file)
+                    return
+                # its optimum is only optimal among the kept arcs: the full model starts from it
+                shared_list.append((time, False, obj, sol, travel))
+                initial = {"obj": obj, "sol": sol}
+                break
+            print(f"No solution with the {k} nearest neighbours, adding arcs")
+            k *= 2
+        elapsed = int(T.time() - start_time)
+        timeout -= elapsed
+        pre_time += elapsed
+    shared_list.append(solve_encoding(instance, timeout, pre_time, strategy, sym_breaking, implied_constraints, shared_list, bound, initial,
+                                      formulation=formulation, trace=trace))
+    if trace is not None:
+        save_trace(trace, trace_file)
+
+
+def solve_encoding(instance, timeout, pre_time, strategy, sym_breaking, implied_constraints, shared_list, bound=None, initial=None, sparse_k=None, formulation="three_index", trace=None):
     solver = Solver()
     set_param("sat.random_seed", 42)
     solver.set('timeout', timeout * 1000)
-    variables = constraints(instance, solver, sym_breaking, implied_constraints)
+    variables = cached_constraints(instance, solver, sym_breaking, implied_constraints, sparse_k, formulation)
     a, t, distance, w, encode_time = variables
     timeout = int((timeout - encode_time))
     solver.set('timeout', timeout * 1000)
-    time_search, optimal, obj, sol, travel = search_optimize(instance, strategy, variables, solver, timeout, shared_list, implied_constraints)
+    if initial is not None and initial["obj"] <= instance.upper_bound:
+        set_phase_hints(solver, instance, a, t, initial)
+        sol, travel = initial_routes(instance, initial)
+        shared_list.append((encode_time + pre_time, False, initial["obj"], sol, travel))
+    else:
+        initial = None
+    watcher = None
+    if bound is not None:
+        # a better incumbent found by another engine interrupts the running check
+        watcher = bound.watch(main_ctx().interrupt, guard=z3_checks)
+    time_search, optimal, obj, sol, travel = search_optimize(instance, strategy, variables, solver, timeout, shared_list, implied_constraints, bound, initial, trace)
+    if watcher is not None:
+        watcher.set()
     time = time_search + encode_time + pre_time
     print(f"time search:{time_search}, encode time:{encode_time}, pre_time: {pre_time}")
     print("Time from beginning of the computation:", np.round(time, 2), "seconds")
-    shared_list.append((time, optimal, obj, sol, travel))
+    return time, optimal, obj, sol, travel
 
 
-def search_optimize(instance, strategy, variables, solver, timeout, shared_list, implied_constraints):
+def search_optimize(instance, strategy, variables, solver, timeout, shared_list, implied_constraints, bound=None, initial=None, trace=None):
     if strategy == "linear":
-        time, optimal, obj, sol, travel = linear_search(solver, instance, variables, timeout, shared_list, implied_constraints)
+        time, optimal, obj, sol, travel = linear_search(solver, instance, variables, timeout, shared_list, implied_constraints, bound, initial, trace)
     elif strategy == "binary":
-        time, optimal, obj, sol, travel = binary_search(solver, instance, variables, timeout, shared_list, implied_constraints)
+        time, optimal, obj, sol, travel = binary_search(solver, instance, variables, timeout, shared_list, implied_constraints, bound, initial, trace)
+    elif strategy in ("adaptive", "gallop"):
+        time, optimal, obj, sol, travel = adaptive_search(solver, instance, variables, timeout, shared_list, bound, initial, strategy == "gallop", trace)
+    elif strategy in ("linear_inc", "binary_inc"):
+        time, optimal, obj, sol, travel = incremental_search(solver, instance, variables, timeout, shared_list, implied_constraints, bound, initial, strategy[:-4])
 
     return time, optimal, obj, sol, travel
 
@@ -62,17 +124,96 @@ def display(orders, distances_bin, obj_value, assignments, show = True):
 
     return distances, tot_s
 
-def linear_search(solver, instance, variables, timeout, shared_list, implied_constraints):
+def pack_literals(variables):
+    # the a, t and distance literals packed in 64 bit words, so that a model is read with one
+    # evaluate call per word instead of one per literal
+    matrices = variables[:3]
+    one, zero = BitVecVal(1, 1), BitVecVal(0, 1)
+    bits = [If(v, one, zero) for matrix in matrices for row in matrix for v in row]
+    bits += [zero] * (-len(bits) % 64)
+    words = [Concat(bits[k:k + 64]) for k in range(0, len(bits), 64)]
+    return words, [(len(matrix), len(matrix[0])) for matrix in matrices]
+
+def incumbent_extractor(variables, instance):
+    # objective, routes and distances of a model, the words are only built for the first model
+    packed = []
+
+    def extract(model):
+        if not packed:
+            packed.extend(pack_literals(variables))
+        words, shapes = packed
+        values = np.array([model.evaluate(word, model_completion=True).as_long() for word in words], dtype=">u8")
+        bits = np.unpackbits(values.view(np.uint8)).astype(bool)
+        a, t, dist = np.split(bits, np.cumsum([rows * columns for rows, columns in shapes]))[:3]
+        a, t, dist = (matrix.reshape(shape) for matrix, shape in zip((a, t, dist), shapes))
+        distances = dist.dot(1 << np.arange(dist.shape[1])[::-1])
+        # items grouped by courier and sorted by position
+        courier = a.argmax(axis=0)
+        order = np.lexsort((t.argmax(axis=1), courier))
+        routes = np.split(order + 1, np.cumsum(np.bincount(courier, minlength=instance.m))[:-1])
+        distances, tot_s = instance.invert_sort_weight([int(d) for d in distances], [route.tolist() for route in routes])
+        return max(distances), tot_s, distances
+
+    return extract
+
+def checked_incumbent(solver, extract_incumbent, *assumptions):
+    # check that a bound watcher can interrupt, and the incumbent of the model when SAT; an interrupt
+    # landing right after the check cancels the evaluation, the check is then repeated
+    while True:
+        status = z3_checks.check(solver, *assumptions)
+        if status != sat:
+            return status, None
+        try:
+            return status, extract_incumbent(solver.model())
+        except Z3Exception:
+            print("Model evaluation canceled by an interrupt, checking again")
+
+def initial_routes(instance, initial):
+    # routes and distances of the starting solution, in the original order of the couriers
+    n = instance.n
+    D = instance.D
+    distances = []
+    for route in initial["sol"]:
+        nodes = [n] + [j - 1 for j in route] + [n]
+        distances.append(int(sum(D[i][j] for i, j in zip(nodes, nodes[1:]))))
+    return [list(route) for route in initial["sol"]], distances
+
+def set_phase_hints(solver, instance, a, t, initial):
+    # guide the first descent towards the starting solution, when z3 supports it
+    if not hasattr(solver, "set_initial_value"):
+        return
+    try:
+        for i in range(instance.m):
+            courier = instance.courier_sort_weight_dict[i] if instance.courier_sort_weight_dict else i
+            route = initial["sol"][courier]
+            for j in range(instance.n):
+                solver.set_initial_value(a[i][j], BoolVal(j + 1 in route))
+            for position, item in enumerate(route):
+                if position < len(t[item - 1]):
+                    for k in range(len(t[item - 1])):
+                        solver.set_initial_value(t[item - 1][k], BoolVal(k == position))
+    except Z3Exception as e:
+        # some z3 builds only take initial values on the SMT core, the initial bound is still used
+        print(f"Phase hints not supported: {e}")
+
+def shared_upper_bound(bound, upper_bound):
+    # tightest bound between the own one and the best objective shared by the other engines
+    if bound is None:
+        return upper_bound
+    return min(upper_bound, bound.consume() - 1)
+
+def linear_search(solver, instance, variables, timeout, shared_list, implied_constraints, bound=None, initial=None, trace=None):
     start_time = T.time()
     a, t, distances, _, _ = variables
-    m = instance.m
-    n = instance.n
-    max_Distance_Binary = num_bits(instance.upper_bound)
+    extract_incumbent = incumbent_extractor(variables, instance)
     lower_bound = instance.lower_bound
     upper_bound = instance.upper_bound
     last_model = None
     objective_value = None
     optimal = True
+    if initial is not None:
+        # only solutions better than the starting one are searched
+        upper_bound = initial["obj"] - 1
     solver.push()
     flag = True
     count = 0
@@ -81,21 +222,31 @@ def linear_search(solver, instance, variables, timeout, shared_list, implied_con
     solver.add(All_Less_bin(distances, upper_bound_bin))
     lower_bound_bin = int_to_binary(lower_bound, num_bits(lower_bound), BoolVal)
     solver.add(At_LeastOne_Greater_bin(distances, lower_bound_bin))
-    while flag:
-        status = solver.check()
+    while flag and upper_bound >= lower_bound:
+        if shared_upper_bound(bound, upper_bound) < upper_bound:
+            upper_bound = shared_upper_bound(bound, upper_bound)
+            if upper_bound < lower_bound:
+                # the shared incumbent already reaches the lower bound
+                bound.prove()
+                break
+            print(f"Bound tightened by another engine: obj_val <= {upper_bound}")
+            solver.pop()
+            solver.push()
+            solver.add(All_Less_bin(distances, int_to_binary(upper_bound, num_bits(upper_bound), BoolVal)))
+        probe_time = T.time()
+        status, incumbent = checked_incumbent(solver, extract_incumbent)
+        trace_probe(trace, upper_bound, lower_bound, upper_bound, status, probe_time)
         if status == sat:
             count += 1
-            model = solver.model()
-            last_model = model
+            last_model = incumbent
+            objective_value = last_model[0]
             current_time = T.time()
             past_time = int((current_time - start_time))
             solver.set('timeout', (timeout - past_time) * 1000)
-            objective_value = -1
-            for i in range(len(distances)):
-                dist = binary_to_int([1 if model.evaluate(distances[i][j]) else 0 for j in range(max_Distance_Binary)])
-                objective_value = max(objective_value, dist)
 
             print(f"This model obtained objective value: {objective_value}")
+            if bound is not None:
+                bound.offer(objective_value)
 
             if objective_value <= lower_bound:
                 break
@@ -108,28 +259,28 @@ def linear_search(solver, instance, variables, timeout, shared_list, implied_con
 
             solver.add(All_Less_bin(distances, upper_bound_bin))
             
-            a_eval = [[model.evaluate(a[i][j]) for j in range(n)] for i in range(m)]
-            if implied_constraints:
-                t_eval = [[model.evaluate(t[j][k]) for k in range(n // m + 1)] for j in range(n)]
-            else:
-                t_eval = [[model.evaluate(t[j][k]) for k in range(n)] for j in range(n)]
-                
-            dist_eval = [[model.evaluate(distances[i][b]) for b in range(max_Distance_Binary)] for i in range(m)]
-            distances_1, tot_s = display(t_eval, dist_eval, objective_value, a_eval, False)
-            distances_1, tot_s = instance.invert_sort_weight(distances_1, tot_s)
+            _, tot_s, distances_1 = last_model
             current_time = T.time()
             past_time = current_time - start_time
             shared_list.append((int(past_time), optimal, objective_value, tot_s, distances_1))
 
         elif status == unsat:
-            if count == 0:
+            if bound is not None:
+                # nothing is better than the tightest bound, whoever found it
+                bound.prove()
+            if count == 0 and initial is None:
                 print("UNSAT")
                 current_time = T.time()
                 past_time = int((current_time - start_time))
                 return past_time, False, "N/A", [], []
             flag = False
         elif status == unknown:
-            if count == 0:
+            past_time = int(T.time() - start_time)
+            if timeout - (T.time() - start_time) >= 1:
+                # interrupted (by a better incumbent of another engine) while time remains: checked again
+                solver.set('timeout', (timeout - past_time) * 1000)
+                continue
+            if count == 0 and initial is None:
                 print("UNKNOWN RESULT for insufficient time")
                 return timeout, False, "N/A", [], []
             else:
@@ -137,17 +288,19 @@ def linear_search(solver, instance, variables, timeout, shared_list, implied_con
             flag = False
             optimal = False
 
+    if last_model is None and initial is not None:
+        # nothing better than the starting solution was found
+        sol, travel = initial_routes(instance, initial)
+        past_time = timeout if time_flag == timeout else int(T.time() - start_time)
+        return past_time, optimal, initial["obj"], sol, travel
+    if last_model is None:
+        current_time = T.time()
+        return int(current_time - start_time), False, "N/A", [], []
+    if bound is not None and bound.get() < objective_value:
+        # the proof (if any) is about the incumbent of another engine
+        optimal = False
 
-
-    model = last_model
-    a = [[model.evaluate(a[i][j]) for j in range(n)] for i in range(m)]
-    if implied_constraints:
-        t = [[model.evaluate(t[j][k]) for k in range(n // m + 1)] for j in range(n)]
-    else:
-        t = [[model.evaluate(t[j][k]) for k in range(n)] for j in range(n)]
-    dist = [[model.evaluate(distances[i][b]) for b in range(max_Distance_Binary)] for i in range(m)]
-    distances, tot_s = display(t, dist, objective_value, a, False)
-    distances, tot_s = instance.invert_sort_weight(distances, tot_s)
+    _, tot_s, distances = last_model
     current_time = T.time()
     past_time = current_time - start_time
     if time_flag == timeout:
@@ -155,12 +308,10 @@ def linear_search(solver, instance, variables, timeout, shared_list, implied_con
 
     return int(past_time), optimal, objective_value, tot_s, distances
 
-def binary_search(solver, instance, variables, timeout, shared_list, implied_constraints):
+def binary_search(solver, instance, variables, timeout, shared_list, implied_constraints, bound=None, initial=None, trace=None):
     start_time = T.time()
     a, t, distances, _, encode_time = variables
-    m = instance.m
-    n = instance.n
-    D = instance.D
+    extract_incumbent = incumbent_extractor(variables, instance)
     max_Distance_Binary = num_bits(instance.upper_bound)
 
     upper_bound = instance.upper_bound
@@ -169,6 +320,9 @@ def binary_search(solver, instance, variables, timeout, shared_list, implied_con
     optimal = True
     time_flag = 0
     last_model = None
+    if initial is not None:
+        # only solutions better than the starting one are searched
+        upper_bound = initial["obj"] - 1
 
     upper_bound_bin = int_to_binary(upper_bound, max_Distance_Binary, BoolVal)
 
@@ -179,8 +333,13 @@ def binary_search(solver, instance, variables, timeout, shared_list, implied_con
     solver.push()
     count = 0
     flag = True
-    binary_section = 1
     while lower_bound <= upper_bound and flag:
+        if shared_upper_bound(bound, upper_bound) < upper_bound:
+            upper_bound = shared_upper_bound(bound, upper_bound)
+            print(f"Bound tightened by another engine: obj_val <= {upper_bound}")
+            if lower_bound > upper_bound:
+                break
+            upper_bound_bin = int_to_binary(upper_bound, num_bits(upper_bound), BoolVal)
         if upper_bound - lower_bound <= 1:
             mid = (lower_bound + upper_bound) // 2
             mid_bin = int_to_binary(mid, num_bits(mid), BoolVal)
@@ -195,17 +354,16 @@ def binary_search(solver, instance, variables, timeout, shared_list, implied_con
         current_time = T.time()
         past_time = int(current_time - start_time)
         solver.set('timeout', (timeout - past_time) * 1000)
-        status = solver.check()
+        status, incumbent = checked_incumbent(solver, extract_incumbent)
+        trace_probe(trace, mid, lower_bound, upper_bound, status, current_time)
         if status == sat:
             count += 1
-            model = solver.model()
-            last_model = model
-            objective_value = -1
-            for i in range(m):
-                dist = binary_to_int([1 if model.evaluate(distances[i][j]) else 0 for j in range(max_Distance_Binary)])
-                objective_value = max(objective_value, dist)
+            last_model = incumbent
+            objective_value = last_model[0]
 
             print(f"This model obtained objective value: {objective_value} ")
+            if bound is not None:
+                bound.offer(objective_value)
 
             if objective_value <= 1:
                 break
@@ -213,22 +371,13 @@ def binary_search(solver, instance, variables, timeout, shared_list, implied_con
             upper_bound = objective_value - 1
             upper_bound_bin = int_to_binary(upper_bound, num_bits(upper_bound), BoolVal)
             
-            a_eval = [[model.evaluate(a[i][j]) for j in range(n)] for i in range(m)]
-            if implied_constraints:
-                t_eval = [[model.evaluate(t[j][k]) for k in range(n // m + 1)] for j in range(n)]
-            else:
-                t_eval = [[model.evaluate(t[j][k]) for k in range(n)] for j in range(n)]
-            dist_eval = [[model.evaluate(distances[i][b]) for b in range(max_Distance_Binary)] for i in range(m)]
-            distances_1, tot_s = display(t_eval, dist_eval, objective_value, a_eval, False)
-            distances_1, tot_s = instance.invert_sort_weight(distances_1, tot_s)
+            _, tot_s, distances_1 = last_model
             current_time = T.time()
             past_time = current_time - start_time
             shared_list.append((int(past_time), False, objective_value, tot_s, distances_1))
         elif status == unsat:
-            if count == 0:
-                binary_section = 2
-                
-            if count == 1 and binary_section == 2:
+            if mid >= upper_bound and last_model is None and initial is None:
+                # not even the upper bound can be reached
                 print("UNSAT")
                 past_time = int((current_time - start_time))
                 return past_time, False, "N/A", [], []
@@ -239,13 +388,17 @@ def binary_search(solver, instance, variables, timeout, shared_list, implied_con
             lower_bound_bin = int_to_binary(lower_bound, num_bits(lower_bound), BoolVal)
         
         elif status == unknown:
-            if count == 0:
+            past_time = int(T.time() - start_time)
+            if timeout - (T.time() - start_time) >= 1:
+                # interrupted (by a better incumbent of another engine) while time remains: checked again
+                pass
+            elif count == 0 and initial is None:
                 print("UNKNOWN RESULT for insufficient time")
                 return timeout, False, "N/A", [], []
             else:
                 time_flag = timeout
-            flag = False
-            optimal = False
+                flag = False
+                optimal = False
 
         solver.pop()
         solver.push()
@@ -253,15 +406,21 @@ def binary_search(solver, instance, variables, timeout, shared_list, implied_con
         solver.add(At_LeastOne_Greater_bin(distances, lower_bound_bin))
 
 
-    model = last_model
-    a = [[model.evaluate(a[i][j]) for j in range(n)] for i in range(m)]
-    if implied_constraints:
-        t = [[model.evaluate(t[j][k]) for k in range(n//m + 1)] for j in range(n)]
-    else:
-        t = [[model.evaluate(t[j][k]) for k in range(n)] for j in range(n)]
-    dist = [[model.evaluate(distances[i][b]) for b in range(max_Distance_Binary)] for i in range(m)]
-    distances, tot_s = display(t, dist, objective_value, a, False)
-    distances, tot_s = instance.invert_sort_weight(distances, tot_s)
+    if bound is not None and optimal:
+        # the search interval is closed: nothing is better than the tightest bound, whoever found it
+        bound.prove()
+    if last_model is None and initial is not None:
+        # nothing better than the starting solution was found
+        sol, travel = initial_routes(instance, initial)
+        past_time = timeout if time_flag == timeout else int(T.time() - start_time)
+        return past_time, optimal, initial["obj"], sol, travel
+    if last_model is None:
+        current_time = T.time()
+        return int(current_time - start_time), False, "N/A", [], []
+    if bound is not None and bound.get() < objective_value:
+        optimal = False
+
+    _, tot_s, distances = last_model
     current_time = T.time()
     past_time = current_time - start_time
     if time_flag == timeout:
@@ -270,22 +429,183 @@ def binary_search(solver, instance, variables, timeout, shared_list, implied_con
     return int(past_time), optimal, objective_value, tot_s, distances
 
 
-def constraints(instance, solver, sym_breaking, implied_constraints):
-
+def trace_probe(trace, probe, lower_bound, upper_bound, status, probe_start):
+    # one entry per solver call: the probed bound, the interval it was taken from, answer and time
+    if trace is not None:
+        trace.append({"probe": int(probe), "lower_bound": int(lower_bound), "upper_bound": int(upper_bound),
+                      "status": str(status), "time": round(T.time() - probe_start, 3)})
+
+def save_trace(trace, trace_file):
+    os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+    with open(trace_file, "w") as f:
+        json.dump(trace, f, indent=1)
+
+def adaptive_pivot(lower_bound, upper_bound, sat_times, unsat_times):
+    # the probe is moved towards the incumbent when the UNSAT answers are the expensive ones, so that
+    # the next answer is more likely SAT, and towards the lower bound in the opposite case
+    fraction = 0.5
+    if sat_times and unsat_times:
+        ratio = np.mean(unsat_times[-3:]) / max(np.mean(sat_times[-3:]), 1e-3)
+        fraction = min(0.9, max(0.1, ratio / (1 + ratio)))
+    return lower_bound + int(fraction * (upper_bound - lower_bound))
+
+def adaptive_search(solver, instance, variables, timeout, shared_list, bound=None, initial=None, galloping=False, trace=None):
+    # binary search with a pivot skewed by the cost of the SAT and UNSAT answers, optionally preceded
+    # by exponential steps from the lower bound until the first SAT answer
+    start_time = T.time()
+    distances = variables[2]
+    extract_incumbent = incumbent_extractor(variables, instance)
+    lower_bound = instance.lower_bound
+    upper_bound = instance.upper_bound
+    if initial is not None:
+        # only solutions better than the starting one are searched
+        upper_bound = initial["obj"] - 1
+    solver.add(At_LeastOne_Greater_bin(distances, int_to_binary(lower_bound, num_bits(lower_bound), BoolVal)))
+
+    sat_times = []
+    unsat_times = []
+    step = 1
+    last_model = None
+    timed_out = False
+    while lower_bound <= upper_bound:
+        if shared_upper_bound(bound, upper_bound) < upper_bound:
+            upper_bound = shared_upper_bound(bound, upper_bound)
+            print(f"Bound tightened by another engine: obj_val <= {upper_bound}")
+            continue
+        past_time = T.time() - start_time
+        if past_time >= timeout:
+            timed_out = True
+            break
+        if galloping and last_model is None:
+            probe = min(lower_bound + step - 1, upper_bound)
+        else:
+            probe = adaptive_pivot(lower_bound, upper_bound, sat_times, unsat_times)
+        print(f"Trying with bounds: [{lower_bound}, {upper_bound}] and try obj_val <= {probe}")
+        solver.push()
+        solver.add(All_Less_bin(distances, int_to_binary(probe, num_bits(probe), BoolVal)))
+        solver.set('timeout', int((timeout - past_time) * 1000))
+        probe_time = T.time()
+        status, incumbent = checked_incumbent(solver, extract_incumbent)
+        trace_probe(trace, probe, lower_bound, upper_bound, status, probe_time)
+        if status == sat:
+            sat_times.append(T.time() - probe_time)
+            last_model = incumbent
+            objective_value, tot_s, distances_1 = last_model
+            print(f"This model obtained objective value: {objective_value}")
+            if bound is not None:
+                bound.offer(objective_value)
+            # straight to the distance of the model, it can be well below the probe
+            upper_bound = objective_value - 1
+            shared_list.append((int(T.time() - start_time), False, objective_value, tot_s, distances_1))
+        elif status == unsat:
+            unsat_times.append(T.time() - probe_time)
+            lower_bound = probe + 1
+            step *= 2
+        solver.pop()
+        if status == unknown:
+            if timeout - (T.time() - start_time) >= 1:
+                # interrupted (by a better incumbent of another engine) while time remains: checked again
+                continue
+            timed_out = True
+            break
+
+    # the search interval is closed unless the time ran out
+    optimal = not timed_out
+    if bound is not None and optimal:
+        bound.prove()
+    past_time = timeout if timed_out else int(T.time() - start_time)
+    if last_model is None and initial is not None:
+        sol, travel = initial_routes(instance, initial)
+        return past_time, optimal, initial["obj"], sol, travel
+    if last_model is None:
+        return past_time, False, "N/A", [], []
+    objective_value, tot_s, distances = last_model
+    if bound is not None and bound.get() < objective_value:
+        # the proof (if any) is about the incumbent of another engine
+        optimal = False
+    return past_time, optimal, objective_value, tot_s, distances
+
+def bound_assumptions(ub_bits, value):
+    # literals fixing the symbolic bound to value
+    return [b if bit else Not(b) for b, bit in zip(ub_bits, int_to_binary(value, len(ub_bits), bool))]
+
+def incremental_search(solver, instance, variables, timeout, shared_list, implied_constraints, bound=None, initial=None, strategy="linear"):
+    # the bound on the distances is encoded once against symbolic bits, every probe fixes them
+    # with assumptions, so that the learned clauses are kept across all the linear/binary steps
     start_time = T.time()
+    a, t, distances, _, _ = variables
+    extract_incumbent = incumbent_extractor(variables, instance)
+    max_Distance_Binary = num_bits(instance.upper_bound)
+
+    lower_bound = instance.lower_bound
+    upper_bound = instance.upper_bound
+    if initial is not None:
+        # only solutions better than the starting one are searched
+        upper_bound = initial["obj"] - 1
+
+    ub_bits = [Bool(f"obj_ub_{k}") for k in range(max_Distance_Binary)]
+    solver.add(All_Less_bin(distances, ub_bits))
+    lower_bound_bin = int_to_binary(lower_bound, num_bits(lower_bound), BoolVal)
+    solver.add(At_LeastOne_Greater_bin(distances, lower_bound_bin))
+
+    last_model = None
+    objective_value = None
+    timed_out = False
+    while lower_bound <= upper_bound:
+        if shared_upper_bound(bound, upper_bound) < upper_bound:
+            upper_bound = shared_upper_bound(bound, upper_bound)
+            print(f"Bound tightened by another engine: obj_val <= {upper_bound}")
+            continue
+        past_time = T.time() - start_time
+        if past_time >= timeout:
+            timed_out = True
+            break
+        probe = upper_bound if strategy == "linear" else (lower_bound + upper_bound) // 2
+        print(f"Trying with bounds: [{lower_bound}, {upper_bound}] and try obj_val <= {probe}")
+        solver.set('timeout', int((timeout - past_time) * 1000))
+        status, incumbent = checked_incumbent(solver, extract_incumbent, *bound_assumptions(ub_bits, probe))
+        if status == sat:
+            last_model = incumbent
+            objective_value, tot_s, distances_1 = last_model
+            print(f"This model obtained objective value: {objective_value}")
+            if bound is not None:
+                bound.offer(objective_value)
+            upper_bound = objective_value - 1
+
+            shared_list.append((int(T.time() - start_time), False, objective_value, tot_s, distances_1))
+        elif status == unsat:
+            lower_bound = probe + 1
+        else:
+            if timeout - (T.time() - start_time) >= 1:
+                # interrupted (by a better incumbent of another engine) while time remains: checked again
+                continue
+            timed_out = True
+            break
+
+    # the search interval is closed unless the time ran out
+    optimal = not timed_out
+    if bound is not None and optimal:
+        bound.prove()
+    past_time = timeout if timed_out else int(T.time() - start_time)
+    if last_model is None and initial is not None:
+        sol, travel = initial_routes(instance, initial)
+        return past_time, optimal, initial["obj"], sol, travel
+    if last_model is None:
+        return past_time, False, "N/A", [], []
+    if bound is not None and bound.get() < objective_value:
+        # the proof (if any) is about the incumbent of another engine
+        optimal = False
+    return past_time, optimal, objective_value, tot_s, distances_1
+
+def encoding_variables(instance, implied_constraints):
+    # the variables of the encoding read by the searches, z3 identifies them by name
     m = instance.m
     n = instance.n
-    s = instance.s
-    l = instance.l
-    D = instance.D
-
-    max_weight_Binary = num_bits(max(l))
+    max_weight_Binary = num_bits(max(instance.l))
     max_Distance_Binary = num_bits(instance.upper_bound)
 
     # a_ij = True indicates that courier i delivers object j
     a = [[Bool(f"a_{i}_{j}") for j in range(n)] for i in range(m)]
-    # x_ijk = 1 indicates that courier i moves from delivery point j to delivery point k in his route
-    x = [[[Bool(f"x_{i}_{j}_{k}") for k in range(n + 1)] for j in range(n + 1)] for i in range(m)]
     # t_jk == 1 iff object j is delivered as k-th in its courier's route
     if implied_constraints:
         t = [[Bool(f"deliver_{j}_as_{k}-th") for k in range(n // m + 1)] for j in range(n)]
@@ -293,23 +613,105 @@ def constraints(instance, solver, sym_breaking, implied_constraints):
         t = [[Bool(f"deliver_{j}_as_{k}-th") for k in range(n)] for j in range(n)]
     # w_i = binary representation of actual load carried by each courier
     w = [[Bool(f"cl_{i}_{k}") for k in range(max_weight_Binary)] for i in range(m)]
-    # flatten D
-    flat_D = flatten_matrix(D)
-    flat_D_bin = [int_to_binary(e, num_bits(e) if e > 0 else 1, BoolVal) for e in flat_D]
     #  distances[i] := binary representation of the distance travelled by courier i
     distances = [[Bool(f"dist_bin_{i}_{k}") for k in range(max_Distance_Binary)] for i in range(m)]
+    return a, t, w, distances
+
+def encoding_cache_file(instance, sym_breaking, implied_constraints, sparse_k=None, formulation="three_index"):
+    # the cache is keyed by the content of the instance, not by its file name
+    key = [ENCODING_VERSION, instance.m, instance.n, [int(e) for e in instance.l], [int(e) for e in instance.s],
+           instance.D.tolist(), sym_breaking, implied_constraints]
+    if sparse_k is not None:
+        key.append(sparse_k)
+    if formulation != "three_index":
+        key.append(formulation)
+    key = json.dumps(key)
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + ".smt2")
+
+def cached_constraints(instance, solver, sym_breaking, implied_constraints, sparse_k=None, formulation="three_index"):
+    # the base encoding of an (instance, sym, implied) triple is built once and saved as SMT-LIB,
+    # later runs and strategies only parse it back
+    start_time = T.time()
+    cache_file = encoding_cache_file(instance, sym_breaking, implied_constraints, sparse_k, formulation)
+    if os.path.exists(cache_file):
+        solver.from_file(cache_file)
+        if sym_breaking:
+            instance.sort_weight()
+        a, t, w, distances = encoding_variables(instance, implied_constraints)
+        solver.push()
+        encode_time = int(T.time() - start_time)
+        print(f"Encoding loaded from {cache_file} at time {encode_time}s, now start solving/optimization search")
+        return a, t, distances, w, encode_time
+
+    if formulation == "two_index":
+        a, t, distances, w, _ = two_index_constraints(instance, solver, sym_breaking, implied_constraints, sparse_k)
+    else:
+        a, t, distances, w, _ = constraints(instance, solver, sym_breaking, implied_constraints, sparse_k)
+    # the encoding time is read before saving, writing the cache is not part of the encoding
+    encode_time = int(T.time() - start_time)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # concurrent configurations may write the same entry: write aside and rename
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        f.write(solver.sexpr())
+    os.replace(tmp_file, cache_file)
+    return a, t, distances, w, encode_time
+
+def adaptive_k(n):
+    # number of neighbours kept per node when none is given
+    return max(8, math.ceil(2 * math.sqrt(n)))
+
+def candidate_arcs(instance, k):
+    # arcs (j, h) of the sparse model, n being the origin: from j to its k nearest nodes, to j from
+    # its k nearest nodes, and all the arcs from and to the origin
+    n = instance.n
+    D = instance.D
+    arcs = set()
+    for j in range(n + 1):
+        arcs.update((j, int(h)) for h in [h for h in np.argsort(D[j], kind="stable") if h != j][:k])
+        arcs.update((int(h), j) for h in [h for h in np.argsort(D[:, j], kind="stable") if h != j][:k])
+    arcs.update((n, j) for j in range(n))
+    arcs.update((j, n) for j in range(n))
+    return sorted(arcs)
+
+def courier_arcs(instance, solver, a, sparse_k):
+    # arcs[i] := arcs that courier i can travel, all of them but the loops in the dense model
+    m = instance.m
+    n = instance.n
+    if sparse_k is None:
+        return [[(j, k) for j in range(n + 1) for k in range(n + 1) if j != k] for i in range(m)]
+    # the items heavier than the capacity of a courier and their arcs are pruned too
+    sparse_arcs = candidate_arcs(instance, sparse_k)
+    arcs = []
+    for i in range(m):
+        allowed = [instance.s[j] <= instance.l[i] for j in range(n)] + [True]
+        arcs.append([(j, k) for j, k in sparse_arcs if allowed[j] and allowed[k]])
+        solver.add(allfalse([a[i][j] for j in range(n) if not allowed[j]]))
+    return arcs
+
+def assignment_constraints(instance, solver, sym_breaking, a, t, w):
+    # constraints shared by both formulations: symmetry breaking, assignment, loads and positions
+    m = instance.m
+    n = instance.n
+    s = instance.s
+    l = instance.l
 
     if sym_breaking:
-        # sort l
+        # couriers in the canonical order of the symmetry analysis, sort l
         instance.sort_weight()
         l = instance.l
+        symmetry = instance.symmetry
         # lexicographic ordering between the paths of two couriers with same load capacity
-        for i in range(m - 1):
-            if l[i] == l[i+1]:
-                solver.add(less(a[i], a[i+1]))
-            else:
-                # l[i] > l[i+1]
-                solver.add(less(w[i+1], w[i]))
+        for i, k in symmetry.interchangeable:
+            solver.add(less(a[i], a[k]))
+        # l[i] > l[k]: the bigger courier carries the heavier load
+        for i, k in symmetry.dominated:
+            solver.add(less(w[k], w[i]))
+        # identical items are delivered in index order when they share the route
+        for j, h in symmetry.identical_items:
+            for i in range(m):
+                for p in range(len(t[h])):
+                    solver.add(Or([Not(a[i][j]), Not(a[i][h]), Not(t[h][p])] + t[j][:p]))
 
     l_bin = [[BoolVal(b) for b in int_to_binary(l[i], length=num_bits(l[i]))] for i in range(m)]
     s_bin = [[BoolVal(b) for b in int_to_binary(s[j], length=num_bits(s[j]))] for j in range(n)]
@@ -327,39 +729,137 @@ def constraints(instance, solver, sym_breaking, implied_constraints):
     for i in range(n):
         solver.add(exactly_one(t[i], f"time_of_{i}"))
 
+def constraints(instance, solver, sym_breaking, implied_constraints, sparse_k=None):
+
+    start_time = T.time()
+    m = instance.m
+    n = instance.n
+    D = instance.D
+
+    a, t, w, distances = encoding_variables(instance, implied_constraints)
+    assignment_constraints(instance, solver, sym_breaking, a, t, w)
+    arcs = courier_arcs(instance, solver, a, sparse_k)
+    # x_ijk = 1 indicates that courier i moves from delivery point j to delivery point k in his route
+    x = [{(j, k): Bool(f"x_{i}_{j}_{k}") for j, k in arcs[i]} for i in range(m)]
+
     # Constraint 
     for i in range(m):
-        # can't leave from j to go to j
-        solver.add(And([Not(x[i][j][j]) for j in range(n+1)]))
-        
+        leaves = [[] for j in range(n + 1)]
+        reaches = [[] for j in range(n + 1)]
+        for j, k in arcs[i]:
+            leaves[j].append(x[i][j, k])
+            reaches[k].append(x[i][j, k])
+
         # row j has a 1 iff courier i delivers item j
         for j in range(n):
-            solver.add(Implies(a[i][j], exactly_one(x[i][j], f"courier_{i}_leaves_{j}")))
-            solver.add(Implies(Not(a[i][j]), allfalse(x[i][j])))
+            solver.add(Implies(a[i][j], exactly_one(leaves[j], f"courier_{i}_leaves_{j}")))
+            solver.add(Implies(Not(a[i][j]), allfalse(leaves[j])))
             
-        solver.add(exactly_one(x[i][n], f"courier_{i}_leaves_origin")) # courier i leaves from origin
+        solver.add(exactly_one(leaves[n], f"courier_{i}_leaves_origin")) # courier i leaves from origin
         # column j has a 1 iff courier i delivers object j
         for k in range(n):
-            solver.add(Implies(a[i][k], exactly_one([x[i][j][k] for j in range(n + 1)], f"courier_{i}_reaches_{k}")))
-            solver.add(Implies(Not(a[i][k]), allfalse([x[i][j][k] for j in range(n + 1)])))
+            solver.add(Implies(a[i][k], exactly_one(reaches[k], f"courier_{i}_reaches_{k}")))
+            solver.add(Implies(Not(a[i][k]), allfalse(reaches[k])))
             
         
-        solver.add(exactly_one([x[i][j][n] for j in range(n + 1)], f"courier_{i}_returns_to_origin")) #courier i returns to origin
+        solver.add(exactly_one(reaches[n], f"courier_{i}_returns_to_origin")) #courier i returns to origin
 
         # use ordering between t_j and t_k in every edge travelled
         # in order to avoid loops not containing the origin
-        for j in range(n):
-            for k in range(n):
-                solver.add(Implies(x[i][j][k], consecutive(t[j], t[k])))
-            solver.add(Implies(x[i][n][j], t[j][0]))
-
-    # flatten x
-    flat_x = [flatten_matrix(x[i]) for i in range(m)]
+        for j, k in arcs[i]:
+            if j < n and k < n:
+                solver.add(Implies(x[i][j, k], consecutive(t[j], t[k])))
+            elif j == n:
+                solver.add(Implies(x[i][j, k], t[k][0]))
 
     # definition of distances using constraints
     for i in range(m):
-        solver.add(conditional_sum(flat_x[i], flat_D_bin, distances[i], f"distances_def_{i}"))
+        D_bin = [int_to_binary(D[j][k], num_bits(D[j][k]) if D[j][k] > 0 else 1, BoolVal) for j, k in arcs[i]]
+        solver.add(conditional_sum([x[i][arc] for arc in arcs[i]], D_bin, distances[i], f"distances_def_{i}"))
+
+
+    solver.push()
+    encoding_time = T.time()
+    encode_time = int(encoding_time - start_time)
+    print(f"Encoding finished at time {encode_time}s, now start solving/optimization search")
+
+    return a, t, distances, w, encode_time
 
+def two_index_constraints(instance, solver, sym_breaking, implied_constraints, sparse_k=None):
+    # one arc matrix shared by all the couriers: the courier of an arc is the one of its items, and
+    # the distance from the origin is accumulated along the route instead of summed per courier
+    start_time = T.time()
+    m = instance.m
+    n = instance.n
+    D = instance.D
+    max_Distance_Binary = num_bits(instance.upper_bound)
+
+    a, t, w, distances = encoding_variables(instance, implied_constraints)
+    assignment_constraints(instance, solver, sym_breaking, a, t, w)
+    if sparse_k is None:
+        arcs = [(j, k) for j in range(n) for k in range(n) if j != k]
+    else:
+        courier_arcs(instance, solver, a, sparse_k)
+        arcs = [(j, k) for j, k in candidate_arcs(instance, sparse_k) if j < n and k < n]
+    # y_jk = 1 indicates that item k is delivered right after item j, by the same courier
+    y = {(j, k): Bool(f"y_{j}_{k}") for j, k in arcs}
+    # first_ik / last_ik = 1 indicates that item k is the first / last one of courier i
+    first = [[Bool(f"first_{i}_{k}") for k in range(n)] for i in range(m)]
+    last = [[Bool(f"last_{i}_{k}") for k in range(n)] for i in range(m)]
+    # reach_j := binary representation of the distance travelled from the origin up to item j
+    reach = [[Bool(f"reach_{j}_{b}") for b in range(max_Distance_Binary)] for j in range(n)]
+
+    def distance_bin(j, k):
+        return int_to_binary(D[j][k], num_bits(D[j][k]) if D[j][k] > 0 else 1, BoolVal)
+
+    leaves = [[last[i][j] for i in range(m)] for j in range(n)]
+    reaches = [[first[i][k] for i in range(m)] for k in range(n)]
+    for j, k in arcs:
+        leaves[j].append(y[j, k])
+        reaches[k].append(y[j, k])
+
+    for i in range(m):
+        # every courier leaves from the origin and returns to it once, with its own items
+        solver.add(exactly_one(first[i], f"courier_{i}_leaves_origin"))
+        solver.add(exactly_one(last[i], f"courier_{i}_returns_to_origin"))
+        for k in range(n):
+            solver.add(Implies(first[i][k], And(a[i][k], t[k][0])))
+            solver.add(Implies(last[i][k], a[i][k]))
+
+    for j in range(n):
+        # every item has one successor and one predecessor, an item or the origin
+        solver.add(exactly_one(leaves[j], f"item_{j}_leaves"))
+        solver.add(exactly_one(reaches[j], f"item_{j}_is_reached"))
+
+    for j, k in arcs:
+        # use ordering between t_j and t_k in every edge travelled
+        # in order to avoid loops not containing the origin
+        solver.add(Implies(y[j, k], consecutive(t[j], t[k])))
+        # both items are delivered by the same courier
+        for i in range(m):
+            solver.add(Implies(And(y[j, k], a[i][j]), a[i][k]))
+
+    # definition of distances, accumulated along the routes
+    for k in range(n):
+        for i in range(m):
+            d = distance_bin(n, k)
+            if len(d) > max_Distance_Binary:
+                solver.add(Not(first[i][k]))
+            else:
+                solver.add(Implies(first[i][k], equals(reach[k], [BoolVal(False)] * (max_Distance_Binary - len(d)) + d)))
+    for j, k in arcs:
+        d = distance_bin(j, k)
+        if len(d) > max_Distance_Binary:
+            solver.add(Not(y[j, k]))
+        else:
+            solver.add(Implies(y[j, k], sum_bin(d, reach[j], reach[k], f"reach_{j}_{k}")))
+    for i in range(m):
+        for j in range(n):
+            d = distance_bin(j, n)
+            if len(d) > max_Distance_Binary:
+                solver.add(Not(last[i][j]))
+            else:
+                solver.add(Implies(last[i][j], sum_bin(d, reach[j], distances[i], f"return_{i}_{j}")))
 
     solver.push()
     encoding_time = T.time()
@@ -0,0 +1,81 @@
+import os
+import sys
+import csv
+import argparse
+import multiprocessing
+import time as T
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SAT.SAT_handler import load_instance
+from SAT.CNF_model import cnf_constraints, cnf_search, make_backend, find_backend
+
+# (load encoding, distance encoding): every encoding is compared against the adder on the other sum
+benchmark_encodings = [
+    ("adder", "adder"),
+    ("sorter", "adder"),
+    ("totalizer", "adder"),
+    ("swc", "adder"),
+    ("bdd", "adder"),
+    ("adder", "sorter"),
+    ("adder", "totalizer"),
+    ("adder", "swc"),
+]
+
+
+def benchmark_run(result, num_instance, encodings, strategy, timeout, backend):
+    _, instance, _ = load_instance(num_instance)
+    start_time = T.time()
+    cnf, variables = cnf_constraints(instance, False, False, *encodings)
+    result["variables"] = cnf.num_vars
+    result["clauses"] = cnf.num_clauses
+    sat_backend = make_backend(backend, cnf)
+    result["encode_time"] = round(T.time() - start_time, 2)
+    start_time = T.time()
+    try:
+        _, optimal, obj, _, _ = cnf_search(sat_backend, instance, variables, timeout - result["encode_time"], [], None, None, strategy)
+    finally:
+        sat_backend.close()
+    result["solve_time"] = round(T.time() - start_time, 2)
+    result["obj"] = obj
+    result["optimal"] = optimal
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the pseudo-Boolean encodings of the loads and distances of the CNF model.")
+    parser.add_argument("-n", "--num_instance", type=int, default=0, help="Instance number to run (0 for all instances).")
+    parser.add_argument("-t", "--timeout", type=int, default=300, help="Time limit of each run, encoding included.")
+    parser.add_argument("-s", "--strategy", type=str, default="binary", choices=["linear", "binary"])
+    parser.add_argument("-b", "--backend", type=str, default="auto", help="SAT solver, as --sat_backend of solver.py.")
+    parser.add_argument("-o", "--output", type=str, default="encodings_benchmark.csv", help="CSV file of the results.")
+    args = parser.parse_args()
+
+    instances = range(1, 22) if args.num_instance == 0 else [args.num_instance]
+    backend = find_backend(args.backend)
+    fields = ["instance", "load", "distance", "variables", "clauses", "encode_time", "solve_time", "obj", "optimal"]
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        print(" ".join(f"{field:>11}" for field in fields))
+        for i in instances:
+            for encodings in benchmark_encodings:
+                with multiprocessing.Manager() as manager:
+                    result = manager.dict()
+                    process = multiprocessing.Process(target=benchmark_run, args=(result, i, encodings, args.strategy, args.timeout, backend))
+                    process.start()
+                    process.join(timeout=args.timeout)
+                    timed_out = process.is_alive()
+                    if timed_out:
+                        process.terminate()
+                        process.join()
+                    row = {"instance": i, "load": encodings[0], "distance": encodings[1], "variables": "N/A", "clauses": "N/A",
+                           "encode_time": args.timeout, "solve_time": "N/A", "obj": "N/A", "optimal": False}
+                    row.update(result)
+                    if timed_out and "encode_time" in result:
+                        row["solve_time"] = round(args.timeout - result["encode_time"], 2)
+                writer.writerow(row)
+                f.flush()
+                print(" ".join(f"{str(row[field]):>11}" for field in fields))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+from array import array
+from SAT.utils_SAT import int_to_binary, num_bits
+
+
+class CNF:
+    # clauses over integer literals (DIMACS convention), stored flat in an array and separated by 0
+
+    def __init__(self):
+        self.num_vars = 0
+        self.num_clauses = 0
+        self.clauses = array('i')
+        self.true = self.new_var()
+        self.clauses.extend([self.true, 0])
+        self.num_clauses = 1
+
+    def new_var(self):
+        self.num_vars += 1
+        return self.num_vars
+
+    def new_vars(self, count):
+        return [self.new_var() for _ in range(count)]
+
+    def add(self, clause, cond=None):
+        # adds the clause, or (cond -> clause) when a condition literal is given
+        if cond is not None:
+            if cond == -self.true:
+                return
+            if cond != self.true:
+                clause = list(clause) + [-cond]
+        if self.true in clause:
+            return
+        clause = [lit for lit in clause if lit != -self.true]
+        self.clauses.extend(clause)
+        self.clauses.append(0)
+        self.num_clauses += 1
+
+    def constant(self, value):
+        return self.true if value else -self.true
+
+    def is_const(self, lit):
+        return lit == self.true or lit == -self.true
+
+    def dimacs_body(self):
+        # clause lines, without the header
+        return (" ".join(map(str, self.clauses)).replace(" 0 ", " 0\n") + "\n").encode()
+
+    def write_dimacs(self, path, assumptions=()):
+        # assumptions are added as unit clauses
+        with open(path, "wb") as f:
+            f.write(f"p cnf {self.num_vars} {self.num_clauses + len(assumptions)}\n".encode())
+            f.write(self.dimacs_body())
+            for lit in assumptions:
+                f.write(f"{lit} 0\n".encode())
+
+
+# gates: a fresh literal equivalent to the function of the inputs, constants are folded
+
+def and_gate(cnf, lits):
+    lits = list(dict.fromkeys(lits))
+    if -cnf.true in lits:
+        return -cnf.true
+    lits = [lit for lit in lits if lit != cnf.true]
+    if any(-lit in lits for lit in lits):
+        return -cnf.true
+    if len(lits) == 0:
+        return cnf.true
+    if len(lits) == 1:
+        return lits[0]
+    v = cnf.new_var()
+    for lit in lits:
+        cnf.add([-v, lit])
+    cnf.add([v] + [-lit for lit in lits])
+    return v
+
+def or_gate(cnf, lits):
+    return -and_gate(cnf, [-lit for lit in lits])
+
+def iff_gate(cnf, a, b):
+    if a == b:
+        return cnf.true
+    if a == -b:
+        return -cnf.true
+    if cnf.is_const(a):
+        return b if a == cnf.true else -b
+    if cnf.is_const(b):
+        return a if b == cnf.true else -a
+    v = cnf.new_var()
+    cnf.add([-v, -a, b])
+    cnf.add([-v, a, -b])
+    cnf.add([v, a, b])
+    cnf.add([v, -a, -b])
+    return v
+
+def xor_gate(cnf, a, b):
+    return -iff_gate(cnf, a, b)
+
+def ite_gate(cnf, c, t, e):
+    # if c then t else e
+    if c == cnf.true or t == e:
+        return t
+    if c == -cnf.true:
+        return e
+    if cnf.is_const(t) and cnf.is_const(e):
+        return c if t == cnf.true else -c
+    v = cnf.new_var()
+    cnf.add([-c, -t, v])
+    cnf.add([-c, t, -v])
+    cnf.add([c, -e, v])
+    cnf.add([c, e, -v])
+    return v
+
+def majority_gate(cnf, a, b, c):
+    return or_gate(cnf, [and_gate(cnf, [a, b]), and_gate(cnf, [a, c]), and_gate(cnf, [b, c])])
+
+
+# constraints, the same encodings as utils_SAT on integer literals
+
+def binary_constant(cnf, number, length=None):
+    return [cnf.constant(b) for b in int_to_binary(number, length)]
+
+def at_least_one(cnf, lits, cond=None):
+    cnf.add(lits, cond)
+
+def at_most_one(cnf, lits, cond=None):
+    # sequential encoding
+    n = len(lits)
+    if n <= 1:
+        return
+    s = cnf.new_vars(n - 1)
+    cnf.add([-lits[0], s[0]], cond)
+    cnf.add([-lits[n - 1], -s[n - 2]], cond)
+    for i in range(1, n - 1):
+        cnf.add([-lits[i], s[i]], cond)
+        cnf.add([-lits[i], -s[i - 1]], cond)
+        cnf.add([-s[i - 1], s[i]], cond)
+
+def exactly_one(cnf, lits, cond=None):
+    at_least_one(cnf, lits, cond)
+    at_most_one(cnf, lits, cond)
+
+def all_false(cnf, lits, cond=None):
+    for lit in lits:
+        cnf.add([-lit], cond)
+
+def pad(cnf, a, length):
+    # most significant bit first, padded with false bits on the left
+    return [-cnf.true] * (length - len(a)) + list(a)
+
+def less(cnf, a, b, cond=None):
+    # a <= b: no position k where the bits before k are equal, a_k is true and b_k is false
+    length = max(len(a), len(b))
+    a, b = pad(cnf, a, length), pad(cnf, b, length)
+    differ = []
+    for k in range(length):
+        cnf.add(differ + [-a[k], b[k]], cond)
+        differ.append(-iff_gate(cnf, a[k], b[k]))
+
+def less_gate(cnf, a, b):
+    # literal equivalent to a <= b
+    length = max(len(a), len(b))
+    a, b = pad(cnf, a, length), pad(cnf, b, length)
+    greater = []
+    prefix_equal = cnf.true
+    for k in range(length):
+        greater.append(and_gate(cnf, [prefix_equal, a[k], -b[k]]))
+        prefix_equal = and_gate(cnf, [prefix_equal, iff_gate(cnf, a[k], b[k])])
+    return -or_gate(cnf, greater)
+
+def sum_bits(cnf, a, b):
+    # bits of a + b with the width of the widest, and the final carry
+    length = max(len(a), len(b))
+    a, b = pad(cnf, a, length), pad(cnf, b, length)
+    carry = -cnf.true
+    d = [None] * length
+    for k in range(length - 1, -1, -1):
+        d[k] = xor_gate(cnf, xor_gate(cnf, a[k], b[k]), carry)
+        carry = majority_gate(cnf, a[k], b[k], carry)
+    return d, carry
+
+def conditional_sum(cnf, x, alpha, delta, cond=None):
+    # delta = sum_over_j(alpha[j] | x[j] is true), alpha[j] are bit lists
+    digits = len(delta)
+    current = [-cnf.true] * digits
+    for j in range(len(x)):
+        assert len(alpha[j]) <= digits
+        total, carry = sum_bits(cnf, pad(cnf, alpha[j], digits), current)
+        # the sum never overflows the width of delta
+        cnf.add([-x[j], -carry], cond)
+        current = [ite_gate(cnf, x[j], total[k], current[k]) for k in range(digits)]
+    for k in range(digits):
+        cnf.add([-delta[k], current[k]], cond)
+        cnf.add([delta[k], -current[k]], cond)
+
+def consecutive(cnf, v, u, cond=None):
+    # the only true value of v is followed by the only true value of u
+    n = len(v)
+    cnf.add([-u[0]], cond)
+    for i in range(n - 1):
+        cnf.add([-v[i], u[i + 1]], cond)
+        cnf.add([v[i], -u[i + 1]], cond)
+    cnf.add([-v[n - 1]], cond)
+
+def all_less_bin(cnf, distances, upper_bound_bits, cond=None):
+    # forall i. distances[i] <= upper_bound_bits
+    for d in distances:
+        less(cnf, d, upper_bound_bits, cond)
+
+def at_least_one_greater_bin(cnf, distances, lower_bound_bits, cond=None):
+    # exists i. distances[i] >= lower_bound_bits
+    cnf.add([less_gate(cnf, lower_bound_bits, d) for d in distances], cond)
+
+
+# pseudo-Boolean sums sum_j(weights[j] * lits[j]), the inputs fixed to false are dropped
+
+PB_ENCODINGS = ["adder", "sorter", "totalizer", "swc", "bdd"]
+# clauses of a single totalizer or swc sum, see counter_fits
+COUNTER_LIMIT = 1000000
+
+def pb_inputs(cnf, lits, weights):
+    return [(lit, w) for lit, w in zip(lits, weights) if w > 0 and lit != -cnf.true]
+
+def adder_sum(cnf, lits, weights, digits):
+    # chain of ripple-carry adders, as conditional_sum
+    delta = cnf.new_vars(digits)
+    conditional_sum(cnf, lits, [binary_constant(cnf, w) for w in weights], delta)
+    return delta
+
+def comparator(cnf, a, b):
+    # (max, min) of two bits
+    return or_gate(cnf, [a, b]), and_gate(cnf, [a, b])
+
+def odd_even_merge(cnf, a, b):
+    # merges two sorted (true first) sequences of the same power of two length
+    if len(a) == 1:
+        return list(comparator(cnf, a[0], b[0]))
+    even = odd_even_merge(cnf, a[0::2], b[0::2])
+    odd = odd_even_merge(cnf, a[1::2], b[1::2])
+    merged = [even[0]]
+    for i in range(1, len(even)):
+        merged.extend(comparator(cnf, odd[i - 1], even[i]))
+    merged.append(odd[-1])
+    return merged
+
+def sort_bits(cnf, lits):
+    # Batcher's odd-even merge sort, padded with false bits that the gates fold away
+    size = 1
+    while size < len(lits):
+        size *= 2
+    lits = list(lits) + [-cnf.true] * (size - len(lits))
+    if size == 1:
+        return lits
+    return odd_even_merge(cnf, sort_bits(cnf, lits[:size // 2]), sort_bits(cnf, lits[size // 2:]))
+
+def sorter_sum(cnf, lits, weights, digits):
+    # binary merge: the bits of weight 2^b are sorted together with the carries of the previous
+    # position, every second output is carried on and the parity of the count is the b-th bit
+    inputs = pb_inputs(cnf, lits, weights)
+    bits = []
+    carries = []
+    b = 0
+    while carries or any(w >> b for _, w in inputs):
+        column = [lit for lit, w in inputs if (w >> b) & 1] + carries
+        ones = sort_bits(cnf, column) + [-cnf.true]
+        bits.append(or_gate(cnf, [and_gate(cnf, [ones[k], -ones[k + 1]]) for k in range(0, len(ones) - 1, 2)]))
+        carries = [ones[k] for k in range(1, len(ones) - 1, 2) if ones[k] != -cnf.true]
+        b += 1
+    # most significant bit first, the sum can't exceed the given digits
+    for lit in bits[digits:]:
+        cnf.add([-lit])
+    return pad(cnf, bits[:digits][::-1], digits)
+
+def totalizer(cnf, lits, weights, cap):
+    # generalized totalizer: {v: o_v}, o_v is implied when the inputs below the node sum up to v,
+    # sums over cap are merged into cap + 1
+    nodes = [{min(w, cap + 1): lit} for lit, w in pb_inputs(cnf, lits, weights)]
+    if not nodes:
+        return {}
+    while len(nodes) > 1:
+        merged = []
+        for left, right in zip(nodes[0::2], nodes[1::2]):
+            out = {}
+            for value in sorted(set(min(x + y, cap + 1) for x in [0] + list(left) for y in [0] + list(right)) - {0}):
+                out[value] = cnf.new_var()
+            for x, lx in [(0, cnf.true)] + list(left.items()):
+                for y, ly in [(0, cnf.true)] + list(right.items()):
+                    if x + y > 0:
+                        cnf.add([-lx, -ly, out[min(x + y, cap + 1)]])
+            merged.append(out)
+        if len(nodes) % 2:
+            merged.append(nodes[-1])
+        nodes = merged
+    root = nodes[0]
+    # o_v -> o_u for u < v, so that a single output bounds the whole sum
+    values = sorted(root)
+    for u, v in zip(values, values[1:]):
+        cnf.add([-root[v], root[u]])
+    return root
+
+def swc(cnf, lits, weights, cap):
+    # sequential weight counter: s[v] is implied when the inputs seen so far sum up to at least v,
+    # a sum over cap is forbidden
+    s = [cnf.true] + [-cnf.true] * cap
+    seen = 0
+    for lit, w in pb_inputs(cnf, lits, weights):
+        if w > cap:
+            cnf.add([-lit])
+            continue
+        seen = min(seen + w, cap)
+        new = [cnf.true] + cnf.new_vars(seen) + [-cnf.true] * (cap - seen)
+        for v in range(1, seen + 1):
+            cnf.add([-s[v], new[v]])
+            if v <= w:
+                cnf.add([-lit, new[v]])
+            else:
+                cnf.add([-lit, -s[v - w], new[v]])
+        for v in range(cap + 1 - w, cap + 1):
+            cnf.add([-lit, -s[v]])
+        s = new
+    return s
+
+def counter_clauses(weights, cap, encoding):
+    # estimate of the clauses of the counter of one sum, from the number of outputs of its nodes: the
+    # totalizer grows with the square of cap, the swc with the number of inputs times cap
+    weights = [w for w in weights if w > 0]
+    if encoding == "swc":
+        clauses = 0
+        seen = 0
+        for w in weights:
+            seen = min(seen + w, cap)
+            clauses += 2 * seen + w
+        return clauses
+    # (outputs, largest sum) of every node of the totalizer
+    nodes = [(1, min(w, cap + 1)) for w in weights]
+    clauses = 0
+    while len(nodes) > 1:
+        merged = []
+        for (left, left_sum), (right, right_sum) in zip(nodes[0::2], nodes[1::2]):
+            clauses += (left + 1) * (right + 1) - 1
+            total = min(left_sum + right_sum, cap + 1)
+            merged.append((min(total, (left + 1) * (right + 1) - 1), total))
+        if len(nodes) % 2:
+            merged.append(nodes[-1])
+        nodes = merged
+    return clauses
+
+def counter_fits(weights, cap, encoding):
+    # the totalizer and the swc are only worth it on small bounds, like the capacities of the loads;
+    # on the distances, bounded by the sum of whole routes, they can take millions of clauses per
+    # courier, and the callers fall back to the adder beyond COUNTER_LIMIT
+    return counter_clauses(weights, cap, encoding) <= COUNTER_LIMIT
+
+def counter_outputs(cnf, lits, weights, cap, encoding):
+    # ge[v] is implied by a sum of at least v, for v in 0..cap + 1
+    if encoding == "swc":
+        return swc(cnf, lits, weights, cap) + [-cnf.true]
+    root = totalizer(cnf, lits, weights, cap)
+    ge = [cnf.true] + [-cnf.true] * (cap + 1)
+    following = -cnf.true
+    for v in range(cap + 1, 0, -1):
+        following = root.get(v, following)
+        ge[v] = following
+    return ge
+
+def bdd_atmost(cnf, lits, weights, k, cond=None):
+    # BDD of sum <= k with interval reduction: the node (j, [lo, hi]) holds iff the inputs from j on
+    # sum up to at most any value of the interval
+    inputs = pb_inputs(cnf, lits, weights)
+    rest = [0] * (len(inputs) + 1)
+    for j in range(len(inputs) - 1, -1, -1):
+        rest[j] = rest[j + 1] + inputs[j][1]
+    memo = [[] for _ in inputs]
+
+    def node(j, bound):
+        if bound < 0:
+            return -float("inf"), -1, -cnf.true
+        if rest[j] <= bound:
+            return rest[j], float("inf"), cnf.true
+        for lo, hi, lit in memo[j]:
+            if lo <= bound <= hi:
+                return lo, hi, lit
+        lit_j, w = inputs[j]
+        lo0, hi0, low = node(j + 1, bound)
+        lo1, hi1, high = node(j + 1, bound - w)
+        lo, hi = max(lo0, lo1 + w), min(hi0, hi1 + w)
+        if low == high:
+            lit = low
+        else:
+            lit = cnf.new_var()
+            cnf.add([-lit, low])
+            cnf.add([-lit, -lit_j, high])
+        memo[j].append((lo, hi, lit))
+        return lo, hi, lit
+
+    cnf.add([node(0, k)[2]], cond)
+
+def pb_atmost(cnf, lits, weights, k, encoding, cond=None):
+    # sum_j(weights[j] * lits[j]) <= k
+    if encoding == "bdd":
+        bdd_atmost(cnf, lits, weights, k, cond)
+    elif encoding in ("totalizer", "swc") and counter_fits([w for _, w in pb_inputs(cnf, lits, weights)], k, encoding):
+        cnf.add([-counter_outputs(cnf, lits, weights, k, encoding)[k + 1]], cond)
+    else:
+        digits = num_bits(max(1, sum(w for _, w in pb_inputs(cnf, lits, weights))))
+        # a counter too large for k falls back to the adder
+        total = sorter_sum(cnf, lits, weights, digits) if encoding == "sorter" else adder_sum(cnf, lits, weights, digits)
+        less(cnf, total, binary_constant(cnf, k), cond)
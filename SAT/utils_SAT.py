@@ -31,6 +31,8 @@ def at_most_one(bool_vars, name):
     # encoding of "At most one" using sequential encoding
     constraints = []
     n = len(bool_vars)
+    if n <= 1:
+        return BoolVal(True)
     s = [Bool(f"s_{name}_{i}") for i in range(n - 1)]
     constraints.append(Or(Not(bool_vars[0]), s[0]))
     constraints.append(Or(Not(bool_vars[n - 1]), Not(s[n - 2])))
@@ -5,37 +5,70 @@ from SMT.utils import *
 from SMT.constraints import *
 from utils import *
 
-def SMT_Solver(shared_list, m, n, l, s, D, sym_breaking=False, imp_cons=True):
-
-  start_time = time()
-
+def build_model(solver, m, n, l, s, D, sym_breaking, imp_cons, successor, num):
+  # variables and constraints of the position or successor model, shared by every search and backend
   COURIERS = range(m)
   ITEMS = range(n)
 
   ###################### DECISION VARIABLES ##################
 
-  # main decision variable: x[i,j] = k mean that the i-th courier collect the j-th item at time k
-  X = [[Int(f'X_{i}_{j}') for j in ITEMS]for i in COURIERS]
-
   # stores the total distance traveled by each courier.
-  dist = [Int(f'dist_{i}') for i in COURIERS]
+  dist = [num.var(f'dist_{i}') for i in COURIERS]
 
   # stores the total load of items collected by each courier
-  load = [Int(f'load_{i}') for i in COURIERS]
+  load = [num.var(f'load_{i}') for i in COURIERS]
 
   # the number of items that are collected by each courier
-  count = [Int(f'count_{i}') for i in COURIERS]
+  count = [num.var(f'count_{i}') for i in COURIERS]
+
+  X, succ, first = None, None, None
+  if successor:
+    # succ[j] = k mean that item k is collected right after item j, n that the courier goes back to the origin
+    succ = [num.var(f'succ_{j}') for j in ITEMS]
+
+    # first[i] = j mean that the i-th courier starts from item j, n that it stays at the origin
+    first = [num.var(f'first_{i}') for i in COURIERS]
 
-  solver = Solver()
+    # courier and position of every item, functions so that they can be read at succ[j]
+    courier = Function('courier', num.sort, num.sort)
+    pos = Function('pos', num.sort, num.sort)
 
-  ###################### CONSTRAINTS ######################
+    ###################### CONSTRAINTS ######################
 
-  add_constraints(solver, load, count, dist, X, m, n, l, s, D, sym_breaking, imp_cons)
+    add_successor_constraints(solver, load, count, dist, succ, first, courier, pos, m, n, l, s, D, sym_breaking, imp_cons, num)
+  else:
+    # main decision variable: x[i,j] = k mean that the i-th courier collect the j-th item at time k
+    X = [[num.var(f'X_{i}_{j}') for j in ITEMS]for i in COURIERS]
+
+    ###################### CONSTRAINTS ######################
+
+    add_constraints(solver, load, count, dist, X, m, n, l, s, D, sym_breaking, imp_cons, num)
 
   ###################### OBJECTIVE FUNCTION ################
 
-  obj = Int('obj')
-  obj = maximum([dist[i] for i in COURIERS])
+  # obj is bounded by every distance and minimized, the reported value is the longest distance itself
+  obj = num.var('obj')
+  for i in COURIERS:
+    solver.add(obj >= dist[i])
+
+  return dist, count, X, succ, first, obj
+
+def SMT_Solver(shared_list, m, n, l, s, D, sym_breaking=False, imp_cons=True, bound=None, initial=None, threads=None, successor=False,
+               search="linear", timeout=300, bitvector=False):
+
+  start_time = time()
+  set_z3_threads(threads)
+
+  # integers of the model: unbounded Int, or bit-vectors wide enough for every value of the instance
+  num = Numbers(bitvector_width(m, n, l, s, D) if bitvector else None)
+
+  COURIERS = range(m)
+  ITEMS = range(n)
+
+  # search: linear (a new cut after every solution), binary (probes given as assumptions) or optimize (z3 Optimize)
+  solver = Optimize() if search == "optimize" else Solver()
+
+  dist, count, X, succ, first, obj = build_model(solver, m, n, l, s, D, sym_breaking, imp_cons, successor, num)
 
   ###################### LOWER AND UPPER BOUNDS ############
 
@@ -43,44 +76,128 @@ def SMT_Solver(shared_list, m, n, l, s, D, sym_breaking=False, imp_cons=True):
   
   lower_bound_distance = calculate_lower_bound(n, D)
 
+  if initial is not None and initial["obj"] <= upper_bound:
+    # start from the given solution: only better ones are searched, and it is the answer if none exists
+    shared_list.append((initial["sol"], initial["obj"], 0, False))
+    upper_bound = initial["obj"] - 1
+  else:
+    initial = None
+
   solver.add(obj >= lower_bound_distance)
   solver.add(obj <= upper_bound)
 
   ###################### SOLVE ############################
 
-  solver.set("timeout", 300000)
   time_generation = time() - start_time
 
   print(f"generation time :{time_generation}")
-  final_value = 0
-  result_X_final = []
-  result_count_final = []
-  final_time = 0
-  optimal = True
 
-  if solver.check() != sat:
+  # strict bound on the objective, tightened by the own incumbents and by the ones shared by other engines
+  cut = upper_bound + 1
+  last = None
+  proved = False
+
+  def remaining():
+    # milliseconds left of the time limit, generation included
+    return int((timeout - (time() - start_time)) * 1000)
+
+  def record(model):
+    # every improving solution is reported with its time: the anytime trajectory of the run
+    nonlocal cut, last
+    value = max(model.evaluate(dist[i], model_completion=True).as_long() for i in COURIERS)
+    if value >= cut:
+      return
+    cut = value
+    if successor:
+      courier_path = courier_path_from_successor(model, first, succ, n)
+    else:
+      result_X = [ [ model.evaluate(X[i][j], model_completion=True) for j in ITEMS ]
+              for i in COURIERS ]
+      result_count = [model.evaluate(count[i], model_completion=True) for i in COURIERS]
+      courier_path = courier_path_from_result(result_count, result_X
+                                              , COURIERS, ITEMS)
+    print(f"solving time :{time() - start_time}")
+    print(f"obj : {value}")
+    last = (courier_path, value, int(time() - start_time), False)
+    shared_list.append(last)
+    if bound is not None:
+      bound.offer(value)
+
+  def shared_cut():
+    # a better incumbent of another engine becomes the new cut
+    nonlocal cut
+    if bound is not None and bound.consume() < cut:
+      cut = bound.get()
+      solver.add(obj < cut)
+      return True
+    return False
+
+  def record_improvement(model):
+    # models reported during an optimize check, which the watcher can interrupt: a canceled evaluation
+    # is skipped, the model of the whole check is recorded after it
+    try:
+      record(model)
+    except Z3Exception:
+      pass
+
+  watcher = None
+  if bound is not None:
+    watcher = bound.watch(main_ctx().interrupt, guard=z3_checks)
+
+  if search == "optimize":
+    solver.minimize(obj)
+    solver.set_on_model(record_improvement)
+  lower = lower_bound_distance
+  while remaining() > 0:
+    shared_cut()
+    if search == "binary":
+      if lower >= cut:
+        proved = True
+        break
+      # the probe is an assumption, only the proved bounds are added for good
+      mid = (lower + cut - 1) // 2
+      probe = Bool(f'obj_le_{mid}')
+      solver.add(Implies(probe, obj <= mid))
+      solver.set("timeout", remaining())
+      status = z3_checks.check(solver, probe)
+    else:
+      solver.set("timeout", remaining())
+      status = z3_checks.check(solver)
+    if status == sat:
+      try:
+        record(solver.model())
+      except Z3Exception:
+        # an interrupt landed right after the check: the same check is run again
+        print("Model evaluation canceled by an interrupt, checking again")
+        continue
+      if search == "optimize":
+        proved = True
+        break
+      solver.add(obj < cut)
+    elif status == unsat:
+      if search != "binary":
+        proved = True
+        break
+      lower = mid + 1
+      solver.add(obj >= lower)
+    elif remaining() < 1000:
+      # out of time
+      break
+    # otherwise interrupted (by a better incumbent of another engine) while time remains: checked again
+
+  if watcher is not None:
+    watcher.set()
+
+  if proved and bound is not None:
+    bound.prove()
+  if last is None and initial is None:
     print ("failed to solve")
     shared_list.append((None, None, None, False))
-
-  while (solver.check() == sat):
-    print(f"solving time :{time() - start_time}")
-    model = solver.model()
-    result_X = [ [ model.evaluate(X[i][j]) for j in ITEMS ]
-            for i in COURIERS ]
-    
-    # result_dist = [model.evaluate(dist[i]) for i in COURIERS]
-    result_count = [model.evaluate(count[i]) for i in COURIERS]
-    result_objective = model.evaluate(obj)
-
-    result_X_final = result_X
-    final_value = result_objective
-    solver.add(obj < result_objective)
-
-    result_count_final = result_count
-    final_time = (time() - time_generation - start_time)
-
-    courier_path = courier_path_from_result(result_count_final, result_X_final
-                                            , COURIERS, ITEMS)
-    
-    print(f"obj : {final_value}")
-    shared_list.append((courier_path, final_value.as_long(), final_time, optimal))
+  else:
+    courier_path, value = (last[0], last[1]) if last is not None else (initial["sol"], initial["obj"])
+    if proved:
+      # nothing is better than the last solution
+      shared_list.append((courier_path, value, int(time() - start_time), bound is None or value <= bound.get()))
+    else:
+      # out of time, the last solution is not proved optimal
+      shared_list.append((courier_path, value, timeout, False))
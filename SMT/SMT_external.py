@@ -0,0 +1,315 @@
+import os
+import sys
+import json
+import select
+import shutil
+import hashlib
+import argparse
+import subprocess
+from time import time
+
+# the root first, its utils is shadowed by SMT/utils otherwise
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from z3 import Solver
+from SMT.utils import Numbers, bitvector_width, run_model_on_instance, pars_model
+from SMT.SMT_Z3 import build_model
+from utils import calculate_upper_bound, calculate_lower_bound
+
+# SMT-LIB scripts of the models saved by smtlib_model, bump the version when the models change
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+MODEL_VERSION = 1
+
+# solvers tried by "auto", in order of preference
+SMT_BACKENDS = ["z3", "cvc5", "yices-smt2", "optimathsat"]
+
+
+def find_smt_backend(name="auto"):
+  # first installed solver among the requested ones
+  candidates = SMT_BACKENDS if name == "auto" else [name]
+  for candidate in candidates:
+    if shutil.which(candidate) is not None:
+      return candidate
+  raise FileNotFoundError(f"no SMT solver found among {', '.join(candidates)}")
+
+
+def smtlib_logic(successor, bitvector):
+  # the successor model reads the distances from arrays and the courier and position of the items from functions
+  theory = "BV" if bitvector else "LIA"
+  return f"QF_AUF{theory}" if successor else f"QF_{theory}"
+
+
+def smtlib_value(value, width):
+  # constant of the sort of the model
+  if width is None:
+    return str(value) if value >= 0 else f"(- {-value})"
+  return f"(_ bv{value % (1 << width)} {width})"
+
+
+def smtlib_bound(op, value, width):
+  # bound on the objective, the bit-vectors being compared as signed numbers
+  if width is not None:
+    op = {"<": "bvslt", "<=": "bvsle", ">=": "bvsge"}[op]
+  return f"(assert ({op} obj {smtlib_value(value, width)}))"
+
+
+def smtlib_names(m, n, successor):
+  # decision variables of the model, from which the routes are read
+  if successor:
+    return [f"first_{i}" for i in range(m)] + [f"succ_{j}" for j in range(n)]
+  return [f"X_{i}_{j}" for i in range(m) for j in range(n)]
+
+
+def model_cache_file(m, n, l, s, D, sym_breaking, imp_cons, successor, bitvector):
+  # the cache is keyed by the content of the instance, not by its file name
+  key = json.dumps([MODEL_VERSION, m, n, list(l), list(s), [list(row) for row in D], sym_breaking, imp_cons, successor, bitvector])
+  return os.path.join(CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + ".smt2")
+
+
+def smtlib_model(m, n, l, s, D, sym_breaking=False, imp_cons=True, successor=False, bitvector=False):
+  # declarations and assertions of the model, obj between the bounds of the instance: built once with
+  # the constraints of SMT_Z3 and saved, later runs only read the text back
+  cache_file = model_cache_file(m, n, l, s, D, sym_breaking, imp_cons, successor, bitvector)
+  if os.path.exists(cache_file):
+    with open(cache_file) as f:
+      return f.read()
+
+  width = bitvector_width(m, n, l, s, D) if bitvector else None
+  solver = Solver()
+  build_model(solver, m, n, l, s, D, sym_breaking, imp_cons, successor, Numbers(width))
+  text = solver.sexpr() + "\n".join([smtlib_bound(">=", calculate_lower_bound(n, D), width),
+                                     smtlib_bound("<=", calculate_upper_bound(m, n, l, s, D), width)]) + "\n"
+  os.makedirs(CACHE_DIR, exist_ok=True)
+  # concurrent runs may write the same entry: write aside and rename
+  tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+  with open(tmp_file, "w") as f:
+    f.write(text)
+  os.replace(tmp_file, cache_file)
+  return text
+
+
+def smtlib_script(m, n, l, s, D, sym_breaking=False, imp_cons=True, successor=False, bitvector=False):
+  # standalone script: one check of the model and the values of its decision variables
+  return (f"(set-option :produce-models true)\n(set-logic {smtlib_logic(successor, bitvector)})\n"
+          + smtlib_model(m, n, l, s, D, sym_breaking, imp_cons, successor, bitvector)
+          + f"(check-sat)\n(get-value ({' '.join(smtlib_names(m, n, successor))}))\n(exit)\n")
+
+
+def parse_sexpr(text):
+  # nested lists of the atoms of an s-expression
+  stack = [[]]
+  for token in text.replace("(", " ( ").replace(")", " ) ").split():
+    if token == "(":
+      stack.append([])
+    elif token == ")":
+      last = stack.pop()
+      stack[-1].append(last)
+    else:
+      stack[-1].append(token)
+  return stack[0][0]
+
+
+def parse_value(value, width):
+  # integer of a value printed by the solver: 3, (- 3), #b011, #x03 or (_ bv3 8)
+  if isinstance(value, list):
+    number = -parse_value(value[1], width) if value[0] == "-" else int(value[1][2:])
+  elif value.startswith("#b"):
+    number = int(value[2:], 2)
+  elif value.startswith("#x"):
+    number = int(value[2:], 16)
+  else:
+    return int(value)
+  if width is not None and number >= 1 << (width - 1):
+    number -= 1 << width
+  return number
+
+
+class SmtlibBackend:
+  # installed SMT solver driven through a pipe: the model is sent once, then every probe is a
+  # check-sat on top of it, the temporary bounds between push and pop
+
+  def __init__(self, name, logic):
+    self.name = name
+    executable = shutil.which(name)
+    if name == "z3":
+      command = [executable, "-in", "-smt2"]
+    elif name == "cvc5":
+      command = [executable, "--incremental", "--lang=smt2"]
+    elif name == "yices-smt2":
+      command = [executable, "--incremental"]
+    elif name == "optimathsat":
+      command = [executable, "-input=smt2"]
+    else:
+      command = [executable]
+    self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    self.buffer = b""
+    self.send("(set-option :produce-models true)")
+    # z3 chooses a much slower solver when the logic is given, only yices needs it
+    if name == "yices-smt2":
+      self.send(f"(set-logic {logic})")
+
+  def send(self, text):
+    self.process.stdin.write((text + "\n").encode())
+    self.process.stdin.flush()
+
+  def read_line(self, deadline):
+    # next line of the solver, None when it does not answer in time
+    while b"\n" not in self.buffer:
+      ready, _, _ = select.select([self.process.stdout], [], [], max(0, deadline - time()))
+      if not ready:
+        return None
+      chunk = os.read(self.process.stdout.fileno(), 65536)
+      if not chunk:
+        return None
+      self.buffer += chunk
+    line, self.buffer = self.buffer.split(b"\n", 1)
+    return line.decode().strip()
+
+  def check(self, deadline):
+    self.send("(check-sat)")
+    while True:
+      line = self.read_line(deadline)
+      if line is None:
+        # out of time: the solver cannot be interrupted through the pipe, it is stopped
+        self.close()
+        return "unknown"
+      if line in ("sat", "unsat", "unknown"):
+        return line
+      if line.startswith("(error"):
+        print(f"{self.name}: {line}")
+        return "unknown"
+
+  def values(self, names, width, deadline):
+    # values of the variables in the last model
+    self.send(f"(get-value ({' '.join(names)}))")
+    text = ""
+    while not text or text.count("(") > text.count(")"):
+      line = self.read_line(deadline)
+      if line is None:
+        return None
+      text += line + " "
+    return {name: parse_value(value, width) for name, value in parse_sexpr(text)}
+
+  def close(self):
+    if self.process.poll() is None:
+      self.process.kill()
+      self.process.wait()
+
+
+def routes_from_values(values, m, n, successor):
+  # routes of the couriers, items numbered from 1
+  routes = []
+  for i in range(m):
+    if successor:
+      route = []
+      j = values[f"first_{i}"]
+      while j < n and len(route) < n:
+        route.append(j + 1)
+        j = values[f"succ_{j}"]
+    else:
+      items = [j for j in range(n) if values[f"X_{i}_{j}"] > 0]
+      route = [j + 1 for j in sorted(items, key=lambda j: values[f"X_{i}_{j}"])]
+    routes.append(route)
+  return routes
+
+
+def route_distance(route, n, D):
+  nodes = [n] + [j - 1 for j in route] + [n]
+  return sum(D[a][b] for a, b in zip(nodes, nodes[1:])) if route else 0
+
+
+def external_solver(shared_list, m, n, l, s, D, sym_breaking=False, imp_cons=True, bound=None, initial=None, successor=False,
+                    search="linear", timeout=300, bitvector=False, backend="auto"):
+  # same search and same entries in shared_list as SMT_Solver, run by an installed SMT solver
+  start_time = time()
+  deadline = start_time + timeout
+  name = find_smt_backend(backend)
+  width = bitvector_width(m, n, l, s, D) if bitvector else None
+  names = smtlib_names(m, n, successor)
+  model = smtlib_model(m, n, l, s, D, sym_breaking, imp_cons, successor, bitvector)
+  solver = SmtlibBackend(name, smtlib_logic(successor, bitvector))
+  solver.send(model)
+  print(f"generation time :{time() - start_time}")
+
+  if search == "optimize":
+    print("optimize is only given by the z3 API, searching linearly")
+    search = "linear"
+
+  # strict bound on the objective, tightened by the own incumbents and by the ones shared by other engines
+  cut = calculate_upper_bound(m, n, l, s, D) + 1
+  if initial is not None and initial["obj"] < cut:
+    shared_list.append((initial["sol"], initial["obj"], 0, False))
+    cut = initial["obj"]
+    solver.send(smtlib_bound("<", cut, width))
+  else:
+    initial = None
+  lower = calculate_lower_bound(n, D)
+  last = None
+  proved = False
+
+  while time() < deadline:
+    if bound is not None and bound.consume() < cut:
+      cut = bound.get()
+      solver.send(smtlib_bound("<", cut, width))
+    if search == "binary":
+      if lower >= cut:
+        proved = True
+        break
+      # the probe is pushed and popped, only the proved bounds stay for good
+      mid = (lower + cut - 1) // 2
+      solver.send("(push 1)\n" + smtlib_bound("<=", mid, width))
+    status = solver.check(deadline)
+    values = solver.values(names, width, deadline) if status == "sat" else None
+    if search == "binary" and status != "unknown":
+      solver.send("(pop 1)")
+    if values is not None:
+      routes = routes_from_values(values, m, n, successor)
+      value = max(route_distance(route, n, D) for route in routes)
+      print(f"solving time :{time() - start_time}")
+      print(f"obj : {value}")
+      if value < cut:
+        cut = value
+        last = (routes, value, int(time() - start_time), False)
+        shared_list.append(last)
+        if bound is not None:
+          bound.offer(value)
+      solver.send(smtlib_bound("<", cut, width))
+    elif status == "unsat":
+      if search != "binary":
+        proved = True
+        break
+      lower = mid + 1
+      solver.send(smtlib_bound(">=", lower, width))
+    else:
+      # out of time, or the solver gave up
+      break
+  solver.close()
+
+  if proved and bound is not None:
+    bound.prove()
+  if last is None and initial is None:
+    print("failed to solve")
+    shared_list.append((None, None, None, False))
+  else:
+    courier_path, value = (last[0], last[1]) if last is not None else (initial["sol"], initial["obj"])
+    if proved:
+      shared_list.append((courier_path, value, int(time() - start_time), bound is None or value <= bound.get()))
+    else:
+      shared_list.append((courier_path, value, timeout, False))
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Write an SMT model of an instance as a standalone SMT-LIB2 script.")
+  parser.add_argument("-n", "--num_instance", type=int, required=True, help="Instance number.")
+  parser.add_argument("-m", "--model", type=str, default="SMT_SUCC", help="Model of SMT_handler.models.")
+  parser.add_argument("--bitvector", action="store_true", help="Bit-vectors instead of unbounded integers.")
+  parser.add_argument("-o", "--output", type=str, required=True, help="Script file.")
+  args = parser.parse_args()
+
+  sym, imp, successor = pars_model(args.model)
+  script = smtlib_script(*run_model_on_instance(f"./Instances/inst{args.num_instance:02d}.dat"), sym, imp, successor, args.bitvector)
+  with open(args.output, "w") as f:
+    f.write(script)
+
+
+if __name__ == "__main__":
+  main()
@@ -1,18 +1,23 @@
 from z3 import *
+import os
 import numpy as np
 from time import time
 import json
 import multiprocessing
 from SMT.utils import *
 from SMT.SMT_Z3 import *
+from SMT.SMT_external import external_solver, find_smt_backend
+from Heuristic.Heuristic_handler import timed_initial_solution
 
 models = [ "SMT",
           "SMT_SYM",
           "SMT_IMP",
-          "SMT_SYM_IMP"
+          "SMT_SYM_IMP",
+          "SMT_SUCC",
+          "SMT_SUCC_SYM"
           ]
 
-def SMT_handler(num_instance):
+def SMT_handler(num_instance, warm_start=False, threads=None, search="linear", bitvector=False, backend="api"):
 
   if num_instance == 0:
     start = 0
@@ -24,58 +29,87 @@ def SMT_handler(num_instance):
     start = num_instance - 1
     end = num_instance
 
+  # "api" solves through the z3 Python API, any other name with an installed SMT solver through a pipe
+  if backend != "api":
+    backend = find_smt_backend(backend)
+
   for instance_num in range(start, end):
     final_result_dict = {}
     print(f"=============================== INSTANCE : {instance_num + 1}  ===============================")
+    initial, heuristic_time = timed_initial_solution(instance_num + 1) if warm_start else (None, 0)
     for model in models:
-      not_optimal_flag = False
-      sym = None
-      final_result_dict[model] = {}
+      # the linear search keeps the plain model names
+      key = model if search == "linear" else f"{model}_{search.upper()}"
+      if bitvector:
+        key += "_BV"
+      if backend != "api":
+        key += f"_{backend.upper()}"
+      if warm_start:
+        key += "_WS"
+      final_result_dict[key] = run_smt_model(instance_num + 1, model, initial, threads, search, bitvector, backend, heuristic_time)
+    output_file = f'./res/SMT/{instance_num+1}.json'
+    # the keys of the other searches, encodings and backends already saved for the instance are kept
+    json_data = {}
+    if os.path.exists(output_file):
+      with open(output_file, 'r') as f:
+        json_data = json.load(f)
+    json_data.update(final_result_dict)
+    with open(output_file, 'w') as f:
+      json.dump(json_data, f, indent=1)
+
+def run_smt_model(num_instance, model, initial=None, threads=None, search="linear", bitvector=False, backend="api", past_time=0):
+  # past_time: seconds already spent on the instance (the warm start), out of the 300
+  result = {}
+  not_optimal_flag = False
+  timeout = 300 - past_time
 
-      sym , imp = pars_model(model)
-      #print(f"sym breaking: {sym}")
-      with multiprocessing.Manager() as manager:
-        shared_list = manager.list()
-        # Create a Process to run the target function
-        process = multiprocessing.Process(target=SMT_Solver,
-                                        args=(shared_list,
-                                              *run_model_on_instance((f"./Instances/inst0{instance_num+1}.dat"
-                                                if instance_num < 9 else f"./Instances/inst{instance_num+1}.dat")), sym, imp))
+  sym , imp, successor = pars_model(model)
+  #print(f"sym breaking: {sym}")
+  with multiprocessing.Manager() as manager:
+    shared_list = manager.list()
+    # Create a Process to run the target function
+    instance = run_model_on_instance((f"./Instances/inst0{num_instance}.dat"
+                                      if num_instance < 10 else f"./Instances/inst{num_instance}.dat"))
+    if backend == "api":
+      process = multiprocessing.Process(target=SMT_Solver,
+                                      args=(shared_list, *instance, sym, imp, None, initial, threads, successor, search, timeout, bitvector))
+    else:
+      process = multiprocessing.Process(target=external_solver,
+                                      args=(shared_list, *instance, sym, imp, None, initial, successor, search, timeout, bitvector, backend))
 
-        # Start the process
-        process.start()
+    # Start the process
+    process.start()
 
-        # Wait for the process to complete with a timeout of 300 seconds
-        process.join(timeout=300)
+    # Wait for the process to complete with a timeout of 300 seconds
+    process.join(timeout=timeout)
 
-        if process.is_alive():
-          # If the process is still alive after 300 seconds, terminate it
-          print("Process exceeded 300 seconds, terminating...")
-          process.terminate()
-          process.join()  # Ensure the process has been fully terminated
-          not_optimal_flag=True
+    if process.is_alive():
+      # If the process is still alive after 300 seconds, terminate it
+      print("Process exceeded 300 seconds, terminating...")
+      process.terminate()
+      process.join()  # Ensure the process has been fully terminated
+      not_optimal_flag=True
 
-        if len(shared_list) == 0:
-          print("shared_list in None...............")
-          final_result_dict[model]["time"] = 300
-          final_result_dict[model]["optimal"] = False
-          final_result_dict[model]["obj"] = None
-          final_result_dict[model]["sol"] = None
-        else:
-          courier_path, final_value, final_time, optimal = shared_list[len(shared_list) - 1]
+    if len(shared_list) == 0:
+      print("shared_list in None...............")
+      result["time"] = 300
+      result["optimal"] = False
+      result["obj"] = None
+      result["sol"] = None
+    else:
+      courier_path, final_value, final_time, optimal = shared_list[len(shared_list) - 1]
 
-          if not_optimal_flag or final_time is None:
-            optimal = False
-            final_time = 300
-            
-          final_result_dict[model]["time"] = int(final_time)
-          final_result_dict[model]["optimal"] = optimal
-          final_result_dict[model]["obj"] = final_value
-          final_result_dict[model]["sol"] = courier_path
+      if not_optimal_flag or final_time is None:
+        optimal = False
+        final_time = 300
+        
+      result["time"] = int(final_time + past_time) if optimal else 300
+      result["optimal"] = optimal
+      result["obj"] = final_value
+      result["sol"] = courier_path
 
-        print("finished")
-    with open(f'./res/SMT/{instance_num+1}.json', 'w') as f:
-      json.dump(final_result_dict, f, indent=1)
+    print("finished")
+  return result
 
 # if __name__ == "__main__":
 #   SMT_handler(num_instance=2, model="SMT_SYM")
\ No newline at end of file
@@ -0,0 +1,62 @@
+import os
+import sys
+import csv
+import argparse
+import multiprocessing
+import time as T
+
+# the root first, its utils is shadowed by SMT/utils otherwise
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SMT.utils import run_model_on_instance, pars_model, bitvector_width
+from SMT.SMT_Z3 import SMT_Solver
+
+
+def benchmark_run(result, shared_list, num_instance, model, bitvector, search, timeout):
+  m, n, l, s, D = run_model_on_instance(f"./Instances/inst{num_instance:02d}.dat")
+  result["width"] = bitvector_width(m, n, l, s, D) if bitvector else "int"
+  sym, imp, successor = pars_model(model)
+  SMT_Solver(shared_list, m, n, l, s, D, sym, imp, None, None, None, successor, search, timeout, bitvector)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Compare the SMT models over unbounded integers and over bit-vectors.")
+  parser.add_argument("-n", "--num_instance", type=int, default=0, help="Instance number to run (0 for all instances).")
+  parser.add_argument("-t", "--timeout", type=int, default=300, help="Time limit of each run, generation included.")
+  parser.add_argument("-m", "--models", type=str, nargs="+", default=["SMT", "SMT_SUCC"], help="Models of SMT_handler.models to compare.")
+  parser.add_argument("-s", "--search", type=str, default="linear", choices=["linear", "binary", "optimize"])
+  parser.add_argument("-o", "--output", type=str, default="bitvector_benchmark.csv", help="CSV file of the results.")
+  args = parser.parse_args()
+
+  instances = range(1, 22) if args.num_instance == 0 else [args.num_instance]
+  fields = ["instance", "model", "width", "time", "first_obj", "first_time", "obj", "optimal"]
+  with open(args.output, "w", newline="") as f:
+    writer = csv.DictWriter(f, fieldnames=fields)
+    writer.writeheader()
+    print(" ".join(f"{field:>10}" for field in fields))
+    for i in instances:
+      for model in args.models:
+        for bitvector in [False, True]:
+          with multiprocessing.Manager() as manager:
+            result = manager.dict()
+            shared_list = manager.list()
+            start_time = T.time()
+            process = multiprocessing.Process(target=benchmark_run, args=(result, shared_list, i, model, bitvector, args.search, args.timeout))
+            process.start()
+            # a few seconds over the limit for the last check to give up
+            process.join(timeout=args.timeout + 5)
+            if process.is_alive():
+              process.terminate()
+              process.join()
+            # the first and the best solution, the last entry being the final answer
+            found = [entry for entry in shared_list if entry[1] is not None]
+            row = {"instance": i, "model": model, "width": result.get("width", "N/A"), "time": round(T.time() - start_time, 2),
+                   "first_obj": "N/A", "first_time": "N/A", "obj": "N/A", "optimal": False}
+            if found:
+              row.update(first_obj=found[0][1], first_time=found[0][2], obj=found[-1][1], optimal=found[-1][3])
+          writer.writerow(row)
+          f.flush()
+          print(" ".join(f"{str(row[field]):>10}" for field in fields))
+
+
+if __name__ == "__main__":
+  main()
@@ -1,37 +1,40 @@
 from z3 import *
 import numpy as np
+from symmetry import Symmetry
+from SMT.utils import Numbers
 
 
-def add_constraints(solver, load, count, dist, X, m, n, l, s, D, sym_breaking, imp_cons):
+def add_constraints(solver, load, count, dist, X, m, n, l, s, D, sym_breaking, imp_cons, num=Numbers()):
+  # constants go through num, so that the same constraints build the Int and the bit-vector model
   COURIERS = range(m)
   ITEMS = range(n)
   
   # Each item is collected by exactly one courier
   for j in ITEMS:
-    solver.add(Sum([If(X[i][j] > 0, 1, 0) for i in COURIERS]) == 1)
+    solver.add(Sum([If(X[i][j] > 0, num(1), num(0)) for i in COURIERS]) == 1)
 
   # The total weight of items collected by each courier must not exceed the courier's load capacity
   for i in COURIERS:
-    load[i] = Sum([If(X[i][j] > 0, s[j], 0) for j in ITEMS])
+    load[i] = Sum([If(X[i][j] > 0, num(s[j]), num(0)) for j in ITEMS])
     solver.add(load[i] <= l[i])
 
   for i in COURIERS:  
 
     # Calculate the number of items assigned to each courier (c)
-    count[i] = Sum([If(X[i][j] > 0, 1, 0) for j in ITEMS])
+    count[i] = Sum([If(X[i][j] > 0, num(1), num(0)) for j in ITEMS])
     
     
     # Distance from origin to the first item that courier i collect
-    dist_start = Sum([If(X[i][j] == 1, D[n][j], 0) for j in ITEMS])
+    dist_start = Sum([If(X[i][j] == 1, num(D[n][j]), num(0)) for j in ITEMS])
 
     # Distance between consecutive items in the courier i's route
     dist_consecutive = Sum([
-        If(And(X[i][j1] > 0, X[i][j2] > 0, X[i][j2] - X[i][j1] == 1), D[j1][j2], 0)
+        If(And(X[i][j1] > 0, X[i][j2] > 0, X[i][j2] - X[i][j1] == 1), num(D[j1][j2]), num(0))
         for j1 in ITEMS for j2 in ITEMS
     ])
 
     # Distance from the last item in the courier i's route back to the origin
-    dist_end = Sum([If(X[i][j] == count[i], D[j][n], 0) for j in ITEMS])
+    dist_end = Sum([If(X[i][j] == count[i], num(D[j][n]), num(0)) for j in ITEMS])
 
     # Total distance expression for courier i
     dist_expr = dist_start + dist_consecutive + dist_end
@@ -45,32 +48,103 @@ def add_constraints(solver, load, count, dist, X, m, n, l, s, D, sym_breaking, i
 
   # Each item is delivered at a different time(k) by i-th couriesr
   for i in COURIERS:
-    items = [If(X[i][j] > 0, X[i][j], -j) for j in ITEMS]
+    items = [If(X[i][j] > 0, X[i][j], num(-j)) for j in ITEMS]
     solver.add(Distinct(items))
 
   if sym_breaking:
-    add_sb_constraints(m, l, solver, X, load)
+    add_sb_constraints(Symmetry(m, n, l, s, D), solver, X, load, count, num)
   if imp_cons:
-    add_implied_constraints(m, n, solver, X, count)
+    add_implied_constraints(m, n, solver, X, count, num)
 
 
-def add_sb_constraints(m, l, solver, X, load):
-    
-    for i in range(m - 1):
-        for j in range(i + 1, m):
-            if l[i] >= l[j] :
-                # Ensure the first item of courier i is less than that of courier j
-                solver.add(load[i] > load[j])
-                break # I don't want to say A < B, A < D,  A < F, B < D, B < F, D < F. Instead I want to say A < B, B < D, D < F
-               
-               
-def add_implied_constraints(m, n, solver, X, count):
+def add_successor_constraints(solver, load, count, dist, succ, first, courier, pos, m, n, l, s, D, sym_breaking, imp_cons, num=Numbers()):
+  COURIERS = range(m)
+  ITEMS = range(n)
+
+  # row j of D as an array, read at the successor of j (n being the origin)
+  def row(j):
+    values = K(num.sort, num(0))
+    for k in range(n + 1):
+      values = Store(values, k, D[j][k])
+    return values
+
+  for j in ITEMS:
+    solver.add(And(succ[j] >= 0, succ[j] <= n, succ[j] != j))
+    solver.add(And(courier(j) >= 0, courier(j) < m))
+    solver.add(And(pos(j) >= 1, pos(j) <= n))
+    # the successor is collected right after j by the same courier, so no route loops without the origin
+    solver.add(Implies(succ[j] < n, And(courier(succ[j]) == courier(j), pos(succ[j]) == pos(j) + 1)))
+
+  for i in COURIERS:
+    solver.add(And(first[i] >= 0, first[i] <= n))
+    solver.add(Implies(first[i] < n, And(courier(first[i]) == i, pos(first[i]) == 1)))
+
+  # Each item has one predecessor, an item or the origin: the values n are made distinct, and there
+  # are as many returns to the origin as couriers that leave it
+  solver.add(Distinct([If(succ[j] == n, num(n + 1 + j), succ[j]) for j in ITEMS] +
+                      [If(first[i] == n, num(2 * n + 1 + i), first[i]) for i in COURIERS]))
+  solver.add(Sum([If(succ[j] == n, num(1), num(0)) for j in ITEMS]) == Sum([If(first[i] < n, num(1), num(0)) for i in COURIERS]))
+
+  depot = row(n)
+  rows = [row(j) for j in ITEMS]
+  for i in COURIERS:
+    load[i] = Sum([If(courier(j) == i, num(s[j]), num(0)) for j in ITEMS])
+    solver.add(load[i] <= l[i])
+    count[i] = Sum([If(courier(j) == i, num(1), num(0)) for j in ITEMS])
+    # distance from the origin to the first item, then from every item of the courier to its successor,
+    # kept in the dist_i variable so that the objective does not copy the sums
+    solver.add(dist[i] == If(first[i] < n, Select(depot, first[i]), num(0)) + Sum([If(courier(j) == i, Select(rows[j], succ[j]), num(0)) for j in ITEMS]))
+
+  if sym_breaking:
+    add_successor_sb_constraints(Symmetry(m, n, l, s, D), solver, first, courier, pos, load)
+  if imp_cons:
+    # Each courier collects at least one item, and balance item distribution
+    for i in COURIERS:
+      solver.add(first[i] < n)
+      solver.add(count[i] <= int(n / m) + 1)
+
+
+def add_successor_sb_constraints(symmetry, solver, first, courier, pos, load):
+  # same directives as add_sb_constraints, on the successor variables
+  for i, k in symmetry.couriers(symmetry.interchangeable):
+    solver.add(Or(first[i] < first[k], first[k] == symmetry.n))
+
+  for i, k in symmetry.couriers(symmetry.dominated):
+    solver.add(load[i] >= load[k])
+
+  for j, h in symmetry.identical_items:
+    solver.add(Implies(courier(j) == courier(h), pos(j) < pos(h)))
+
+
+def add_sb_constraints(symmetry, solver, X, load, count, num=Numbers()):
+  n = symmetry.n
+  ITEMS = range(n)
+
+  # first[i] := 1 + index of the first item of courier i, n + 1 when it stays at the origin
+  def first(i):
+    return Sum([If(X[i][j] == 1, num(j + 1), num(0)) for j in ITEMS]) + If(count[i] == 0, num(n + 1), num(0))
+
+  # couriers with the same capacity are ordered by their first item, the empty ones last
+  for i, k in symmetry.couriers(symmetry.interchangeable):
+    solver.add(Or(first(i) < first(k), count[k] == 0))
+
+  # a courier with a larger capacity carries at least the load of the next one
+  for i, k in symmetry.couriers(symmetry.dominated):
+    solver.add(load[i] >= load[k])
+
+  # identical items are delivered in index order when they share the route
+  for j, h in symmetry.identical_items:
+    for i in range(symmetry.m):
+      solver.add(Implies(And(X[i][j] > 0, X[i][h] > 0), X[i][j] < X[i][h]))
+
+
+def add_implied_constraints(m, n, solver, X, count, num=Numbers()):
 
     max_item = int(n / m) + 1
 
     # Each courier collects more than one item
     for i in range(m):
-        solver.add(Sum([If(X[i][j] > 0, 1, 0) for j in range(n)]) >= 1)
+        solver.add(Sum([If(X[i][j] > 0, num(1), num(0)) for j in range(n)]) >= 1)
 
         # balance item distribution
         solver.add(count[i] <= max_item)
\ No newline at end of file
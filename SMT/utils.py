@@ -1,6 +1,26 @@
 from z3 import *
 import numpy as np
 
+class Numbers:
+  # sort of the integer variables and constants of the models: unbounded Int, or bit-vectors of the
+  # given width so that z3 can bit-blast the model to its SAT core
+
+  def __init__(self, width=None):
+    self.width = width
+    self.sort = IntSort() if width is None else BitVecSort(width)
+
+  def __call__(self, value):
+    return IntVal(value) if self.width is None else BitVecVal(value, self.width)
+
+  def var(self, name):
+    return Const(name, self.sort)
+
+def bitvector_width(m, n, l, s, D):
+  # every value of the models fits: distances of n + 1 arcs, loads, positions and the successor
+  # encodings up to 2n + m + 1, plus a sign bit so that the signed comparisons stay exact
+  largest = max((n + 1) * max(max(row) for row in D), sum(s), 2 * n + m + 2)
+  return largest.bit_length() + 1
+
 def maximum(x):
     m = x[0]
     for v in x[1:]:
@@ -28,20 +48,24 @@ def courier_path_from_result(result_count_final, result_X_final, COURIERS, ITEMS
       courier_path.append(temp)
   return courier_path
 
+def courier_path_from_successor(model, first, succ, n):
+  # routes followed from the first item of every courier until the return to the origin
+  courier_path = []
+  for start in first:
+    path = []
+    j = model.evaluate(start, model_completion=True).as_long()
+    while j < n:
+      path.append(j + 1)
+      j = model.evaluate(succ[j], model_completion=True).as_long()
+    courier_path.append(path)
+  return courier_path
+
 def pars_model(model):
   
-  sym = False
-  imp = False
-
-  if model == "SMT_SYM":
-    sym = True
-    imp = False
-  elif model == "SMT_IMP":
-    sym = False
-    imp = True
-  elif model == "SMT_SYM_IMP":
-    sym = True
-    imp = True
+  sym = "_SYM" in model
+  imp = "_IMP" in model
+  # SMT_SUCC models: successor variables instead of the positions of the items
+  successor = model.startswith("SMT_SUCC")
     
-  print(f"SYMMETRY BREAKING : {sym},  IMPLIED CONSTRAINT : {imp}")
-  return sym, imp
\ No newline at end of file
+  print(f"SYMMETRY BREAKING : {sym},  IMPLIED CONSTRAINT : {imp},  SUCCESSOR MODEL : {successor}")
+  return sym, imp, successor
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import signal
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils import calculate_lower_bound, calculate_upper_bound, SharedBound
+from CP.cp_solver import run_minizinc, cp_member
+from SAT.SAT_handler import load_instance, configurations, run_configuration
+from SAT.SAT_model import sat_solver
+from SMT.SMT_handler import models, run_smt_model
+from SMT.SMT_Z3 import SMT_Solver
+from MIP.MIP import solver_names, run_solver, make_solver, instance_path, read_mcp_instance, solve_and_save
+
+# (model, solver) pairs run by "solver.py -a all" for the CP approach
+cp_configurations = [
+    ("CPF_sym", "gecode"),
+    ("CPF_no_sym", "gecode"),
+    ("CPF_sym", "chuffed"),
+    ("CPF_no_sym", "chuffed"),
+    ("CP_sym", "gecode"),
+]
+
+
+def instance_range(num_instance):
+    # same convention as the approaches: 0 for all instances, -1 for the first 10
+    if num_instance == 0:
+        return range(1, 22)
+    elif num_instance == -1:
+        return range(1, 11)
+    return range(num_instance, num_instance + 1)
+
+
+def expand_jobs(num_instance):
+    # one job for every (approach, configuration, instance) triple
+    jobs = []
+    for i in instance_range(num_instance):
+        for model, solver in cp_configurations:
+            jobs.append(("CP", (model, solver), i))
+        for configuration in configurations():
+            jobs.append(("SAT", configuration, i))
+        for model in models:
+            jobs.append(("SMT", model, i))
+        for solver_name in solver_names:
+            jobs.append(("MIP", solver_name, i))
+    return jobs
+
+
+def run_job(approach, configuration, num_instance):
+    if approach == "CP":
+        model, solver = configuration
+        new_result = run_minizinc(model, num_instance, solver, save=False, warm_start=False)
+        key, result = next(iter(new_result.items()))
+    elif approach == "SAT":
+        strategy, imp, sb = configuration
+        index, instance, past_time = load_instance(num_instance)
+        key, result = run_configuration(index, instance, past_time, strategy, sb, imp)
+    elif approach == "SMT":
+        key, result = configuration, run_smt_model(num_instance, configuration)
+    else:
+        key, result = configuration, run_solver(num_instance, configuration)
+    return approach, num_instance, key, result
+
+
+def save_result(approach, num_instance, key, result):
+    # merge a single configuration into res/<approach>/<n>.json, as the approaches do
+    output_dir = os.path.join("res", approach)
+    os.makedirs(output_dir, exist_ok=True)
+    name = f"{num_instance:02d}" if approach == "SAT" else str(num_instance)
+    json_file = os.path.join(output_dir, f"{name}.json")
+
+    data = {}
+    if os.path.exists(json_file):
+        with open(json_file, "r") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                data = {}
+
+    data[key] = result
+    with open(json_file, "w") as f:
+        json.dump(data, f, indent=4)
+
+
+def pin_worker(cores):
+    # give every worker its own core so that the reported times stay comparable
+    core = cores.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {core})
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def run_portfolio(num_instance, workers=None):
+    cores = available_cores()
+    if workers is None or workers > len(cores):
+        workers = len(cores)
+
+    jobs = expand_jobs(num_instance)
+    print(f"Running {len(jobs)} jobs on {workers} workers")
+
+    core_queue = mp.Queue()
+    for core in cores[:workers]:
+        core_queue.put(core)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=pin_worker, initargs=(core_queue,)) as executor:
+        futures = {executor.submit(run_job, *job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            approach, configuration, num = futures[future]
+            try:
+                approach, num, key, result = future.result()
+            except Exception as e:
+                print(f"Job {approach} {configuration} on instance {num} failed: {e}")
+                continue
+            save_result(approach, num, key, result)
+            print(f"[{done}/{len(jobs)}] {approach} {key} instance {num}: obj {result['obj']}")
+
+
+def race_members(num_instance, time_limit):
+    # (name, entry layout, target, arguments after the shared list) of every member racing on one instance,
+    # the last argument of every member is the bound channel they share
+    index, instance, past_time = load_instance(num_instance)
+    m, n, L, S, D = read_mcp_instance(instance_path(num_instance))
+    bound = SharedBound(calculate_upper_bound(m, n, L, S, D) + 1)
+
+    members = []
+    for solver in ["gecode", "chuffed"]:
+        members.append((f"CPF_sym_{solver}", "CP", cp_member, ("CPF_sym", num_instance, solver, time_limit, bound)))
+    for strategy in ["linear", "binary"]:
+        members.append((f"SAT_{strategy}_sb", "SAT", sat_solver, (instance, time_limit - past_time, past_time, strategy, True, False, bound)))
+    members.append(("SMT", "SMT", SMT_Solver, (m, n, L, S, D, False, False, bound)))
+    for solver_name in ["PULP_CBC_CMD", "HiGHS"]:
+        members.append((solver_name, "MIP", solve_and_save, (m, n, L, S, D, make_solver(solver_name, time_limit), bound)))
+    return members, bound, calculate_lower_bound(n, D)
+
+
+def incumbent(layout, entry):
+    # returns (obj, sol, optimal) from an entry of a member's shared list
+    if layout == "SAT":
+        time, optimal, obj, sol, distances = entry
+    elif layout == "SMT":
+        sol, obj, time, optimal = entry
+    else:
+        time, optimal, obj, sol = entry
+    if not isinstance(obj, int):
+        return None, None, False
+    return obj, sol, optimal
+
+
+def run_member(target, shared_list, args):
+    # every member gets its own process group, so that cancelling it also stops cbc/minizinc subprocesses
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    target(shared_list, *args)
+
+
+def stop_member(process):
+    if process.is_alive():
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        else:
+            process.kill()
+    process.join()
+
+
+def race_instance(num_instance, time_limit=300):
+    members, bound, lower_bound = race_members(num_instance, time_limit)
+    print(f"=============== RACE ON INSTANCE {num_instance} (lower bound {lower_bound}) ===============")
+
+    best_obj, best_sol, winner = None, [], None
+    proved = False
+    start_time = time.time()
+    with mp.Manager() as manager:
+        processes = []
+        for name, layout, target, args in members:
+            shared_list = manager.list()
+            process = mp.Process(target=run_member, args=(target, shared_list, args))
+            process.start()
+            processes.append([name, layout, process, shared_list, 0])
+
+        def collect():
+            # read the new entries of every member, returns the number of members still running
+            nonlocal best_obj, best_sol, winner, proved
+            running = 0
+            for member in processes:
+                name, layout, process, shared_list, seen = member
+                alive = process.is_alive()
+                running += alive
+                entries = list(shared_list[seen:])
+                member[4] = seen + len(entries)
+                for entry in entries:
+                    obj, sol, optimal = incumbent(layout, entry)
+                    if obj is not None and (best_obj is None or obj < best_obj):
+                        best_obj, best_sol, winner = obj, sol, name
+                        print(f"{time.time() - start_time:.1f}s: {name} found objective {obj}")
+                # only the final entry of a member that ended on its own is a proof of optimality
+                if not alive and member[4] > 0 and process.exitcode == 0:
+                    obj, sol, optimal = incumbent(layout, shared_list[-1])
+                    if optimal and obj is not None and obj == best_obj:
+                        proved = True
+            return running
+
+        while not proved and time.time() - start_time < time_limit:
+            time.sleep(0.5)
+            # a member can also prove that no solution beats the shared incumbent found by another one
+            proved = bound.is_proved()
+            running = collect()
+            if best_obj is not None and best_obj <= lower_bound:
+                proved = True
+            if running == 0:
+                break
+
+        elapsed = time.time() - start_time
+        for name, layout, process, shared_list, seen in processes:
+            stop_member(process)
+        collect()
+        proved = proved or bound.is_proved()
+
+    if proved:
+        print(f"{winner} proved objective {best_obj} optimal after {elapsed:.1f}s, other members cancelled")
+    else:
+        print(f"Best objective within the deadline: {best_obj} ({winner})")
+
+    result = {
+        "time": int(elapsed) if proved else time_limit,
+        "optimal": proved,
+        "obj": best_obj if best_obj is not None else "N/A",
+        "sol": best_sol
+    }
+    save_result("race", num_instance, "race", result)
+    return result
+
+
+def run_race(num_instance, time_limit=300):
+    for i in instance_range(num_instance):
+        race_instance(i, time_limit)
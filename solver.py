@@ -5,6 +5,10 @@ import os
 from SMT.SMT_handler import SMT_handler
 from SAT.SAT_handler import SAT_function
 from MIP.MIP import run_model
+from portfolio import run_portfolio, run_race
+from Heuristic.Heuristic_handler import run_heuristic
+from LNS.LNS import run_lns
+from SAT.utils_CNF import PB_ENCODINGS
 
 def main():
     # Add the project directory to sys.path
@@ -21,8 +25,61 @@ def main():
 
     parser.add_argument("-n", "--num_instance", type=int, help="Instance number to run (0 for all instances).",
                         default=0)
+
+    parser.add_argument("-w", "--workers", type=int, help="Number of parallel workers for -a all (default: one per core).",
+                        default=None)
+
+    parser.add_argument("--warm_start", action="store_true",
+                        help="Start CP, SAT, SMT and MIP from a 1 second run of the heuristic.")
     
+    parser.add_argument("--incremental", action="store_true",
+                        help="Run the SAT searches with assumptions on a bound encoded once.")
+
+    parser.add_argument("--sat_backend", type=str, choices=["auto", "kissat", "cadical", "minisat", "z3"], default=None,
+                        help="Solve the SAT model as DIMACS CNF with an installed solver binary (auto: the first one found), z3 otherwise.")
+
+    parser.add_argument("--load_encoding", type=str, choices=PB_ENCODINGS, default="adder",
+                        help="Pseudo-Boolean encoding of the loads, with --sat_backend.")
+
+    parser.add_argument("--distance_encoding", type=str, choices=[e for e in PB_ENCODINGS if e != "bdd"], default="adder",
+                        help="Pseudo-Boolean encoding of the distances, with --sat_backend (totalizer and swc fall back to the adder when too large).")
+
+    parser.add_argument("--sparse_k", type=int, default=None,
+                        help="Solve the SAT model on the arcs to the K nearest neighbours of every node first (0: adaptive K).")
+
+    parser.add_argument("--sat_model", type=str, choices=["three_index", "two_index"], default="three_index",
+                        help="SAT formulation: arcs per courier (three_index) or shared by all of them (two_index).")
+
+    parser.add_argument("--sat_search", type=str, nargs="+", choices=["linear", "binary", "adaptive", "gallop", "cubes"], default=None,
+                        help="Searches of the SAT objective to run (default: linear and binary).")
+
+    parser.add_argument("--sat_workers", type=int, default=None,
+                        help="Processes of the cubes search of SAT (default: one per core).")
+
+    parser.add_argument("--smt_search", type=str, choices=["linear", "binary", "optimize"], default="linear",
+                        help="SMT search of the objective: a new cut after every solution, a binary search with assumptions or z3 Optimize.")
+    parser.add_argument("--smt_bitvector", action="store_true",
+                        help="Solve the SMT models over bit-vectors instead of unbounded integers.")
+    parser.add_argument("--smt_backend", type=str, default="api",
+                        help="SMT solver: api (z3 Python API), or an installed binary driven through SMT-LIB2 (auto, z3, cvc5, yices-smt2, optimathsat).")
+
+    parser.add_argument("--mip_sym", action="store_true",
+                        help="Add the symmetry breaking constraints of symmetry.py to the MIP model.")
+    parser.add_argument("--mip_builder", type=str, choices=["matrix", "pulp"], default="matrix",
+                        help="Build the MIP model of HiGHS and Gurobi as NumPy arrays for their array API, or through PuLP.")
+    parser.add_argument("--mip_subtours", type=str, choices=["mtz", "lazy"], default="mtz",
+                        help="Eliminate the MIP subtours with all the MTZ constraints, or with DFJ cuts added only when violated.")
+    parser.add_argument("--mip_model", type=str, choices=["three_index", "aggregated", "colgen"], default="three_index",
+                        help="MIP formulation: arcs per courier (three_index), arcs shared by the couriers of a capacity class (aggregated), or routes generated by column generation (colgen).")
+
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Threads of every z3 call of SAT and SMT (z3 parallel mode).")
+
+    parser.add_argument("--sat_trace", action="store_true",
+                        help="Save every probe of the SAT searches, with its bounds, answer and time, in SAT/traces.")
+
     args = parser.parse_args()
+    warm_start = args.warm_start
 
     if args.approach.lower() == "cp":
         # Debug: Print the import path
@@ -34,7 +91,7 @@ def main():
 
             # Call the solver's run function
             if hasattr(solver_module, "run_minizinc"):
-                solver_module.run_minizinc(args.model, args.num_instance, args.solver)
+                solver_module.run_minizinc(args.model, args.num_instance, args.solver, warm_start=warm_start)
             else:
                 print(f"Error: Solver module for method '{args.approach}' does not have a 'run_minizinc' function.")
 
@@ -44,38 +101,34 @@ def main():
             return
         
     elif args.approach.lower() == "sat":
-        SAT_function(num_instance=args.num_instance)
+        SAT_function(num_instance=args.num_instance, warm_start=warm_start, incremental=args.incremental,
+                     backend=args.sat_backend, encodings=(args.load_encoding, args.distance_encoding),
+                     sparse_k=args.sparse_k, formulation=args.sat_model, strategies=args.sat_search, trace=args.sat_trace,
+                     workers=args.sat_workers, threads=args.threads)
 
     elif args.approach.lower() == "smt":
-        SMT_handler(num_instance=args.num_instance)
+        SMT_handler(num_instance=args.num_instance, warm_start=warm_start, threads=args.threads, search=args.smt_search,
+                    bitvector=args.smt_bitvector, backend=args.smt_backend)
 
     elif args.approach.lower() == "mip":
-        run_model(num_instance=args.num_instance)
+        run_model(num_instance=args.num_instance, warm_start=warm_start, sym_breaking=args.mip_sym, builder=args.mip_builder,
+                  subtours=args.mip_subtours, formulation=args.mip_model)
     
+    elif args.approach.lower() == "heuristic":
+        run_heuristic(num_instance=args.num_instance)
+
+    elif args.approach.lower() == "lns":
+        run_lns(num_instance=args.num_instance)
+
     elif args.approach.lower() == "all":
         
-        cp_commands = [
-            f"python solver.py -a CP -s gecode -m CPF_sym -n {args.num_instance}",
-            f"python solver.py -a CP -s gecode -m CPF_no_sym -n {args.num_instance}",
-            f"python solver.py -a CP -s chuffed -m CPF_sym -n {args.num_instance}",
-            f"python solver.py -a CP -s chuffed -m CPF_no_sym -n {args.num_instance}",
-            f"python solver.py -a CP -s gecode -m CP_sym -n {args.num_instance}"
-        ]
-        print("================CP Model=================")
-        for cmd in cp_commands:
-            os.system(cmd)
-            
-        print("================SAT Model=================")
-        SAT_function(num_instance=args.num_instance)
-        
-        print("================SMT Model=================")
-        SMT_handler(num_instance=args.num_instance)
-        
-        print("================MIP Model=================")
-        run_model(num_instance=args.num_instance)
+        run_portfolio(args.num_instance, workers=args.workers)
+
+    elif args.approach.lower() == "race":
+        run_race(args.num_instance)
         
     else:
-        raise argparse.ArgumentError(None, "Please select a solver between CP, SAT, SMT and MIP")
+        raise argparse.ArgumentError(None, "Please select a solver between CP, SAT, SMT, MIP, heuristic, LNS, all and race")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
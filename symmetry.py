@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class Symmetry:
+    # symmetries of an instance, found once and broken the same way by every approach:
+    #  - order: canonical order of the couriers, by decreasing capacity (ties by index)
+    #  - interchangeable: consecutive canonical positions (p, p + 1) with the same capacity, their
+    #    routes can be swapped and are ordered by the engines (lexicographically, by first item, ...)
+    #  - dominated: consecutive canonical positions (p, p + 1) where p has the larger capacity, p can
+    #    always carry the load of p + 1 and carries at least as much
+    #  - identical_items: pairs of items (j, h), j < h, with the same size and distances, delivered
+    #    in index order when they are on the same route
+    # every courier group is sorted by load and then within equal capacities, so the directives
+    # never remove all the optimal solutions together
+
+    def __init__(self, m, n, l, s, D):
+        self.m = m
+        self.n = n
+        # a capacity above the total size of the items is never reached: those couriers are interchangeable
+        total = sum(s)
+        self.capacity = [min(l[i], total) for i in range(m)]
+        self.order = sorted(range(m), key=lambda i: (-self.capacity[i], i))
+        capacity = [self.capacity[i] for i in self.order]
+        self.interchangeable = [(p, p + 1) for p in range(m - 1) if capacity[p] == capacity[p + 1]]
+        self.dominated = [(p, p + 1) for p in range(m - 1) if capacity[p] > capacity[p + 1]]
+        self.identical_items = identical_items(n, s, D)
+
+    def couriers(self, pairs):
+        # canonical positions to the original indices of the couriers
+        return [(self.order[p], self.order[q]) for p, q in pairs]
+
+    def canonical(self, values):
+        # per-courier values in the canonical order
+        return [values[i] for i in self.order]
+
+    def invert(self, values):
+        # per-courier values given in the canonical order, back in the original order
+        original = list(values)
+        for p, i in enumerate(self.order):
+            original[i] = values[p]
+        return original
+
+    def canonical_solution(self, routes, s, key=min):
+        # a route set (items numbered from 1) moved to the couriers so that it follows the directives:
+        # identical items in index order, heavier routes on the bigger couriers and the routes of
+        # couriers with the same capacity sorted by key, the empty ones last
+        group = {}
+        for j, h in self.identical_items:
+            group[h + 1] = group.get(j + 1, j + 1)
+        routes = [list(route) for route in routes]
+        for route in routes:
+            for g in set(group.values()):
+                positions = [p for p, j in enumerate(route) if group.get(j, j) == g]
+                for p, j in zip(positions, sorted(route[p] for p in positions)):
+                    route[p] = j
+        routes.sort(key=lambda route: -sum(s[j - 1] for j in route))
+        canonical = []
+        start = 0
+        for end in range(1, self.m + 1):
+            if end == self.m or (end - 1, end) not in self.interchangeable:
+                canonical += sorted(routes[start:end], key=lambda route: key(route) if route else float("inf"))
+                start = end
+        return self.invert(canonical)
+
+
+def identical_items(n, s, D):
+    # items j and h are identical when swapping them leaves the sizes and the distances unchanged
+    D = np.array(D)
+    others = np.ones(n + 1, dtype=bool)
+    pairs = []
+    for j in range(n):
+        for h in range(j + 1, n):
+            if s[j] != s[h] or D[j][h] != D[h][j]:
+                continue
+            others[[j, h]] = False
+            if np.array_equal(D[j][others], D[h][others]) and np.array_equal(D[others, j], D[others, h]):
+                pairs.append((j, h))
+            others[[j, h]] = True
+    return pairs
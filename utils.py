@@ -1,3 +1,6 @@
+import multiprocessing
+import threading
+
 def assign_items(courier_capacity, available_items, S, D, depot_idx):
   
     sorted_items = sorted(available_items, key=lambda j: D[j][depot_idx], reverse=True)
@@ -59,3 +62,102 @@ def calculate_lower_bound(n, D):
     
     lower_bound = max(D[j][n] + D[n][j] for j in range(n))
     return lower_bound
+
+
+class SharedBound:
+    # best objective found so far by any engine of a portfolio, shared between processes
+
+    def __init__(self, upper_bound):
+        self.value = multiprocessing.Value('i', upper_bound)
+        self.proved = multiprocessing.Value('b', False)
+        # last value this process has acted on
+        self.seen = upper_bound
+
+    def get(self):
+        return self.value.value
+
+    def offer(self, obj):
+        # publish an incumbent, returns True if it improves the shared bound
+        self.seen = min(self.seen, obj)
+        with self.value.get_lock():
+            if obj < self.value.value:
+                self.value.value = obj
+                return True
+        return False
+
+    def consume(self):
+        # read the bound to act on it: the watcher of this process no longer interrupts for this value,
+        # a check already running under it would only be interrupted for nothing
+        value = self.get()
+        self.seen = min(self.seen, value)
+        return value
+
+    def prove(self):
+        # no solution better than the shared bound exists
+        self.proved.value = True
+
+    def is_proved(self):
+        return bool(self.proved.value)
+
+    def watch(self, callback, interval=0.5, guard=None):
+        # call callback from a background thread whenever another engine improves the bound, only
+        # while guard runs a check when one is given; returns an event that stops the watcher when set
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                value = self.get()
+                if value < self.seen and (guard is None or guard.interrupt(callback)):
+                    self.seen = value
+
+        threading.Thread(target=run, daemon=True).start()
+        return stop
+
+
+class CheckGuard:
+    # lets the watcher of a SharedBound interrupt z3 only during a check: an interrupt landing in the
+    # evaluation of the model after it would cancel the evaluation instead
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = False
+        self.interrupted = False
+
+    def check(self, solver, *assumptions):
+        with self.lock:
+            self.running = True
+            self.interrupted = False
+        try:
+            return solver.check(*assumptions)
+        finally:
+            with self.lock:
+                self.running = False
+                if self.interrupted:
+                    # the interrupt may have come once the check was over in z3 and still be pending,
+                    # it would cancel the next push or evaluation: an empty check consumes it
+                    from z3 import Solver
+                    Solver(ctx=solver.ctx).check()
+
+    def interrupt(self, callback):
+        # calls callback if a check is running, returns whether it did
+        with self.lock:
+            if self.running:
+                callback()
+                self.interrupted = True
+                return True
+        return False
+
+
+# the checks on main_ctx() of the calling process, which the bound watchers may interrupt
+z3_checks = CheckGuard()
+
+
+def set_z3_threads(threads):
+    # z3 parallel mode for the calling process: the SAT and the SMT core run up to `threads` threads
+    if threads is None or threads <= 1:
+        return
+    from z3 import set_param
+    set_param("parallel.enable", True)
+    set_param("parallel.threads.max", threads)
+    set_param("sat.threads", threads)
+    set_param("smt.threads", threads)